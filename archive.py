@@ -0,0 +1,19 @@
+# archive.py
+# 古いイベントをアーカイブテーブルへ移す（cron / 手動実行用）
+#
+#   python archive.py                # ARCHIVE_AFTER_DAYS 日より前を移す
+#   python archive.py --days 365     # 1 年より前を移す
+import argparse
+
+from main import create_app
+from archive_engine import archive_events, cutoff_date
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="古いイベントのアーカイブ")
+    p.add_argument("--days", type=int, help="何日より前をアーカイブするか（既定は ARCHIVE_AFTER_DAYS）")
+    p.add_argument("--batch-size", type=int, help="1 トランザクションで移す候補数")
+    args = p.parse_args()
+
+    app = create_app(start_workers=False)
+    with app.app_context():
+        print(archive_events(cutoff_date(days=args.days), batch_size=args.batch_size))
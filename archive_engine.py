@@ -0,0 +1,160 @@
+# archive_engine.py
+# 古いイベントを archived_candidates / archived_attendance に移す
+#
+# - ARCHIVE_AFTER_DAYS 日より前の候補日（確定・出欠・リマインド記録ごと）が対象
+# - ARCHIVE_BATCH_SIZE 件ずつ INSERT ... SELECT でコピーしてから元の行を消し、バッチごとに commit
+# - 稼働テーブルの行数が増え続けないので /confirm, /register, リマインドのコストが一定に保たれる
+# - Postgres では advisory lock で同時実行を 1 つに制限する
+# - 実行結果と所要時間を cron_logs に残す
+# 移した日程は /history（read_history）で読み取り専用で見られる
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, select
+
+from models import (
+    db, Candidate, Confirmed, Attendance, Availability, ReminderLog,
+    ArchivedCandidate, ArchivedAttendance,
+)
+from reminder_engine import LOCAL_TZ
+from cron_run import try_lock, write_cron_log
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_LOCK_KEY = 820_002
+
+HISTORY_PER_PAGE = 20
+
+
+def cutoff_date(today=None, days=None):
+    today = today or datetime.now(LOCAL_TZ).date()
+    return today - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def _archive_batch(candidate_ids, now):
+    """candidate_ids の候補を関連行ごとアーカイブテーブルへ移す（commit は呼び出し側）"""
+    event_ids = select(Confirmed.id).where(Confirmed.candidate_id.in_(candidate_ids))
+
+    c = Candidate.__table__
+    cnf = Confirmed.__table__
+    db.session.execute(
+        insert(ArchivedCandidate.__table__).from_select(
+            ["id", "year", "month", "day", "gym", "start", "end", "event_date", "starts_at",
+             "ends_at", "sequence", "created_at", "updated_at", "confirmed_id", "confirmed_at",
+             "archived_at"],
+            select(c.c.id, c.c.year, c.c.month, c.c.day, c.c.gym, c.c.start, c.c.end,
+                   c.c.event_date, c.c.starts_at, c.c.ends_at, c.c.sequence, c.c.created_at,
+                   c.c.updated_at, cnf.c.id, cnf.c.created_at, literal(now))
+            .select_from(c.outerjoin(cnf, cnf.c.candidate_id == c.c.id))
+            .where(c.c.id.in_(candidate_ids)),
+        )
+    )
+    a = Attendance.__table__
+    moved_attendance = db.session.execute(
+        insert(ArchivedAttendance.__table__).from_select(
+            ["id", "event_id", "name", "status", "created_at", "archived_at"],
+            select(a.c.id, a.c.event_id, a.c.name, a.c.status, a.c.created_at, literal(now))
+            .where(a.c.event_id.in_(event_ids)),
+        )
+    ).rowcount
+
+    # 外部キーの子から順に消す（ORM の一括削除なので data_version も上がる）
+    db.session.execute(delete(ReminderLog).where(ReminderLog.event_id.in_(event_ids)))
+    db.session.execute(delete(Attendance).where(Attendance.event_id.in_(event_ids)))
+    db.session.execute(delete(Confirmed).where(Confirmed.candidate_id.in_(candidate_ids)))
+    db.session.execute(delete(Availability).where(Availability.candidate_id.in_(candidate_ids)))
+    db.session.execute(delete(Candidate).where(Candidate.id.in_(candidate_ids)))
+    return moved_attendance
+
+
+def archive_events(cutoff=None, batch_size=None, max_batches=None):
+    """
+    cutoff より前の候補日をアーカイブする。結果の dict を返す
+    max_batches を指定するとそのバッチ数で打ち切る（HTTP から呼ぶとき用）
+    """
+    started = time.perf_counter()
+    cutoff = cutoff or cutoff_date()
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    result = {"status": "success", "cutoff": cutoff.isoformat(), "candidates": 0,
+              "attendance": 0, "batches": 0, "remaining": False}
+
+    try:
+        while max_batches is None or result["batches"] < max_batches:
+            if not try_lock(ARCHIVE_LOCK_KEY):
+                # 途中のバッチまで移していたら、移した件数を残して partial にする
+                result["status"] = "partial" if result["batches"] else "skipped"
+                result["remaining"] = bool(result["batches"])
+                result["message"] = "another archive run is in progress"
+                if result["batches"]:
+                    result["message"] = (
+                        f"archived candidates={result['candidates']} attendance={result['attendance']} "
+                        f"before {cutoff}, then stopped: {result['message']}"
+                    )
+                db.session.rollback()
+                break
+            ids = [cid for (cid,) in db.session.query(Candidate.id)
+                   .filter(Candidate.event_date < cutoff)
+                   .order_by(Candidate.event_date.asc(), Candidate.id.asc())
+                   .limit(batch_size)]
+            if not ids:
+                db.session.rollback()
+                break
+            result["attendance"] += _archive_batch(ids, datetime.utcnow())
+            result["candidates"] += len(ids)
+            result["batches"] += 1
+            # バッチごとに確定してロック・トランザクションを短く保つ
+            db.session.commit()
+            if len(ids) < batch_size:
+                break
+        else:
+            result["remaining"] = db.session.query(Candidate.id).filter(
+                Candidate.event_date < cutoff
+            ).first() is not None
+
+        result.setdefault(
+            "message",
+            f"archived candidates={result['candidates']} attendance={result['attendance']} before {cutoff}",
+        )
+        write_cron_log(result, started, "archive")
+        db.session.commit()
+        return result
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("archive run failed")
+        result = {"status": "failed", "message": str(e)}
+        write_cron_log(result, started, "archive")
+        db.session.commit()
+        raise
+
+
+def read_history(page=1, per_page=HISTORY_PER_PAGE):
+    """
+    アーカイブ済みの確定イベントを新しい順に 1 ページ分返す
+    returns: (events, has_next)  events = [(ArchivedCandidate, {"attend": [...], "absent": [...]}), ...]
+    件数の COUNT はせず、1 件多く読んで次ページの有無を判定する
+    """
+    rows = (
+        ArchivedCandidate.query
+        .filter(ArchivedCandidate.confirmed_id.isnot(None))
+        .order_by(ArchivedCandidate.event_date.desc(), ArchivedCandidate.starts_at.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+        .all()
+    )
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    members = {c.confirmed_id: {"attend": [], "absent": []} for c in rows}
+    if members:
+        for event_id, name, status in (
+            db.session.query(ArchivedAttendance.event_id, ArchivedAttendance.name, ArchivedAttendance.status)
+            .filter(ArchivedAttendance.event_id.in_(list(members)))
+            .order_by(ArchivedAttendance.id.asc())
+        ):
+            if status in ("attend", "absent"):
+                members[event_id][status].append(name)
+    return [(c, members[c.confirmed_id]) for c in rows], has_next
@@ -0,0 +1,107 @@
+# assets.py
+# ハッシュ入りの静的ファイル（build_assets.py が static/dist/ に作る）の配信と、HTML の gzip 圧縮
+#
+# - テンプレートでは url_for('static', ...) の代わりに asset_url('css/base.css') を使う
+#   manifest にあれば /assets/css/base.<hash>.css、無ければ（ビルド前の開発環境）通常の /static/ の URL
+# - /assets/ は内容が変われば名前も変わるので Cache-Control: public, max-age=1 年, immutable
+#   Accept-Encoding を見て、ビルド時に作った .br / .gz をそのまま返す（リクエストごとに圧縮しない）
+# - HTML のレスポンスは、クライアントが gzip を受け付ければ after_request で圧縮する
+#   ETag は弱い ETag にする（圧縮前後で同じ値を使うため）。304 の判定は弱い比較なのでそのまま通る
+import gzip
+import json
+import logging
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory, url_for
+
+from build_assets import DIST_NAME, MANIFEST_NAME
+
+logger = logging.getLogger(__name__)
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+HTML_GZIP_MIN_BYTES = int(os.environ.get("HTML_GZIP_MIN_BYTES", 500))
+HTML_GZIP_LEVEL = 6
+# 優先順（どちらも受け付けるなら小さい br）
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {"files": {}, "encodings": {}}
+
+
+def load_manifest(static_dir):
+    path = os.path.join(static_dir, DIST_NAME, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.info("asset manifest not found (%s); serving /static/ as is", path)
+        return {"files": {}, "encodings": {}}
+
+
+def asset_url(filename):
+    """テンプレート用。ハッシュ入りの URL（ビルドしていなければ /static/ の URL）を返す"""
+    name = _manifest["files"].get(filename)
+    if name is None:
+        return url_for("static", filename=filename)
+    return url_for("asset", filename=name)
+
+
+def negotiate(name):
+    """用意してある圧縮形式のうち、クライアントが受け付ける最初のものを (encoding, suffix) で返す"""
+    available = _manifest["encodings"].get(name, ())
+    for encoding, suffix in ENCODING_SUFFIXES:
+        if encoding in available and request.accept_encodings[encoding]:
+            return encoding, suffix
+    return None, ""
+
+
+def gzip_html(resp):
+    """HTML を gzip する（ストリーミング・圧縮済み・小さいもの・304 などはそのまま）"""
+    if (
+        resp.status_code != 200
+        or resp.mimetype != "text/html"
+        or resp.direct_passthrough
+        or resp.is_streamed
+        or "Content-Encoding" in resp.headers
+    ):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return resp
+    body = resp.get_data()
+    if len(body) < HTML_GZIP_MIN_BYTES:
+        return resp
+    etag, weak = resp.get_etag()
+    resp.set_data(gzip.compress(body, compresslevel=HTML_GZIP_LEVEL))
+    resp.headers["Content-Encoding"] = "gzip"
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
+def init_app(app):
+    global _manifest
+    _manifest = load_manifest(app.static_folder)
+    dist_dir = os.path.join(app.static_folder, DIST_NAME)
+    served = set(_manifest["files"].values())
+
+    app.add_template_global(asset_url)
+
+    @app.route("/assets/<path:filename>", endpoint="asset")
+    def asset(filename):
+        if filename not in served:
+            abort(404)
+        encoding, suffix = negotiate(filename)
+        resp = send_from_directory(
+            dist_dir, filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            max_age=ASSET_MAX_AGE,
+        )
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        resp.vary.add("Accept-Encoding")
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        return resp
+
+    app.after_request(gzip_html)
@@ -0,0 +1,173 @@
+# attendance_service.py
+# 出欠集計まわりの共通処理（/confirm, /register, /manage_event で共用）
+# イベント数に関係なく一定回数のクエリで集計する
+# 確定・出欠の登録は INSERT ... ON CONFLICT で行う（同時送信でも重複しない）
+# 出欠は統計（member_stats）のために変更前の status も要るので、ON CONFLICT DO UPDATE の 1 文ではなく
+# 「DO NOTHING の INSERT」と「既存行の FOR UPDATE + UPDATE」に分ける（理由は upsert_attendance_many）
+from datetime import datetime
+
+from sqlalchemy import case, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Confirmed, Attendance
+
+
+# 画面・LINE から来る出欠の表記 -> DB 上の値（attend / absent / pending）
+STATUS_ALIASES = {
+    "attend": "attend", "attending": "attend", "参加": "attend",
+    "absent": "absent", "不参加": "absent", "欠席": "absent",
+    "pending": "pending", "未定": "pending", "未回答": "pending",
+}
+
+
+def normalize_status(raw, default="pending"):
+    """出欠の入力値を attend / absent / pending に揃える。知らない値は default"""
+    return STATUS_ALIASES.get((raw or "").strip(), default)
+
+
+def empty_summary():
+    return {
+        "attend_count": 0,
+        "absent_count": 0,
+        "attend_members": [],
+        "absent_members": [],
+    }
+
+
+def confirmed_id_map(candidate_ids=None):
+    """
+    candidate_id -> confirmed_id の dict を 1 クエリで返す
+    candidate_ids を渡した場合はその候補だけに絞る
+    """
+    q = db.session.query(Confirmed.candidate_id, Confirmed.id)
+    if candidate_ids is not None:
+        candidate_ids = list(candidate_ids)
+        if not candidate_ids:
+            return {}
+        q = q.filter(Confirmed.candidate_id.in_(candidate_ids))
+    return {candidate_id: confirmed_id for candidate_id, confirmed_id in q.all()}
+
+
+def build_attendance_summary(event_ids):
+    """
+    event_id -> {attend_count, absent_count, attend_members, absent_members}
+    出欠が 1 件もないイベントも空の集計で必ずキーを持たせる（テンプレで直接参照するため）
+    """
+    event_ids = list(event_ids)
+    summary = {event_id: empty_summary() for event_id in event_ids}
+    if not event_ids:
+        return summary
+
+    rows = (
+        db.session.query(Attendance.event_id, Attendance.name, Attendance.status)
+        .filter(Attendance.event_id.in_(event_ids))
+        .order_by(Attendance.event_id.asc(), Attendance.id.asc())
+        .all()
+    )
+    for event_id, name, status in rows:
+        s = summary[event_id]
+        if status == "attend":
+            s["attend_members"].append(name)
+        elif status == "absent":
+            s["absent_members"].append(name)
+
+    for s in summary.values():
+        s["attend_count"] = len(s["attend_members"])
+        s["absent_count"] = len(s["absent_members"])
+    return summary
+
+
+def dialect_insert(model):
+    """ON CONFLICT が使える insert() を DB に合わせて返す"""
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"upsert is not supported on {dialect}")
+
+
+def upsert_confirmed(candidate_id):
+    """
+    候補を確定にして confirmed.id を返す（既に確定済みならその id）
+    uq_confirmed_candidate_id に対する 1 文の upsert。commit は呼び出し側
+    """
+    stmt = dialect_insert(Confirmed).values(candidate_id=candidate_id, created_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Confirmed.candidate_id],
+        # 既存行でも RETURNING で id を返すため、値を変えない UPDATE にする
+        set_={"candidate_id": stmt.excluded.candidate_id},
+    ).returning(Confirmed.id)
+    return db.session.execute(stmt).scalar_one()
+
+
+def insert_confirmed(candidate_id):
+    """
+    候補を確定にして新しい confirmed.id を返す。既に確定済みなら None（何もしない）
+    uq_confirmed_candidate_id に対する ON CONFLICT DO NOTHING の 1 文。commit は呼び出し側
+    """
+    stmt = (
+        dialect_insert(Confirmed).values(candidate_id=candidate_id, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[Confirmed.candidate_id])
+        .returning(Confirmed.id)
+    )
+    return db.session.execute(stmt).scalar()
+
+
+def upsert_attendance(event_id, name, status):
+    """
+    (event_id, name) の出欠を登録・更新し、変更前の status を返す（新規なら None）
+    commit は呼び出し側
+    """
+    return upsert_attendance_many([{"event_id": event_id, "name": name, "status": status}])[(event_id, name)]
+
+
+def upsert_attendance_many(rows):
+    """
+    rows: [{"event_id", "name", "status"}, ...] をまとめて登録・更新し、
+    {(event_id, name): 変更前の status（新規なら None）} を返す
+    同じ (event_id, name) が複数あれば後のものを使う
+
+    新規は ON CONFLICT DO NOTHING RETURNING の 1 文で入れ、入らなかった（既にある）行は
+    FOR UPDATE でロックしてから読んで 1 文で更新する。変更前の値は書き込みと同じロックの下で
+    決まるので、同時に送信されても統計（member_stats）の増減を二重に数えない
+
+    文の数は 新規 1・同じ値の再送信 2・値の変更 3。ON CONFLICT DO UPDATE ... RETURNING の 1 文に
+    できないのは、RETURNING が返すのは更新後の行だけで、変更前の値を CTE やサブクエリで読むと
+    文の開始時点のスナップショットになるため。READ COMMITTED では、その後に他のトランザクションが
+    入れた・変えた行を DO UPDATE が上書きしても古い値（新規なら None）が返り、統計がずれる
+    （xmax = 0 で分かるのは新規かどうかだけで、変更前の値は分からない）
+    """
+    latest = {(r["event_id"], r["name"]): r["status"] for r in rows}
+    if not latest:
+        return {}
+    now = datetime.utcnow()
+    inserted = db.session.execute(
+        dialect_insert(Attendance).values([
+            {"event_id": event_id, "name": name, "status": status, "created_at": now}
+            for (event_id, name), status in latest.items()
+        ])
+        .on_conflict_do_nothing(index_elements=[Attendance.event_id, Attendance.name])
+        .returning(Attendance.event_id, Attendance.name)
+    ).all()
+    before = {(event_id, name): None for event_id, name in inserted}
+
+    existing = [key for key in latest if key not in before]
+    if existing:
+        changes = {}
+        for att_id, event_id, name, status in db.session.execute(
+            select(Attendance.id, Attendance.event_id, Attendance.name, Attendance.status)
+            .where(tuple_(Attendance.event_id, Attendance.name).in_(existing))
+            .with_for_update()
+        ):
+            before[(event_id, name)] = status
+            if status != latest[(event_id, name)]:
+                changes[att_id] = latest[(event_id, name)]
+        if changes:
+            db.session.execute(
+                update(Attendance)
+                .where(Attendance.id.in_(list(changes)))
+                .values(status=case(changes, value=Attendance.id))
+                .execution_options(synchronize_session=False)
+            )
+    return before
@@ -0,0 +1,153 @@
+# availability.py
+# メンバーの「行ける / 行けない」から未確定の候補日を順位付けし、確定候補の組み合わせを提案する
+#
+# - 参加可能なメンバーは候補ごとに 1 つの int のビット集合（メンバー i が行けるなら bit i が立つ）
+#   人数は int.bit_count() で数えるので、5000 候補 × 64 人の順位付けと提案でも十数ミリ秒（benchmark.py）
+# - スコア = 参加可能人数 - 集合時間（MEETING_OFFSET_MINUTES）/ AVAILABILITY_TRAVEL_MINUTES_PER_MEMBER
+#   （体育館が遠いほど 1 人分ずつ割り引く）
+# - 提案は「時間が重ならない候補の組み合わせのうちスコア合計が最大のもの」
+#   集合時刻〜終了時刻を区間として、終了順ソート + bisect の重み付き区間スケジューリングで求める
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta
+import os
+
+from models import db, Availability
+from attendance_service import dialect_insert
+from reminder_engine import MEETING_OFFSET_MINUTES
+
+AVAILABILITY_TRAVEL_MINUTES_PER_MEMBER = float(os.environ.get("AVAILABILITY_TRAVEL_MINUTES_PER_MEMBER", 60))
+DEFAULT_MEETING_OFFSET = 30  # reminder_engine と同じ既定値
+
+# mask: 参加可能なメンバーのビット集合、score: make_slot で 1 回だけ計算したスコア
+Slot = namedtuple("Slot", "candidate_id gym meets_at ends_at mask score")
+
+
+def meeting_offset(gym):
+    return MEETING_OFFSET_MINUTES.get(gym, DEFAULT_MEETING_OFFSET)
+
+
+def make_slot(candidate_id, gym, starts_at, ends_at, mask):
+    """集合時刻（開始 - 集合時間）から終了までを 1 つの区間にする"""
+    offset = meeting_offset(gym)
+    score = mask.bit_count() - offset / AVAILABILITY_TRAVEL_MINUTES_PER_MEMBER
+    return Slot(candidate_id, gym, starts_at - timedelta(minutes=offset), ends_at, mask, score)
+
+
+def rank(slots):
+    """スコアの高い順（同点なら早い順）"""
+    return sorted(slots, key=lambda s: (-s.score, s.meets_at))
+
+
+def overlaps(a, b):
+    return a.meets_at < b.ends_at and b.meets_at < a.ends_at
+
+
+def best_schedule(slots, fixed=()):
+    """
+    時間が重ならず、スコア合計が最大になる候補の組み合わせを開始順で返す
+    fixed: 既に確定している区間（これと重なる候補は選ばない）
+    """
+    fixed = list(fixed)
+    usable = sorted(
+        (s for s in slots if s.score > 0 and not any(overlaps(s, f) for f in fixed)),
+        key=lambda s: s.ends_at,
+    )
+    ends = [s.ends_at for s in usable]
+
+    # total[i]: usable[:i] から選んだときのスコア合計の最大
+    # took[i]: そのとき usable[i - 1] を選んだか、prev[i]: 選んだ場合に残りを選ぶ範囲 usable[:prev[i]]
+    total = [0.0] * (len(usable) + 1)
+    took = [False] * (len(usable) + 1)
+    prev = [0] * (len(usable) + 1)
+    for i, s in enumerate(usable):
+        j = bisect_right(ends, s.meets_at, 0, i)  # s の集合時刻までに終わる候補の数
+        if total[j] + s.score > total[i]:
+            total[i + 1], took[i + 1], prev[i + 1] = total[j] + s.score, True, j
+        else:
+            total[i + 1], prev[i + 1] = total[i], i
+
+    chosen = []
+    i = len(usable)
+    while i > 0:
+        if took[i]:
+            chosen.append(usable[i - 1])
+        i = prev[i]
+    return chosen[::-1]
+
+
+# ------------------------------
+# DB とのやり取り
+# ------------------------------
+def load_masks(candidate_ids):
+    """
+    candidate_ids の参加可能メンバーを 1 クエリで読み、({candidate_id: mask}, members) を返す
+    members[i] が bit i のメンバー名
+    """
+    masks = {cid: 0 for cid in candidate_ids}
+    members = []
+    index = {}
+    if not masks:
+        return masks, members
+    for cid, name in (
+        db.session.query(Availability.candidate_id, Availability.name)
+        .filter(Availability.candidate_id.in_(list(masks)), Availability.available.is_(True))
+        .order_by(Availability.id.asc())
+    ):
+        if name not in index:
+            index[name] = len(members)
+            members.append(name)
+        masks[cid] |= 1 << index[name]
+    return masks, members
+
+
+def member_names(mask, members):
+    return [name for i, name in enumerate(members) if mask >> i & 1]
+
+
+def build_ranking(open_candidates, confirmed_candidates=()):
+    """
+    /confirm 用：未確定候補の順位と提案を作る
+    open_candidates / confirmed_candidates は starts_at/ends_at が埋まった Candidate
+    returns: {"ranking": [{candidate_id, score, available_count, available_members, suggested}, ...],
+              "suggested_ids": [...]}
+    """
+    timed = [c for c in open_candidates if c.starts_at and c.ends_at]
+    masks, members = load_masks([c.id for c in timed])
+    slots = [make_slot(c.id, c.gym, c.starts_at, c.ends_at, masks[c.id]) for c in timed]
+    fixed = [make_slot(c.id, c.gym, c.starts_at, c.ends_at, 0)
+             for c in confirmed_candidates if c.starts_at and c.ends_at]
+    suggested_ids = [s.candidate_id for s in best_schedule(slots, fixed)]
+    suggested = set(suggested_ids)
+    return {
+        "ranking": [
+            {
+                "candidate_id": s.candidate_id,
+                "score": round(s.score, 2),
+                "available_count": s.mask.bit_count(),
+                "available_members": member_names(s.mask, members),
+                "meeting_offset": meeting_offset(s.gym),
+                "suggested": s.candidate_id in suggested,
+            }
+            for s in rank(slots)
+        ],
+        "suggested_ids": suggested_ids,
+    }
+
+
+def save_availability(name, choices):
+    """
+    choices: {candidate_id: bool} を 1 文の upsert で保存する（commit は呼び出し側）
+    """
+    if not choices:
+        return
+    now = datetime.utcnow()
+    stmt = dialect_insert(Availability).values([
+        {"candidate_id": cid, "name": name, "available": bool(ok), "updated_at": now}
+        for cid, ok in choices.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Availability.candidate_id, Availability.name],
+        set_={"available": stmt.excluded.available, "updated_at": stmt.excluded.updated_at},
+    )
+    db.session.execute(stmt)
@@ -0,0 +1,309 @@
+# benchmark.py
+# 主要画面のベンチマーク（レイテンシのパーセンタイルと SQL 発行数）
+#
+#   python benchmark.py                          # 一時 SQLite に既定量を投入して計測
+#   python benchmark.py --years 5 --output bench.json
+#   BENCH_DATABASE_URL=postgresql://... python benchmark.py   # 使い捨ての Postgres で計測
+#
+# LINE / SendGrid には一切送信しない（ディスパッチャを起動せず、送信関数も差し替える）。
+# 各画面の SQL 発行数が QUERY_BUDGETS を超えたら終了コード 1 を返す。
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timedelta
+
+# 画面ごとの SQL 発行数の上限（キャッシュなしで描画したとき）
+QUERY_BUDGETS = {
+    "/confirm": 5,  # 未確定候補の参加可能メンバー（availabilities）の読み込みで +1
+    "/register": 4,
+    "/confirm/month/<y>/<m>": 4,
+    "/register/month/<y>/<m>": 3,
+    "/manage_event/<id>": 5,
+    "/register/event/<id>": 4,
+    # 出欠の登録は新規 1 文・既存行の変更 3 文（attendance_service.upsert_attendance_many）
+    # 参加かつメール宛先ありなら outbox と email_deliveries の INSERT が増える
+    # 統計（member_stats.py）で 件数の upsert・連続参加の行の作成・ロックして読み込み・書き込み・数え直し の最大 +5
+    "POST /register/event/<id>": 12,
+    "/cron_reminder": 3,
+    "reminder_run": 6,
+}
+
+GYMS = ["中平井", "平井", "西小岩", "北小岩", "南小岩"]
+MEMBERS = ["松村", "山火", "山根", "奥迫", "川崎"]
+STATUSES = ["attend", "absent", "pending"]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="主要画面のベンチマーク")
+    p.add_argument("--years", type=int, default=5, help="過去何年分の候補日を作るか")
+    p.add_argument("--per-week", type=int, default=5, help="1 週間あたりの候補日数")
+    p.add_argument("--confirm-ratio", type=float, default=0.6, help="確定にする候補の割合")
+    p.add_argument("--extra-members", type=int, default=5, help="実メンバーに加える架空メンバー数")
+    p.add_argument("--iterations", type=int, default=30, help="画面ごとの計測回数")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--output", help="結果 JSON の出力先（省略時は標準出力）")
+    return p.parse_args()
+
+
+def setup_environment():
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        path = os.path.join(tempfile.mkdtemp(prefix="event-app-bench-"), "bench.db")
+        url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = url
+    os.environ["OUTBOX_DISPATCHER"] = "off"
+    return url
+
+
+def seed(args):
+    """候補・確定・出欠・参加可否を一括 INSERT で投入する"""
+    from sqlalchemy import insert
+    from models import db, Candidate, Confirmed, Attendance, Availability, schedule_columns
+    import member_stats
+
+    from reminder_engine import LOCAL_TZ
+
+    rnd = random.Random(args.seed)
+    members = MEMBERS + [f"member{i}" for i in range(args.extra_members)]
+    today = datetime.now(LOCAL_TZ).date()
+    start = today - timedelta(days=365 * args.years)
+    end = today + timedelta(days=90)
+
+    rows = []
+    d = start
+    while d <= end:
+        for _ in range(args.per_week):
+            day = d + timedelta(days=rnd.randrange(7))
+            h = rnd.choice([18, 19, 20])
+            s, e = f"{h:02d}:00", f"{h + 2:02d}:00"
+            event_date, starts_at, ends_at = schedule_columns(day.year, day.month, day.day, s, e)
+            rows.append({
+                "year": day.year, "month": day.month, "day": day.day,
+                "gym": rnd.choice(GYMS), "start": s, "end": e,
+                "event_date": event_date, "starts_at": starts_at, "ends_at": ends_at,
+                "sequence": 0, "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+            })
+        d += timedelta(days=7)
+    # リマインド対象日（明日・7 日後）にも必ずイベントを置く
+    for offset in (1, 7):
+        day = today + timedelta(days=offset)
+        event_date, starts_at, ends_at = schedule_columns(day.year, day.month, day.day, "19:00", "21:00")
+        rows.append({
+            "year": day.year, "month": day.month, "day": day.day, "gym": "平井",
+            "start": "19:00", "end": "21:00", "event_date": event_date,
+            "starts_at": starts_at, "ends_at": ends_at, "sequence": 0,
+            "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+        })
+    db.session.execute(insert(Candidate), rows)
+    db.session.commit()
+
+    candidate_ids = [cid for (cid,) in db.session.query(Candidate.id)]
+    reminder_ids = candidate_ids[-2:]
+    confirmed_candidates = set(rnd.sample(candidate_ids, int(len(candidate_ids) * args.confirm_ratio)))
+    confirmed_candidates.update(reminder_ids)
+    db.session.execute(insert(Confirmed), [
+        {"candidate_id": cid, "created_at": datetime.utcnow()} for cid in sorted(confirmed_candidates)
+    ])
+    db.session.commit()
+
+    event_ids = [eid for (eid,) in db.session.query(Confirmed.id)]
+    att_rows = []
+    for eid in event_ids:
+        for name in rnd.sample(members, rnd.randint(len(members) // 2, len(members))):
+            att_rows.append({"event_id": eid, "name": name, "status": rnd.choice(STATUSES),
+                             "created_at": datetime.utcnow()})
+    for i in range(0, len(att_rows), 5000):
+        db.session.execute(insert(Attendance), att_rows[i:i + 5000])
+    db.session.commit()
+
+    avail_rows = [
+        {"candidate_id": cid, "name": name, "available": rnd.random() < 0.6, "updated_at": datetime.utcnow()}
+        for cid in candidate_ids if cid not in confirmed_candidates
+        for name in members
+    ]
+    for i in range(0, len(avail_rows), 5000):
+        db.session.execute(insert(Availability), avail_rows[i:i + 5000])
+    db.session.commit()
+
+    # 本番と同じく統計は作り直し済みの状態から測る
+    member_stats.rebuild()
+
+    return {
+        "candidates": len(candidate_ids),
+        "confirmed": len(event_ids),
+        "attendance": len(att_rows),
+        "availabilities": len(avail_rows),
+        "sample_event_id": event_ids[len(event_ids) // 2],
+        "sample_candidate_id": sorted(confirmed_candidates)[len(confirmed_candidates) // 2],
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def measure(name, fn, iterations, counter, before=None):
+    latencies, statements = [], []
+    for _ in range(iterations):
+        if before:
+            before()
+        counter["n"] = 0
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+        statements.append(counter["n"])
+    budget = QUERY_BUDGETS.get(name)
+    worst = max(statements)
+    return {
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "statements": worst,
+        "budget": budget,
+        "within_budget": budget is None or worst <= budget,
+    }
+
+
+def availability_scoring(slots=5000, members=64, seed=1):
+    """DB を使わずに順位付けと提案だけを測る（数千候補 × 数十人）"""
+    import availability
+
+    rnd = random.Random(seed)
+    base = datetime(2030, 1, 1)
+    data = []
+    for i in range(slots):
+        starts_at = base + timedelta(days=i // 4, hours=rnd.choice([18, 19, 20]))
+        data.append(availability.make_slot(i, rnd.choice(GYMS), starts_at, starts_at + timedelta(hours=2),
+                                           rnd.getrandbits(members)))
+
+    def run():
+        availability.rank(data)
+        availability.best_schedule(data)
+    return run
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    url = setup_environment()
+
+    from sqlalchemy import event
+    import main as app_module
+    import notifications
+    import render_cache
+    import reminder_engine
+    import data_version
+    from models import db, ReminderLog, NotificationOutbox
+
+    # 外部送信は行わない
+    notifications.send_line_message = lambda text: None
+    notifications.send_ics_via_sendgrid = lambda *a, **k: None
+
+    app = app_module.create_app(start_workers=False)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        data_version.ensure()
+        seeded = seed(args)
+
+        counter = {"n": 0}
+        main_thread = threading.get_ident()
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _count(*_):
+            # /cron_reminder の裏で動くジョブの SQL は数えない（受け付け処理だけを測る）
+            if threading.get_ident() == main_thread:
+                counter["n"] += 1
+
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_name"] = MEMBERS[0]
+
+    def get(path):
+        def run():
+            r = client.get(path)
+            assert r.status_code == 200, (path, r.status_code)
+        return run
+
+    def cold():
+        # 描画キャッシュを捨てて、毎回実際に描画したときのコストを測る
+        render_cache._cache.clear()
+
+    def post_register():
+        r = client.post(f"/register/event/{seeded['sample_candidate_id']}",
+                        data={"name": MEMBERS[0], "status": "参加"})
+        assert r.status_code == 302, r.status_code
+
+    def post_cron():
+        r = client.post("/cron_reminder")
+        assert r.status_code == 202, r.status_code
+
+    def reset_reminders():
+        with app.app_context():
+            ReminderLog.query.delete()
+            NotificationOutbox.query.delete()
+            db.session.commit()
+
+    def run_reminders():
+        with app.app_context():
+            reminder_engine.run_reminders("http://localhost/set_name")
+
+    it = args.iterations
+    # タブ切り替えで取得する断片は翌月分を測る
+    next_month = (datetime.now(reminder_engine.LOCAL_TZ).date().replace(day=1) + timedelta(days=32))
+    month_path = f"{next_month.year}/{next_month.month}"
+    results = {
+        "/confirm": measure("/confirm", get("/confirm"), it, counter, before=cold),
+        "/register": measure("/register", get("/register"), it, counter, before=cold),
+        "/confirm/month/<y>/<m>": measure("/confirm/month/<y>/<m>", get(f"/confirm/month/{month_path}"), it, counter, before=cold),
+        "/register/month/<y>/<m>": measure("/register/month/<y>/<m>", get(f"/register/month/{month_path}"), it, counter, before=cold),
+        "/manage_event/<id>": measure("/manage_event/<id>", get(f"/manage_event/{seeded['sample_event_id']}"), it, counter),
+        "/register/event/<id>": measure("/register/event/<id>", get(f"/register/event/{seeded['sample_candidate_id']}"), it, counter),
+        "POST /register/event/<id>": measure("POST /register/event/<id>", post_register, it, counter),
+        "reminder_run": measure("reminder_run", run_reminders, it, counter, before=reset_reminders),
+        "/cron_reminder": measure("/cron_reminder", post_cron, it, counter),
+        "availability_rank_5000x64": measure("availability_rank_5000x64", availability_scoring(), it, counter),
+    }
+    reminder_engine._executor.shutdown(wait=True)
+
+    report = {
+        "commit": git_commit(),
+        "database": url.split(":", 1)[0],
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "volumes": {k: v for k, v in seeded.items() if not k.startswith("sample_")},
+        "iterations": it,
+        "results": results,
+    }
+    out = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+    over = [name for name, r in results.items() if not r["within_budget"]]
+    if over:
+        print(f"query budget exceeded: {', '.join(over)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# build_assets.py
+# static/ 以下の CSS / JS などを、内容のハッシュ入りの名前で static/dist/ に書き出す（デプロイ時に 1 回実行）
+#
+# - css/base.css -> dist/css/base.<sha256 先頭 10 桁>.css（内容が変われば名前も変わるので 1 年キャッシュできる）
+# - テキスト系は .gz（と Brotli パッケージがあれば .br）も作っておき、リクエストごとに圧縮しない
+# - dist/manifest.json に 元の名前 -> ハッシュ入りの名前 と、用意した圧縮形式を書く（assets.py が読む）
+# 使い方: python build_assets.py
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:  # 無ければ gzip だけ作る
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_NAME = "dist"
+MANIFEST_NAME = "manifest.json"
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+
+
+def source_files(static_dir):
+    """static_dir 以下のファイルを 'css/base.css' のような相対パスで返す（dist は除く）"""
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not (root == static_dir and d == DIST_NAME))
+        for f in sorted(files):
+            path = os.path.join(root, f)
+            yield os.path.relpath(path, static_dir).replace(os.sep, "/")
+
+
+def hashed_name(rel, data):
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def build(static_dir=STATIC_DIR):
+    """
+    dist を作り直して manifest を返す
+    manifest = {"files": {元の名前: ハッシュ入りの名前}, "encodings": {ハッシュ入りの名前: ["br", "gzip"]}}
+    """
+    dist_dir = os.path.join(static_dir, DIST_NAME)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {"files": {}, "encodings": {}}
+
+    for rel in source_files(static_dir):
+        with open(os.path.join(static_dir, rel), "rb") as f:
+            data = f.read()
+        name = hashed_name(rel, data)
+        out = os.path.join(dist_dir, name)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "wb") as f:
+            f.write(data)
+        manifest["files"][rel] = name
+
+        if os.path.splitext(rel)[1] not in COMPRESSIBLE:
+            continue
+        encodings = []
+        variants = [("gzip", ".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.insert(0, ("br", ".br", lambda d: brotli.compress(d, quality=11)))
+        for encoding, suffix, compress in variants:
+            packed = compress(data)
+            if len(packed) < len(data):  # 小さくならないなら元のファイルを返す
+                with open(out + suffix, "wb") as f:
+                    f.write(packed)
+                encodings.append(encoding)
+        if encodings:
+            manifest["encodings"][name] = encodings
+
+    os.makedirs(dist_dir, exist_ok=True)
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="静的ファイルにハッシュ入りの名前を付け、gzip / brotli 版を作る")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    args = parser.parse_args()
+    manifest = build(args.static_dir)
+    print(f"built {len(manifest['files'])} assets ({'gzip+br' if brotli else 'gzip'}) into "
+          f"{os.path.join(args.static_dir, DIST_NAME)}")
+
+
+if __name__ == "__main__":
+    main()
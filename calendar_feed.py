@@ -0,0 +1,146 @@
+# calendar_feed.py
+# 購読用カレンダー（/calendar/<member>.ics, /calendar/all.ics）の生成
+#
+# - UID は候補日ごとに固定（event_uid。参加登録メールの ICS と同じ）、SEQUENCE は候補日の変更回数
+# - 本文は data_version の世代番号が変わったときだけ作り直し、それまではプロセス内に保持
+# - ETag は本文の SHA-256（強い ETag）、Last-Modified は世代番号の更新時刻
+# 参加登録メールに添付する 1 イベント分の ICS（invite_ics_base64）もここで作る
+import base64
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+from models import db, Candidate, Confirmed, Attendance
+import data_version
+
+Feed = namedtuple("Feed", "version body etag last_modified")
+
+_lock = threading.Lock()
+_cache = {}  # key(member or None) -> Feed
+
+
+def esc(s):
+    s = s or ""
+    return s.replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
+
+
+def event_uid(candidate_id):
+    """
+    購読フィードとメールの ICS で共通の UID（同じ予定がカレンダーに 2 件並ばないように）
+    確定を取り消して付け直しても変わらないよう candidate_id から作る
+    """
+    return f"candidate-{candidate_id}@event-app.local"
+
+
+def utc_stamp(local_naive, tz):
+    return local_naive.replace(tzinfo=tz).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def query_events(member=None):
+    """確定イベントを日付順に返す。member 指定時はその人が「参加」のものだけ"""
+    q = (
+        db.session.query(Confirmed.id, Candidate)
+        .join(Candidate, Confirmed.candidate_id == Candidate.id)
+    )
+    if member:
+        q = q.join(Attendance, Attendance.event_id == Confirmed.id).filter(
+            Attendance.name == member, Attendance.status == "attend"
+        )
+    return q.order_by(Candidate.event_date.asc(), Candidate.starts_at.asc()).yield_per(200)
+
+
+def iter_vcalendar(events, calendar_name, tz):
+    yield (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//EventApp//JP\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        "METHOD:PUBLISH\r\n"
+        f"X-WR-CALNAME:{esc(calendar_name)}\r\n"
+    )
+    for _, c in events:
+        if not (c.starts_at and c.ends_at):
+            continue
+        stamp = (c.updated_at or c.created_at or datetime(2000, 1, 1)).strftime("%Y%m%dT%H%M%SZ")
+        yield (
+            "BEGIN:VEVENT\r\n"
+            f"UID:{event_uid(c.id)}\r\n"
+            f"SEQUENCE:{c.sequence or 0}\r\n"
+            f"DTSTAMP:{stamp}\r\n"
+            f"DTSTART:{utc_stamp(c.starts_at, tz)}\r\n"
+            f"DTEND:{utc_stamp(c.ends_at, tz)}\r\n"
+            f"SUMMARY:{esc(c.gym)} ({c.start}〜{c.end})\r\n"
+            f"LOCATION:{esc(c.gym)}\r\n"
+            "STATUS:CONFIRMED\r\n"
+            "END:VEVENT\r\n"
+        )
+    yield "END:VCALENDAR\r\n"
+
+
+def get_feed(member, tz):
+    """世代番号が同じならキャッシュ済みの Feed を返す（確認は 1 クエリ）"""
+    version, updated_at = data_version.current()
+    feed = _cache.get(member)
+    if feed and feed.version == version:
+        return feed
+
+    name = f"バド練習（{member}）" if member else "バド練習"
+    body = "".join(iter_vcalendar(query_events(member), name, tz)).encode("utf-8")
+    feed = Feed(
+        version=version,
+        body=body,
+        etag=hashlib.sha256(body).hexdigest(),
+        last_modified=(updated_at or datetime.utcnow()).replace(tzinfo=timezone.utc),
+    )
+    with _lock:
+        _cache[member] = feed
+    return feed
+
+
+# ------------------------------
+# 参加登録メールの添付 ICS（宛先によらず同じ内容）
+# ------------------------------
+INVITE_CACHE_SIZE = 256
+
+_invite_cache = OrderedDict()  # (candidate_id, sequence) -> base64 文字列
+
+
+def invite_ics(c, tz):
+    """
+    1 イベント分の ICS（iPhone 互換のため UTC 表記と METHOD:REQUEST）
+    UID は購読フィードと共通（event_uid）、SEQUENCE を上げて送れば既存の予定が更新される
+    """
+    stamp = (c.updated_at or c.created_at or datetime(2000, 1, 1)).strftime("%Y%m%dT%H%M%SZ")
+    return (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        "METHOD:REQUEST\r\n"
+        "PRODID:-//EventApp//JP\r\n"
+        "BEGIN:VEVENT\r\n"
+        f"UID:{event_uid(c.id)}\r\n"
+        f"SEQUENCE:{c.sequence or 0}\r\n"
+        f"DTSTAMP:{stamp}\r\n"
+        f"DTSTART:{utc_stamp(c.starts_at, tz)}\r\n"
+        f"DTEND:{utc_stamp(c.ends_at, tz)}\r\n"
+        f"SUMMARY:{esc(c.gym)} ({c.start}〜{c.end})\r\n"
+        f"LOCATION:{esc(c.gym)}\r\n"
+        "STATUS:CONFIRMED\r\n"
+        "END:VEVENT\r\n"
+        "END:VCALENDAR\r\n"
+    )
+
+
+def invite_ics_base64(c, tz):
+    """添付用に base64 にした ICS。候補が変わる（sequence が上がる）まで使い回す"""
+    key = (c.id, c.sequence or 0)
+    cached = _invite_cache.get(key)
+    if cached is not None:
+        return cached
+    encoded = base64.b64encode(invite_ics(c, tz).encode("utf-8")).decode()
+    with _lock:
+        _invite_cache[key] = encoded
+        while len(_invite_cache) > INVITE_CACHE_SIZE:
+            _invite_cache.popitem(last=False)
+    return encoded
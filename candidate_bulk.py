@@ -0,0 +1,179 @@
+# candidate_bulk.py
+# 候補日の一括作成（期間＋曜日＋体育館＋時間帯、または CSV 貼り付け）
+#
+# - 入力は先にすべて検証し、1 件でもエラーがあれば何も登録しない
+# - 既存の候補と完全に一致するもの（日付・体育館・開始・終了）はスキップ
+# - 同じ体育館・同じ日に時間が重なるもの（既存・入力内とも）は登録せずに報告する（overlap_index.py）
+# - 残りは 1 本の複数行 INSERT で登録する（ORM のイベントを通らないので日時の列はここで埋める）
+import os
+import csv
+import io
+import re
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert
+
+from models import db, Candidate, schedule_columns
+from overlap_index import DayIndex, Interval, day_indexes
+
+GYMS = ["中平井", "平井", "西小岩", "北小岩", "南小岩"]
+WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+
+# 1 回で作れる候補の上限（誤入力で大量に作らないため。検証は呼び出し側）
+BULK_MAX_ROWS = int(os.environ.get("BULK_CANDIDATE_MAX_ROWS", 500))
+
+_TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+
+def _parse_date(value):
+    """'2025-04-01' / '2025/4/1' -> date。不正なら None"""
+    parts = re.split(r"[-/]", (value or "").strip())
+    if len(parts) != 3:
+        return None
+    try:
+        return date(*map(int, parts))
+    except ValueError:
+        return None
+
+
+def _parse_time(value):
+    """'9:00' -> '09:00'（候補の start/end と同じ表記）。不正なら None"""
+    m = _TIME_RE.match((value or "").strip())
+    if not m:
+        return None
+    h, mi = int(m.group(1)), int(m.group(2))
+    if h > 23 or mi > 59:
+        return None
+    return f"{h:02d}:{mi:02d}"
+
+
+def _check_slot(gym, start, end, where):
+    errors = []
+    if gym not in GYMS:
+        errors.append(f"{where}体育館が不正です: {gym}")
+    if start is None or end is None:
+        errors.append(f"{where}時間は HH:MM で入力してください")
+    elif start >= end:
+        errors.append(f"{where}終了時間は開始時間より後にしてください")
+    return errors
+
+
+def parse_pattern(form):
+    """
+    期間＋曜日パターンから (date, gym, start, end) のリストを作る
+    form: start_date, end_date, weekday（複数, 0=月）, gym（複数）, start, end
+    戻り値は (specs, errors)
+    """
+    errors = []
+    first = _parse_date(form.get("start_date"))
+    last = _parse_date(form.get("end_date"))
+    if first is None or last is None:
+        errors.append("期間の日付が不正です")
+    elif first > last:
+        errors.append("期間の終了日は開始日以降にしてください")
+
+    try:
+        weekdays = {int(w) for w in form.getlist("weekday")}
+    except ValueError:
+        weekdays = set()
+    if not weekdays or not weekdays <= set(range(7)):
+        errors.append("曜日を 1 つ以上選んでください")
+
+    gyms = form.getlist("gym")
+    if not gyms:
+        errors.append("体育館を 1 つ以上選んでください")
+    errors.extend(f"体育館が不正です: {g}" for g in gyms if g not in GYMS)
+
+    start, end = _parse_time(form.get("start")), _parse_time(form.get("end"))
+    errors.extend(_check_slot(GYMS[0], start, end, ""))
+    if errors:
+        return [], errors
+
+    specs = []
+    d = first
+    while d <= last:
+        if d.weekday() in weekdays:
+            specs.extend((d, gym, start, end) for gym in gyms)
+        d += timedelta(days=1)
+    return specs, []
+
+
+def parse_csv(text):
+    """
+    CSV（日付,体育館,開始,終了）を (date, gym, start, end) のリストにする
+    1 行目が見出し（date / 日付 で始まる）なら読み飛ばす。戻り値は (specs, errors)
+    """
+    specs, errors = [], []
+    for lineno, row in enumerate(csv.reader(io.StringIO(text or "")), start=1):
+        row = [c.strip() for c in row]
+        if not any(row):
+            continue
+        if lineno == 1 and row[0].lower() in ("date", "日付"):
+            continue
+        where = f"{lineno} 行目: "
+        if len(row) != 4:
+            errors.append(f"{where}列は 日付,体育館,開始,終了 の 4 つにしてください")
+            continue
+        d = _parse_date(row[0])
+        if d is None:
+            errors.append(f"{where}日付が不正です: {row[0]}")
+        start, end = _parse_time(row[2]), _parse_time(row[3])
+        slot_errors = _check_slot(row[1], start, end, where)
+        errors.extend(slot_errors)
+        if d is not None and not slot_errors:
+            specs.append((d, row[1], start, end))
+    if not specs and not errors:
+        errors.append("CSV が空です")
+    return specs, errors
+
+
+def create_candidates(specs):
+    """
+    検証済みの specs を登録する（commit は呼び出し側）
+    入力内の重複・既存候補との重複・時間の重なりはスキップし、結果のサマリーを返す
+    """
+    unique = list(dict.fromkeys(specs))
+
+    # 対象の (体育館, 日付) の既存候補を 1 クエリで読み、入力分を足しながら重なりを調べる
+    # （キャッシュ済みのインデックスは書き換えないようにコピーして使う）
+    indexes = {key: DayIndex(index.items) for key, index in day_indexes((g, d) for d, g, _, _ in unique).items()}
+    new, skipped, conflicted = [], [], []
+    for spec in unique:
+        d, gym, start, end = spec
+        _, starts_at, ends_at = schedule_columns(d.year, d.month, d.day, start, end)
+        index = indexes[(gym, d)]
+        hits = index.conflicts(starts_at, ends_at)
+        if any(h.starts_at == starts_at and h.ends_at == ends_at for h in hits):
+            skipped.append(spec)
+        elif hits:
+            conflicted.append(spec)
+        else:
+            new.append(spec)
+            index.add(Interval(starts_at, ends_at, None))
+
+    if new:
+        now = datetime.utcnow()
+        rows = []
+        for d, gym, start, end in new:
+            event_date, starts_at, ends_at = schedule_columns(d.year, d.month, d.day, start, end)
+            rows.append({
+                "year": d.year, "month": d.month, "day": d.day,
+                "gym": gym, "start": start, "end": end,
+                "event_date": event_date, "starts_at": starts_at, "ends_at": ends_at,
+                "sequence": 0, "created_at": now, "updated_at": now,
+            })
+        db.session.execute(insert(Candidate).values(rows))
+
+    def label(spec):
+        d, gym, start, end = spec
+        return f"{d.month}/{d.day}（{WEEKDAYS[d.weekday()]}） {gym} {start}〜{end}"
+
+    return {
+        "requested": len(specs),
+        "created": len(new),
+        "skipped_duplicates": len(specs) - len(new) - len(conflicted),
+        "skipped_conflicts": len(conflicted),
+        "created_items": [label(s) for s in new],
+        "skipped_items": [label(s) for s in skipped],
+        "conflict_items": [label(s) for s in conflicted],
+    }
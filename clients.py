@@ -0,0 +1,141 @@
+# clients.py
+# LINE / SendGrid の API クライアントをワーカープロセスごとに 1 つだけ作って使い回す
+#
+# - 初回利用時に遅延生成し、requests.Session の keep-alive 接続を再利用する
+# - gunicorn の fork 後は子プロセスで作り直す（親の接続を共有しない）
+# - タイムアウトは NOTIFY_HTTP_TIMEOUT で設定、各呼び出しの所要時間はログに出す
+# - requests / linebot は初回利用時に import する（起動時には読み込まない）
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 送信先（テスト時はローカルの偽サーバーに向けられる）
+LINE_API_ENDPOINT = os.environ.get("LINE_API_ENDPOINT", "https://api.line.me")
+SENDGRID_API_HOST = os.environ.get("SENDGRID_API_HOST", "https://api.sendgrid.com")
+
+# (connect, read) タイムアウト秒
+NOTIFY_HTTP_TIMEOUT = float(os.environ.get("NOTIFY_HTTP_TIMEOUT", 5))
+NOTIFY_HTTP_POOL_SIZE = int(os.environ.get("NOTIFY_HTTP_POOL_SIZE", 4))
+
+_lock = threading.Lock()
+_clients = {}
+_owner_pid = None
+
+
+def _reset_after_fork():
+    global _owner_pid
+    _clients.clear()
+    _owner_pid = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_or_create(key, factory):
+    """プロセス内で 1 度だけ factory() を呼んでキャッシュする"""
+    global _owner_pid
+    if _owner_pid != os.getpid():
+        # register_at_fork が効かない起動方法でも別プロセスなら作り直す
+        with _lock:
+            if _owner_pid != os.getpid():
+                _clients.clear()
+                _owner_pid = os.getpid()
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+                logger.info("created %s client (pid=%s)", key, os.getpid())
+    return client
+
+
+@contextmanager
+def timed(service, operation):
+    """外部 API 呼び出しの所要時間をログに出す"""
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        elapsed = time.perf_counter() - started
+        logger.info("%s %s %s in %.1fms", service, operation, "ok" if ok else "failed", elapsed * 1000)
+        labels = {"service": service, "operation": operation}
+        metrics.observe("outbound_request_duration_seconds", labels, elapsed)
+        if not ok:
+            metrics.inc("outbound_errors_total", labels)
+
+
+def http_session():
+    def factory():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=NOTIFY_HTTP_POOL_SIZE)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        return s
+    return _get_or_create("http_session", factory)
+
+
+def _session_http_client_class():
+    """LineBotApi 用の HttpClient。共有の requests.Session で接続を使い回す"""
+    from linebot.http_client import HttpClient, RequestsHttpResponse
+
+    class SessionHttpClient(HttpClient):
+        def __init__(self, timeout=NOTIFY_HTTP_TIMEOUT):
+            super().__init__(timeout)
+
+        def _request(self, method, url, timeout=None, **kwargs):
+            response = http_session().request(method, url, timeout=timeout or self.timeout, **kwargs)
+            return RequestsHttpResponse(response)
+
+        def get(self, url, headers=None, params=None, stream=False, timeout=None):
+            return self._request("GET", url, timeout, headers=headers, params=params, stream=stream)
+
+        def post(self, url, headers=None, data=None, timeout=None):
+            return self._request("POST", url, timeout, headers=headers, data=data)
+
+        def delete(self, url, headers=None, data=None, timeout=None):
+            return self._request("DELETE", url, timeout, headers=headers, data=data)
+
+        def put(self, url, headers=None, data=None, timeout=None):
+            return self._request("PUT", url, timeout, headers=headers, data=data)
+
+    return SessionHttpClient
+
+
+def line_bot_api():
+    def factory():
+        from linebot import LineBotApi
+
+        return LineBotApi(
+            os.environ.get("LINE_CHANNEL_ACCESS_TOKEN"),
+            endpoint=LINE_API_ENDPOINT,
+            timeout=NOTIFY_HTTP_TIMEOUT,
+            http_client=_session_http_client_class(),
+        )
+    return _get_or_create("line", factory)
+
+
+def send_sendgrid_mail(mail):
+    """
+    sendgrid.helpers.mail.Mail を v3 API に POST する
+    SDK 標準の urllib クライアントは毎回接続し直すため、共有 Session で送る
+    """
+    response = http_session().post(
+        f"{SENDGRID_API_HOST}/v3/mail/send",
+        json=mail.get(),
+        headers={"Authorization": f"Bearer {os.environ['SENDGRID_API_KEY']}"},
+        timeout=NOTIFY_HTTP_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response
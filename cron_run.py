@@ -0,0 +1,29 @@
+# cron_run.py
+# cron から呼ぶ一括処理（reminder_engine.py / archive_engine.py）の共通部分
+#
+# - Postgres では advisory lock で同時実行を 1 つに制限する（処理ごとに別のキー）
+# - 実行結果と所要時間を cron_logs に残す
+import time
+
+from sqlalchemy import text
+
+from models import db, CronLog
+
+
+def try_lock(key):
+    """同時実行防止。トランザクション終了時に自動で解放される"""
+    if db.engine.dialect.name != "postgresql":
+        return True
+    return db.session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": key}).scalar()
+
+
+def write_cron_log(result, started, prefix=None):
+    """result の status / message を cron_logs に追加する（commit は呼び出し側）"""
+    message = result.get("message")
+    if prefix:
+        message = f"{prefix}: {message}"
+    db.session.add(CronLog(
+        status=result["status"],
+        message=message,
+        duration_ms=int((time.perf_counter() - started) * 1000),
+    ))
@@ -0,0 +1,90 @@
+# data_version.py
+# 予定・出欠データの世代番号（data_versions テーブル）
+#
+# Candidate / Confirmed / Attendance / Availability を変更するトランザクションは、commit 時に
+# 同じトランザクション内で世代番号を +1 する。ORM での追加・更新・削除に加えて
+# Query.delete() / update() のような一括操作も拾う。
+# キャッシュ（カレンダー配信など）はこの番号をキーにすれば全ワーカーで一貫して無効化できる。
+# 候補の時間帯インデックス（overlap_index.py）は出欠の変更では変わらないので、
+# Candidate の変更だけで +1 される別の番号（CANDIDATES）を使う。
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Candidate, Confirmed, Attendance, Availability, DataVersion
+
+SCHEDULE = "schedule"
+CANDIDATES = "candidates"
+# 番号の名前 -> それを +1 するモデル
+# Availability は /confirm の順位付け・提案に出るので、変わったら描画キャッシュも捨てる
+TRACKED_MODELS = {
+    SCHEDULE: (Candidate, Confirmed, Attendance, Availability),
+    CANDIDATES: (Candidate,),
+}
+
+_table = DataVersion.__table__
+
+
+def current(name=SCHEDULE):
+    """(version, updated_at) を返す。未作成なら (0, None)"""
+    row = db.session.execute(
+        select(_table.c.version, _table.c.updated_at).where(_table.c.name == name)
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def ensure(names=tuple(TRACKED_MODELS)):
+    """世代番号の行を用意する（スキーマ作成時に呼ぶ）"""
+    for name in names:
+        if current(name)[1] is None:
+            db.session.execute(insert(_table).values(name=name, version=0, updated_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def bump(session, name=SCHEDULE):
+    now = datetime.utcnow()
+    result = session.execute(
+        update(_table)
+        .where(_table.c.name == name)
+        .values(version=_table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(_table).values(name=name, version=1, updated_at=now))
+
+
+def _changed_names(objects):
+    objects = list(objects)
+    return {name for name, models in TRACKED_MODELS.items() if any(isinstance(o, models) for o in objects)}
+
+
+@event.listens_for(Session, "before_flush")
+def _mark_on_flush(session, flush_context, instances):
+    changed = _changed_names((*session.new, *session.dirty, *session.deleted))
+    if changed:
+        session.info.setdefault("data_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_on_bulk(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    classes = {m.class_ for m in orm_execute_state.all_mappers}
+    changed = {name for name, models in TRACKED_MODELS.items() if classes & set(models)}
+    if changed:
+        orm_execute_state.session.info.setdefault("data_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_on_commit(session):
+    # commit 直前の flush 前に呼ばれるので、未 flush の変更もここで確認する
+    changed = session.info.pop("data_changed", set())
+    changed |= _changed_names((*session.new, *session.dirty, *session.deleted))
+    for name in sorted(changed):
+        bump(session, name)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _clear_flag(session):
+    session.info.pop("data_changed", None)
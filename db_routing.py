@@ -0,0 +1,101 @@
+# db_routing.py
+# 読み取り専用レプリカへの振り分け（DATABASE_REPLICA_URL を設定したときだけ有効）
+#
+# - GET / HEAD のリクエストはレプリカ、それ以外（書き込み）はプライマリ
+# - 書き込んだクライアントは DB_PRIMARY_PIN_SECONDS 秒だけ GET もプライマリに固定（自分の書き込みが見える）
+# - GET の途中で書き込みが発生したら、そのリクエストの残りはプライマリを使う
+# - リクエスト外（バックグラウンドのジョブ・CLI）は常にプライマリ
+# - 鮮度が必要な GET は @primary を付けるとプライマリで読む
+#
+# ローカルでは SQLite ファイル 2 つで試せる:
+#   cp app.db replica.db
+#   DATABASE_URL=sqlite:///app.db DATABASE_REPLICA_URL=sqlite:///replica.db gunicorn "main:create_app()"
+import os
+import time
+
+from flask import request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = "replica"
+DB_PRIMARY_PIN_SECONDS = float(os.environ.get("DB_PRIMARY_PIN_SECONDS", 5))
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    """info["use_replica"] が立っている間、読み取りをレプリカのエンジンで実行する"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get("use_replica"):
+            if self._flushing or isinstance(clause, UpdateBase):
+                # 書き込みが始まったらこのセッションは以後プライマリだけを使う
+                self.info["use_replica"] = False
+            else:
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def normalize_url(url):
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def engine_options(url):
+    """
+    全エンジン共通のプール設定
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_RECYCLE / DB_POOL_PRE_PING
+    """
+    options = {
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+    # SQLite（特にメモリ DB）はプールの種類が違うので size 系は Postgres 等だけに付ける
+    if not url.startswith("sqlite"):
+        options["pool_size"] = int(os.environ.get("DB_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+    return options
+
+
+def primary(view):
+    """レプリカの遅延が許されない GET に付ける"""
+    view.use_primary = True
+    return view
+
+
+def replica_enabled(app):
+    return REPLICA_BIND in app.config.get("SQLALCHEMY_BINDS", {})
+
+
+def init_app(app, db):
+    """
+    DATABASE_REPLICA_URL があればレプリカを bind として登録し、リクエストごとに振り分ける
+    db.init_app より前に呼ぶこと
+    """
+    url = app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(url)
+
+    replica_url = normalize_url(os.environ.get("DATABASE_REPLICA_URL"))
+    if not replica_url:
+        return
+    app.config["SQLALCHEMY_BINDS"] = {
+        REPLICA_BIND: {"url": replica_url, **engine_options(replica_url)},
+    }
+
+    @app.before_request
+    def _route_reads():
+        if request.method not in READ_METHODS:
+            return
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, "use_primary", False):
+            return
+        if session.get("db_pin_until", 0) > time.time():
+            return
+        db.session.info["use_replica"] = True
+
+    @app.after_request
+    def _pin_after_write(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            session["db_pin_until"] = time.time() + DB_PRIMARY_PIN_SECONDS
+        return response
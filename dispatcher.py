@@ -0,0 +1,13 @@
+# dispatcher.py
+# 通知 outbox と LINE webhook イベントを処理する常駐プロセス（Web 側は OUTBOX_DISPATCHER=off で起動する）
+import threading
+
+from main import create_app
+from notifications import run_dispatcher
+from line_webhook import run_worker
+
+if __name__ == "__main__":
+    print("Starting notification dispatcher...")
+    app = create_app(start_workers=False)
+    threading.Thread(target=run_worker, args=(app,), name="line-webhook-worker", daemon=True).start()
+    run_dispatcher(app)
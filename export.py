@@ -0,0 +1,127 @@
+# export.py
+# 確定イベントと出欠の履歴エクスポート（/export/attendance.csv, /export/events.jsonl）
+#
+# - 稼働中のテーブルとアーカイブ（archived_*）を UNION ALL した 1 本のクエリを日付順に読む
+# - yield_per でサーバーサイドカーソルから EXPORT_BATCH_SIZE 行ずつ取り出し、そのまま書き出す
+#   （履歴全体をメモリに載せないので、件数が増えてもメモリ使用量は一定）
+# - 期間（from / to）とメンバー（member、複数可）で絞り込める
+# - クライアントが gzip を受け付ければ、書き出しながら圧縮する
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from itertools import groupby
+
+from sqlalchemy import false, select, true, union_all
+
+from models import db, Candidate, Confirmed, Attendance, ArchivedCandidate, ArchivedAttendance
+
+EXPORT_BATCH_SIZE = 500
+
+CSV_COLUMNS = ["event_id", "date", "gym", "start", "end", "name", "status", "archived"]
+
+
+def parse_filters(args):
+    """
+    クエリ文字列から (date_from, date_to, members) を作る
+    日付は YYYY-MM-DD。不正なら ValueError
+    """
+    date_from = date.fromisoformat(args["from"]) if args.get("from") else None
+    date_to = date.fromisoformat(args["to"]) if args.get("to") else None
+    members = [m for m in args.getlist("member") if m]
+    return date_from, date_to, members
+
+
+def _rows_query(date_from, date_to, members, with_empty_events):
+    """
+    (event_id, date, starts_at, gym, start, end, name, status, archived) を日付順に返す SELECT
+    with_empty_events=True なら出欠のないイベントも name=None の 1 行で含める
+    """
+    def part(cand, event_id_col, att, archived, joined):
+        q = (
+            select(event_id_col.label("event_id"), cand.event_date.label("date"),
+                   cand.starts_at.label("starts_at"), cand.gym.label("gym"),
+                   cand.start.label("start"), cand.end.label("end"),
+                   att.name.label("name"), att.status.label("status"),
+                   archived.label("archived"))
+            .select_from(joined)
+        )
+        if date_from:
+            q = q.where(cand.event_date >= date_from)
+        if date_to:
+            q = q.where(cand.event_date <= date_to)
+        if members:
+            q = q.where(att.name.in_(members))
+        return q
+
+    outer = with_empty_events and not members
+    live_join = Candidate.__table__.join(Confirmed.__table__, Confirmed.candidate_id == Candidate.id)
+    live_join = live_join.join(Attendance.__table__, Attendance.event_id == Confirmed.id, isouter=outer)
+    archived_join = ArchivedCandidate.__table__.join(
+        ArchivedAttendance.__table__, ArchivedAttendance.event_id == ArchivedCandidate.confirmed_id, isouter=outer
+    )
+
+    archived_part = part(ArchivedCandidate, ArchivedCandidate.confirmed_id, ArchivedAttendance,
+                         true(), archived_join)
+    archived_part = archived_part.where(ArchivedCandidate.confirmed_id.isnot(None))
+    live_part = part(Candidate, Confirmed.id, Attendance, false(), live_join)
+
+    u = union_all(archived_part, live_part).subquery()
+    return (
+        select(u)
+        .order_by(u.c.date.asc(), u.c.starts_at.asc(), u.c.event_id.asc(), u.c.name.asc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+
+def iter_attendance_csv(date_from=None, date_to=None, members=()):
+    """出欠 1 件を 1 行にした CSV（Excel で開けるよう BOM 付き UTF-8）"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow(CSV_COLUMNS)
+    result = db.session.execute(_rows_query(date_from, date_to, members, with_empty_events=False))
+    for batch in result.partitions():
+        for r in batch:
+            writer.writerow([r.event_id, r.date.isoformat(), r.gym, r.start, r.end, r.name, r.status,
+                             int(bool(r.archived))])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_events_jsonl(date_from=None, date_to=None, members=()):
+    """確定イベント 1 件を 1 行の JSON にする（出欠はイベントごとに attendance 配列へまとめる）"""
+    result = db.session.execute(_rows_query(date_from, date_to, members, with_empty_events=True))
+    # 同じイベントの行は並び順で連続するので、groupby で 1 イベント分ずつ組み立てる
+    chunk = []
+    for (event_id, archived), rows in groupby(result, key=lambda r: (r.event_id, bool(r.archived))):
+        rows = list(rows)
+        first = rows[0]
+        chunk.append(json.dumps({
+            "event_id": event_id,
+            "date": first.date.isoformat(),
+            "gym": first.gym,
+            "start": first.start,
+            "end": first.end,
+            "archived": archived,
+            "attendance": [{"name": r.name, "status": r.status} for r in rows if r.name is not None],
+        }, ensure_ascii=False))
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def gzip_stream(chunks):
+    """文字列のチャンクを gzip しながら流す（チャンクごとに flush して途中でも届くようにする）"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,10 +1,13 @@
 # init_db.py
+# テーブル作成はこのスクリプトで明示的に行う（アプリ起動時には行わない）
 from main import create_app
 from models import db
+import data_version
 
-app = create_app()
+app = create_app(start_workers=False)
 
 with app.app_context():
     print("Creating PostgreSQL tables...")
     db.create_all()
-    print("Done.")
\ No newline at end of file
+    data_version.ensure()
+    print("Done.")
@@ -0,0 +1,58 @@
+# line_digest.py
+# 短時間に続けて発生した LINE 通知を 1 通のダイジェストにまとめる
+#
+# - 通知は種類（topic）ごとに LINE_DIGEST_WINDOW_SECONDS 秒だけ outbox で待たせる
+#   （最初の 1 件が窓を開き、同じ topic の後続はその窓に相乗りする）
+# - 窓が閉じたらディスパッチャが同じ topic の通知をまとめて 1 回だけ push する
+# - 時刻はすべて引数の now で決まるので、偽の時計を渡せば動きを再現できる
+import os
+from datetime import timedelta
+
+LINE_DIGEST_WINDOW_SECONDS = int(os.environ.get("LINE_DIGEST_WINDOW_SECONDS", 60))
+
+
+def window_end(now, open_windows, topic):
+    """
+    新しい通知の送信予定時刻
+    open_windows: topic -> 送信待ちの同じ topic の送信予定時刻（なければキーなし）
+    """
+    if topic in open_windows:
+        return open_windows[topic]
+    return now + timedelta(seconds=LINE_DIGEST_WINDOW_SECONDS)
+
+
+def _format_confirmed(items):
+    if len(items) == 1:
+        item = items[0]
+        return (
+            f"📌 イベントが確定しました！\n\n"
+            f"🗓 {item['date']}\n\n"
+            f"🏠 {item['gym']}\n\n"
+            f"📥 参加登録はこちら👇\n{item['register_url']}\n\n"
+            f"📅 Googleカレンダーに追加👇\n{item['calendar_url']}"
+        )
+    lines = [f"📌 イベントが確定しました！（{len(items)}件）", ""]
+    for item in items:
+        lines.append(f"🗓 {item['date']} 🏠 {item['gym']}")
+        lines.append(f"📅 {item['calendar_url']}")
+        lines.append("")
+    lines.append(f"📥 参加登録はこちら👇\n{items[-1]['register_url']}")
+    return "\n".join(lines)
+
+
+def _format_changed(items):
+    if len(items) == 1:
+        return f"✏️ 確定日程が変更されました\n{items[0]['text']}"
+    body = "\n\n".join(item["text"] for item in items)
+    return f"✏️ 確定日程が変更されました（{len(items)}件）\n\n{body}"
+
+
+FORMATTERS = {
+    "confirmed": _format_confirmed,
+    "changed": _format_changed,
+}
+
+
+def format_digest(topic, items):
+    """同じ topic の通知（古い順）を 1 通の本文にする"""
+    return FORMATTERS[topic](items)
@@ -0,0 +1,268 @@
+# line_webhook.py
+# LINE グループでの返信（例:「参加 12/5」）から出欠を登録する
+#
+# - /line_webhook は X-Line-Signature を検証し、イベントを line_webhook_events に保存してすぐ 200 を返す
+# - 再送（同じ webhookEventId）は一意制約で 1 件にまとまる
+# - バックグラウンドのワーカーが保存済みイベントをまとめて処理し、出欠を 1 文の upsert で登録する
+# - 処理に失敗したバッチは半分ずつやり直し、何度やっても失敗するイベントは failed にして先へ進む
+# - 状態の表記は register_event と同じ normalize_status で揃える
+# LINE の userId とメンバー名の対応は LINE_USER_MATSUMURA などの環境変数で設定する
+import os
+import re
+import hmac
+import json
+import base64
+import hashlib
+import logging
+import threading
+from datetime import date, datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Candidate, Confirmed, LineWebhookEvent
+from attendance_service import dialect_insert, normalize_status, upsert_attendance_many
+from reminder_engine import LOCAL_TZ
+import member_stats
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LINE_WEBHOOK_BATCH_SIZE = int(os.environ.get("LINE_WEBHOOK_BATCH_SIZE", 50))
+LINE_WEBHOOK_POLL_SECONDS = float(os.environ.get("LINE_WEBHOOK_POLL_SECONDS", 10))
+# 1 件だけで処理しても失敗するイベントは、この回数で failed にする
+LINE_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("LINE_WEBHOOK_MAX_ATTEMPTS", 3))
+
+# LINE の userId -> メンバー名
+MEMBER_LINE_IDS = {
+    os.environ.get("LINE_USER_MATSUMURA"): "松村",
+    os.environ.get("LINE_USER_YAMABI"): "山火",
+    os.environ.get("LINE_USER_YAMANE"): "山根",
+    os.environ.get("LINE_USER_OKUSAKO"): "奥迫",
+    os.environ.get("LINE_USER_KAWASAKI"): "川崎",
+}
+MEMBER_LINE_IDS.pop(None, None)
+
+_STATUS_RE = re.compile(r"(不参加|参加|欠席|未定)")
+_DATE_RE = re.compile(r"(\d{1,2})\s*[/月]\s*(\d{1,2})")
+
+
+def verify_signature(body, signature, secret=None):
+    """X-Line-Signature（本文の HMAC-SHA256 を base64 にしたもの）を検証する"""
+    secret = secret or os.environ.get("LINE_CHANNEL_SECRET")
+    if not secret or not signature:
+        return False
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature)
+
+
+# ------------------------------
+# 受信（リクエスト内で行うのは保存だけ）
+# ------------------------------
+def store_events(body):
+    """
+    webhook の本文からイベントを 1 回の INSERT で保存する（commit は呼び出し側）
+    既に保存済みの webhookEventId は無視する。保存対象の件数を返す
+    本文が {"events": [{...}, ...]} の形でなければ ValueError
+    """
+    payload = json.loads(body)
+    events = payload.get("events", []) if isinstance(payload, dict) else None
+    if not isinstance(events, list) or not all(isinstance(ev, dict) for ev in events):
+        raise ValueError("webhook body must be an object with an events list")
+    rows = []
+    for ev in events:
+        event_id = ev.get("webhookEventId") or f"{ev.get('timestamp')}-{ev.get('message', {}).get('id')}"
+        rows.append({
+            "webhook_event_id": event_id,
+            "event_type": ev.get("type"),
+            "payload": json.dumps(ev, ensure_ascii=False),
+            "status": "pending",
+            "received_at": datetime.utcnow(),
+        })
+    if rows:
+        db.session.execute(
+            dialect_insert(LineWebhookEvent).values(rows)
+            .on_conflict_do_nothing(index_elements=[LineWebhookEvent.webhook_event_id])
+        )
+        db.session.info["webhook_pending"] = True
+    return len(rows)
+
+
+# ------------------------------
+# 処理（バックグラウンド）
+# ------------------------------
+def resolve_date(month, day, today):
+    """
+    「12/5」を today 以降で最も近いその日付にする。存在しない日付なら None
+    （2/29 はうるう年でない年を飛ばして翌年を試す）
+    """
+    for year in (today.year, today.year + 1):
+        try:
+            d = date(year, month, day)
+        except ValueError:
+            continue
+        if d >= today:
+            return d
+    return None
+
+
+def parse_event(ev, today):
+    """
+    (name, status, date) を返す。出欠の返信でなければ理由の文字列を返す
+    """
+    if ev.get("type") != "message" or ev.get("message", {}).get("type") != "text":
+        return "not a text message"
+    name = MEMBER_LINE_IDS.get(ev.get("source", {}).get("userId"))
+    if name is None:
+        return "unknown LINE user"
+    text = ev["message"].get("text", "")
+    m_status, m_date = _STATUS_RE.search(text), _DATE_RE.search(text)
+    if not (m_status and m_date):
+        return "no status/date in message"
+    status = normalize_status(m_status.group(1), default=None)
+    d = resolve_date(int(m_date.group(1)), int(m_date.group(2)), today)
+    if status is None or d is None:
+        return "invalid status/date"
+    return name, status, d
+
+
+def process_pending(today=None, batch_size=None):
+    """
+    保存済みイベントを 1 バッチ処理して、処理件数を返す
+    日付 -> 確定イベントの解決は 1 クエリ、出欠の登録は 1 文の upsert
+    バッチが失敗したら半分ずつに分けてやり直し、1 件だけでも失敗するイベントは attempts を数えて
+    LINE_WEBHOOK_MAX_ATTEMPTS 回で failed にする（他のイベントの処理は止めない）
+    """
+    today = today or datetime.now(LOCAL_TZ).date()
+    ids = [row.id for row in _lock_pending(limit=batch_size or LINE_WEBHOOK_BATCH_SIZE)]
+    if not ids:
+        return 0
+    _process_ids(ids, today)
+    return len(ids)
+
+
+def _lock_pending(*criteria, limit=None):
+    """未処理のイベントを id 順にロックして読む（他のワーカーがロック中のものは飛ばす）"""
+    return (
+        LineWebhookEvent.query
+        .filter(LineWebhookEvent.status == "pending", *criteria)
+        .order_by(LineWebhookEvent.id.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def _process_ids(ids, today):
+    """ids のイベントを 1 トランザクションで処理する。失敗したら半分ずつに分けて処理し直す"""
+    try:
+        # やり直しのときは他のワーカーが先に処理したものを除いて読み直す
+        rows = _lock_pending(LineWebhookEvent.id.in_(ids))
+        done = _apply(rows, today)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if len(ids) > 1:
+            logger.warning("line webhook batch of %d failed, retrying in halves: %s", len(ids), e)
+            mid = len(ids) // 2
+            _process_ids(ids[:mid], today)
+            _process_ids(ids[mid:], today)
+        else:
+            _record_failure(ids[0], e)
+        return
+    metrics.inc("line_webhook_events_total", {"result": "done"}, done)
+    metrics.inc("line_webhook_events_total", {"result": "ignored"}, len(rows) - done)
+
+
+def _record_failure(row_id, error):
+    """1 件だけで処理しても失敗したイベント。上限回数に達したら failed にして以後は取り出さない"""
+    rows = _lock_pending(LineWebhookEvent.id == row_id)
+    if not rows:
+        return
+    row = rows[0]
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = f"{type(error).__name__}: {error}"
+    if row.attempts >= LINE_WEBHOOK_MAX_ATTEMPTS:
+        row.status = "failed"
+        row.processed_at = datetime.utcnow()
+        logger.error("line webhook event %s failed: %s", row.id, row.last_error)
+        metrics.inc("line_webhook_events_total", {"result": "failed"})
+    else:
+        logger.warning("line webhook event %s failed (attempt %s): %s", row.id, row.attempts, row.last_error)
+    db.session.commit()
+
+
+def _apply(rows, today):
+    """rows の出欠を登録して状態を書き込む（commit は呼び出し側）。登録した件数を返す"""
+    parsed = {row.id: parse_event(json.loads(row.payload), today) for row in rows}
+    dates = {p[2] for p in parsed.values() if isinstance(p, tuple)}
+    events_by_date = {}
+    event_dates, event_gyms = {}, {}  # 統計（member_stats）用
+    if dates:
+        for confirmed_id, event_date, gym in (
+            db.session.query(Confirmed.id, Candidate.event_date, Candidate.gym)
+            .join(Candidate, Confirmed.candidate_id == Candidate.id)
+            .filter(Candidate.event_date.in_(sorted(dates)))
+        ):
+            events_by_date.setdefault(event_date, []).append(confirmed_id)
+            event_dates[confirmed_id], event_gyms[confirmed_id] = event_date, gym
+
+    now = datetime.utcnow()
+    upserts = []
+    for row in rows:
+        p = parsed[row.id]
+        row.processed_at = now
+        if isinstance(p, str):
+            row.status, row.result = "ignored", p
+            continue
+        name, status, d = p
+        matches = events_by_date.get(d, [])
+        if len(matches) != 1:
+            row.status = "ignored"
+            row.result = f"{len(matches)} confirmed events on {d}"
+            continue
+        upserts.append({"event_id": matches[0], "name": name, "status": status})
+        row.status, row.result = "done", f"{name} {status} event={matches[0]}"
+
+    # rows は id 順なので、同じ人の同じ日への返信は後のものが勝つ
+    latest = {(u["event_id"], u["name"]): u["status"] for u in upserts}
+    # 変更前の status は upsert が行をロックして読んだもの（統計の増減に使う）
+    before = upsert_attendance_many(upserts)
+    member_stats.record([
+        member_stats.Change(name, event_id, event_dates[event_id], event_gyms[event_id],
+                            before.get((event_id, name)), status)
+        for (event_id, name), status in latest.items()
+    ])
+    return len(upserts)
+
+
+# ------------------------------
+# ワーカー（outbox のディスパッチャと同じ作り）
+# ------------------------------
+_wakeup = threading.Event()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session):
+    if session.info.pop("webhook_pending", False):
+        _wakeup.set()
+
+
+def run_worker(app, poll_seconds=None, stop_event=None):
+    poll_seconds = LINE_WEBHOOK_POLL_SECONDS if poll_seconds is None else poll_seconds
+    while not (stop_event and stop_event.is_set()):
+        processed = 0
+        try:
+            with app.app_context():
+                processed = process_pending()
+        except Exception:
+            logger.exception("line webhook processing failed")
+        if processed < LINE_WEBHOOK_BATCH_SIZE:
+            _wakeup.wait(poll_seconds)
+            _wakeup.clear()
+
+
+def start_worker_thread(app):
+    thread = threading.Thread(target=run_worker, args=(app,), name="line-webhook-worker", daemon=True)
+    thread.start()
+    return thread
@@ -1,20 +1,54 @@
 # main.py  — Gmail + ICS 自動送信版
 # --- CHANGES/ADDITIONS marked with comments "# --- ADDED" or "# --- CHANGED"
 
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
-import uuid
 import logging
-from datetime import datetime, timedelta, date, timezone
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-from flask import Flask, render_template, request, redirect, url_for, session
-import traceback
+from flask import (
+    Flask, Response, abort, jsonify, render_template, request, redirect, stream_with_context, url_for, session,
+)
+from sqlalchemy import case, update
 import json
 
-from models import db, Candidate, Confirmed, Attendance
-from linebot import LineBotApi
-from linebot.models import TextSendMessage
-
-def create_app():
+from models import (
+    db, Candidate, Confirmed, Attendance, Availability, ReminderLog, ReminderJob,
+    SCHEDULE_FIELDS, schedule_columns,
+)
+from attendance_service import (
+    build_attendance_summary, confirmed_id_map, insert_confirmed, normalize_status, upsert_attendance,
+    upsert_confirmed,
+)
+import availability
+import candidate_bulk
+import export
+import member_stats
+import month_view
+import overlap_index
+from notifications import enqueue_line_digest, enqueue_ics_email, enqueue_ics_emails, start_dispatcher_thread
+from reminder_engine import submit_reminder_job
+import archive_engine
+import assets
+import line_webhook as line_webhook_queue
+from calendar_feed import get_feed
+from render_cache import render_cached
+import db_routing
+import metrics
+
+# main の import にかかった時間（起動時間レポート用）
+IMPORT_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
+
+
+def create_app(start_workers=True):
+    """
+    アプリを組み立てるだけで DB には触らない（テーブル作成は init_db.py / migrate_db.py）
+    start_workers=False ならバックグラウンドの通知ディスパッチャを起動しない（CLI 用）
+    """
+    started = time.perf_counter()
+    timings = {"import_ms": IMPORT_MS}
     app = Flask(__name__, static_folder="static", template_folder="templates")
 
     # --- CHANGED: secret from env optionally
@@ -25,12 +59,15 @@ def create_app():
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL が設定されていません")
 
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_routing.normalize_url(DATABASE_URL)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # プール設定と、DATABASE_REPLICA_URL があれば GET をレプリカへ振り分け
+    db_routing.init_app(app, db)
     db.init_app(app)
+    metrics.init_app(app)
+    # ハッシュ入り静的ファイル（/assets/）と HTML の gzip
+    assets.init_app(app)
 
     # logger
     if not app.debug:
@@ -56,6 +93,8 @@ def create_app():
     # timezone
     LOCAL_TZ = ZoneInfo(os.environ.get("LOCAL_TZ", "Asia/Tokyo"))
 
+    timings["config_ms"] = (time.perf_counter() - started) * 1000
+
     # ------------------------------
     # Routes (mostly unchanged)
     # ------------------------------
@@ -95,7 +134,7 @@ def create_app():
         years = [base.year - 1, base.year, base.year + 1]
         months = list(range(1, 13))
         days = list(range(1, 32))
-        confirmed_ids = { c.candidate_id for c in Confirmed.query.all() }
+        confirmed_ids = set(confirmed_id_map())
 
         if request.method == "POST":
             cand = Candidate(
@@ -106,14 +145,19 @@ def create_app():
                 start=request.form["start"],
                 end=request.form["end"]
             )
-            db.session.add(cand)
-            db.session.commit()
+            # 存在しない日付（2/30 など）と、同じ体育館・同じ日に時間が重なる候補があれば登録しない
+            error = schedule_error(cand)
+            conflicts = [] if error else schedule_conflicts(cand)
+            if not (error or conflicts):
+                db.session.add(cand)
+                db.session.commit()
             return render_template("candidate.html",
                                    years=years, months=months, days=days,
                                    gyms=gyms, times=times,
                                    selected_year=cand.year, selected_month=cand.month, selected_day=cand.day,
                                    selected_gym=cand.gym, selected_start=cand.start, selected_end=cand.end,
-                                   confirmed_ids=confirmed_ids)
+                                   confirmed_ids=confirmed_ids, conflicts=conflicts,
+                                   error=error), 400 if error else 409 if conflicts else 200
 
         return render_template("candidate.html",
                                years=years, months=months, days=days,
@@ -122,31 +166,64 @@ def create_app():
                                selected_gym="中平井", selected_start="18:00", selected_end="19:00",
                                confirmed_ids=confirmed_ids)
 
+    def schedule_error(cand):
+        """フォームの日付・時間が実在しなければメッセージを返す（日は月に関係なく 1〜31 を選べるため）"""
+        try:
+            schedule_columns(cand.year, cand.month, cand.day, cand.start, cand.end)
+        except ValueError:
+            return f"{cand.year}/{cand.month}/{cand.day} {cand.start}〜{cand.end} は存在しない日時です"
+        return None
+
+    def schedule_conflicts(cand, exclude_id=None):
+        """cand（未保存の値）と同じ体育館・同じ日で時間が重なる候補を「18:00〜20:00」の形で返す"""
+        _, starts_at, ends_at = schedule_columns(cand.year, cand.month, cand.day, cand.start, cand.end)
+        return [
+            f"{i.starts_at:%H:%M}〜{i.ends_at:%H:%M}"
+            for i in overlap_index.find_conflicts(cand.gym, starts_at, ends_at, exclude_id=exclude_id)
+        ]
+
+    # ------------------------------
+    # 候補日の一括作成（期間＋曜日パターン / CSV）
+    # 結果は JSON のサマリーで返し、画面はフォームのまま
+    # ------------------------------
+    @app.route("/candidate/bulk", methods=["GET", "POST"])
+    def candidate_bulk_create():
+        if request.method == "GET":
+            today = datetime.now(tz=LOCAL_TZ).date()
+            times = [f"{h:02d}:{m}" for h in range(18, 23) for m in ("00", "30")][:-1]
+            return render_template("candidate_bulk.html",
+                                   gyms=candidate_bulk.GYMS, weekdays=candidate_bulk.WEEKDAYS,
+                                   times=times, today=today.isoformat(),
+                                   max_rows=candidate_bulk.BULK_MAX_ROWS)
+
+        if request.form.get("mode") == "csv":
+            specs, errors = candidate_bulk.parse_csv(request.form.get("csv", ""))
+        else:
+            specs, errors = candidate_bulk.parse_pattern(request.form)
+        if not errors and len(set(specs)) > candidate_bulk.BULK_MAX_ROWS:
+            errors = [f"一度に作れる候補は {candidate_bulk.BULK_MAX_ROWS} 件までです（{len(set(specs))} 件）"]
+        if errors:
+            return jsonify({"errors": errors}), 400
+
+        summary = candidate_bulk.create_candidates(specs)
+        db.session.commit()
+        return jsonify(summary)
+
     @app.route("/confirm", methods=["GET", "POST"])
     def confirm():
-        # 全候補を取得（ソート済み）
-        candidates = Candidate.query.order_by(
-            Candidate.year.asc(), Candidate.month.asc(), Candidate.day.asc(), Candidate.start.asc()
-        ).all()
-
         if request.method == "POST":
             c_id = int(request.form["candidate_id"])
-            exists = Confirmed.query.filter_by(candidate_id=c_id).first()
-            if not exists:
-                db.session.add(Confirmed(candidate_id=c_id))
-                db.session.commit()
-
-                c = Candidate.query.get(c_id)
-                d = date(c.year, c.month, c.day)
+            c = Candidate.query.get_or_404(c_id)
+            # 1 文の insert。既に確定済み（二重送信・同時送信）なら何もせず、通知も積まない
+            if insert_confirmed(c_id) is not None:
+                d = c.event_date
                 youbi = ["月","火","水","木","金","土","日"][d.weekday()]
                 date_str = f"{c.month}/{c.day}（{youbi}） {c.start}〜{c.end}"
                 title = f"{c.gym}"
 
                 # Googleカレンダー (UTC 変換)
-                h1, m1 = map(int, c.start.split(":"))
-                h2, m2 = map(int, c.end.split(":"))
-                start_dt = datetime(c.year, c.month, c.day, h1, m1, tzinfo=LOCAL_TZ)
-                end_dt   = datetime(c.year, c.month, c.day, h2, m2, tzinfo=LOCAL_TZ)
+                start_dt = c.starts_at.replace(tzinfo=LOCAL_TZ)
+                end_dt   = c.ends_at.replace(tzinfo=LOCAL_TZ)
                 start_g = start_dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
                 end_g   = end_dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
 
@@ -160,95 +237,114 @@ def create_app():
                 # 参加画面URL
                 event_page_url = url_for("set_name", _external=True)
 
-                # LINE通知
-                message = (
-                    f"📌 イベントが確定しました！\n\n"
-                    f"🗓 {date_str}\n\n"
-                    f"🏠 {c.gym}\n\n"
-                    f"📥 参加登録はこちら👇\n{event_page_url}\n\n"
-                    f"📅 Googleカレンダーに追加👇\n{google_calendar_url}"
-                )
-                send_line_message(message)
+                # LINE通知：続けて確定したものは 1 通のダイジェストにまとめて送る（line_digest.py）
+                # 確定と通知を同じトランザクションで保存（送信はディスパッチャが行う）
+                enqueue_line_digest("confirmed", {
+                    "date": date_str,
+                    "gym": c.gym,
+                    "register_url": event_page_url,
+                    "calendar_url": google_calendar_url,
+                })
+                db.session.commit()
 
             return redirect(url_for("confirm"))
 
-        # 確定リストを取得（候補と join）
-        confirmed = (
-            db.session.query(Confirmed, Candidate)
-            .join(Candidate, Confirmed.candidate_id == Candidate.id)
-            .order_by(Candidate.year.asc(), Candidate.month.asc(), Candidate.day.asc(), Candidate.start.asc())
-            .all()
+        # GET: 選択中の月だけを描画（データの世代番号が変わっていなければキャッシュ済み HTML を返す）
+        today = datetime.now(tz=LOCAL_TZ).date()
+        include_past = request.args.get("past") == "1"
+        requested = month_view.requested_month(request.args)
+        if requested and not month_view.valid_month(*requested):
+            abort(404)
+        key = ("confirm", today.year, today.month, requested, include_past)
+        return render_cached(key, lambda: render_confirm_page(today, requested, include_past))
+
+    @app.route("/confirm/month/<int:year>/<int:month>", methods=["GET"])
+    def confirm_month(year, month):
+        """タブ切り替え用：その月の断片 HTML"""
+        if not month_view.valid_month(year, month):
+            abort(404)
+        return render_cached(("confirm_month", year, month),
+                             lambda: render_template("confirm_month.html", **confirm_month_context(year, month)))
+
+    def render_confirm_page(today, requested, include_past):
+        months = month_view.available_months(today, include_past=include_past)
+        selected = month_view.select_month(months, today, requested)
+        return render_template(
+            "confirm.html",
+            months=month_view.month_tabs(months, selected),
+            selected=selected,
+            include_past=include_past,
+            **confirm_month_context(*selected)
         )
 
-        # confirmed_ids（candidate_id のリスト）
-        confirmed_list = db.session.query(Confirmed).all()
-        confirmed_ids = [c.candidate_id for c in confirmed_list]
-
-        # ---- フォーマット関数 ----
-        def format_candidate_for_list(c):
-            d = date(c.year, c.month, c.day)
-            youbi = ["月","火","水","木","金","土","日"][d.weekday()]
-            return {"id": c.id, "gym": c.gym, "start": c.start, "end": c.end, "md": f"{c.month}/{c.day}（{youbi}）", "month": c.month}
-
-        # フォーマット済み候補（未確定含む全候補）
-        candidates_fmt = [format_candidate_for_list(c) for c in candidates]
-
-        # 確定済みフォーマット（(Confirmed, candidate_dict) のタプルリスト）
-        confirmed_fmt = []
-        for cnf, c in confirmed:
-            d = date(c.year, c.month, c.day)
-            youbi = ["月","火","水","木","金","土","日"][d.weekday()]
-            c_dict = {"gym": c.gym, "start": c.start, "end": c.end, "md": f"{c.month}/{c.day}（{youbi}）", "month": c.month}
-            confirmed_fmt.append((cnf, c_dict))
-
-        # ---- attendance_summary 作成 ----
-        attendance_summary = {}
-        for cnf, c in confirmed:
-            event_id = cnf.id
-            attendance_list = Attendance.query.filter_by(event_id=event_id).all()
-
-            attend_members = [a.name for a in attendance_list if (getattr(a, "status", None) or "") == "attend"]
-            absent_members = [a.name for a in attendance_list if (getattr(a, "status", None) or "") == "absent"]
-
-            attendance_summary[event_id] = {
-                "attend_count": len(attend_members),
-                "absent_count": len(absent_members),
-                "attend_members": attend_members,
-                "absent_members": absent_members,
-            }
-
-        # ---- 月ごとにグループ化（テンプレ用） ----
-        from collections import defaultdict, OrderedDict
-
-        candidates_by_month = defaultdict(list)     # month(int) -> [candidate_dict,...]
-        for c in candidates_fmt:
-            candidates_by_month[int(c["month"])].append(c)
-
-        confirmed_by_month = defaultdict(list)      # month(int) -> [(Confirmed, candidate_dict), ...]
-        for cnf, c in confirmed_fmt:
-            confirmed_by_month[int(c["month"])].append((cnf, c))
-
-        # 月キーを昇順に並べ替えた OrderedDict にしてテンプレへ（Jinja での順序安定のため）
-        def sort_dict_by_month(d):
-            return OrderedDict(sorted(d.items(), key=lambda x: x[0]))
-
-        candidates_by_month = sort_dict_by_month(candidates_by_month)
-        confirmed_by_month = sort_dict_by_month(confirmed_by_month)
+    def confirm_month_context(year, month):
+        # その月の候補と確定状況を 1 クエリで取得（event_date の範囲検索）
+        rows = (
+            db.session.query(Candidate, Confirmed.id)
+            .outerjoin(Confirmed, Confirmed.candidate_id == Candidate.id)
+            .filter(*month_view.in_month(year, month))
+            .order_by(Candidate.event_date.asc(), Candidate.starts_at.asc())
+            .all()
+        )
 
-        return render_template(
-            "confirm.html",
-            # 古いキーは残さずテンプレで新しい月別構造を使う
-            candidates_by_month=candidates_by_month,
-            confirmed_by_month=confirmed_by_month,
-            confirmed_ids=confirmed_ids,
-            attendance_summary=attendance_summary
+        def md(c):
+            youbi = ["月","火","水","木","金","土","日"][c.event_date.weekday()]
+            return f"{c.month}/{c.day}（{youbi}）"
+
+        # 同じ体育館・同じ日で時間が重なる候補（読み込み済みの行だけで判定）
+        gym_conflicts = overlap_index.month_conflicts([c for c, _ in rows])
+
+        candidates = []
+        confirmed = []      # [(confirmed_id, candidate_dict), ...]
+        confirmed_ids = []  # 確定済みの candidate_id
+        by_id = {}
+        for c, confirmed_id in rows:
+            c_dict = {"id": c.id, "gym": c.gym, "start": c.start, "end": c.end, "md": md(c),
+                      "conflict": c.id in gym_conflicts}
+            candidates.append(c_dict)
+            by_id[c.id] = c_dict
+            if confirmed_id:
+                confirmed.append((confirmed_id, c_dict))
+                confirmed_ids.append(c.id)
+
+        # 未確定の候補を参加可能人数・集合時間で順位付けし、重ならない組み合わせを提案
+        ranking = availability.build_ranking(
+            [c for c, confirmed_id in rows if not confirmed_id],
+            [c for c, confirmed_id in rows if confirmed_id],
         )
-        
+        for r in ranking["ranking"]:
+            r["c"] = by_id[r["candidate_id"]]
+
+        # 時間の重なる確定イベントの両方に「参加」しているメンバー
+        attendance_summary = build_attendance_summary(cid for cid, _ in confirmed)
+        double_bookings = [
+            (name, by_id[a.id], by_id[b.id])
+            for name, a, b in overlap_index.member_double_bookings(
+                [(confirmed_id, c) for c, confirmed_id in rows if confirmed_id],
+                {eid: s["attend_members"] for eid, s in attendance_summary.items()},
+            )
+        ]
+
+        return {
+            "year": year,
+            "month": month,
+            "candidates": candidates,
+            "confirmed": confirmed,
+            "confirmed_ids": confirmed_ids,
+            "attendance_summary": attendance_summary,
+            "double_bookings": double_bookings,
+            "ranking": ranking["ranking"],
+            "suggested_ids": ranking["suggested_ids"],
+        }
+
     @app.route("/confirm/<int:candidate_id>/unconfirm", methods=["POST"])
     def unconfirm(candidate_id):
         conf = Confirmed.query.filter_by(candidate_id=candidate_id).first()
         if conf:
+            removed = member_stats.removed(member_stats.load_rows(Attendance.event_id == conf.id))
             Attendance.query.filter_by(event_id=conf.id).delete()  # ★追加
+            member_stats.record(removed)
+            ReminderLog.query.filter_by(event_id=conf.id).delete()
             db.session.delete(conf)
             db.session.commit()
         return redirect(url_for("confirm"))
@@ -263,11 +359,11 @@ def create_app():
         candidate = Candidate.query.get_or_404(event.candidate_id)
     
         # イベント情報フォーマット
-        from datetime import date
-        d = date(candidate.year, candidate.month, candidate.day)
+        d = candidate.event_date
         youbi = ["月","火","水","木","金","土","日"][d.weekday()]
     
         event_info = {
+            "id": event.id,
             "md": f"{candidate.month}/{candidate.day}（{youbi}）",
             "gym": candidate.gym,
             "start": candidate.start,
@@ -275,12 +371,14 @@ def create_app():
         }
     
         # このイベントの参加者一覧
-        attendance = Attendance.query.filter_by(event_id=event_id).all()
+        attendance = Attendance.query.filter_by(event_id=event_id).order_by(Attendance.id.asc()).all()
+        summary = build_attendance_summary([event_id])[event_id]
     
         return render_template(
             "manage_event_attendance.html",
             event_info=event_info,
-            attendance=attendance
+            attendance=attendance,
+            summary=summary
         )
     
     
@@ -295,16 +393,68 @@ def create_app():
         if new_status not in ["attend", "absent"]:
             return "Invalid status", 400
     
+        old_status = record.status
         record.status = new_status
+        candidate = record.event.candidate
+        member_stats.record([member_stats.Change(
+            record.name, record.event_id, candidate.event_date, candidate.gym, old_status, new_status
+        )])
         db.session.commit()
     
         return redirect(url_for("confirm"))
 
+    # --------------------------------------------
+    # 参加ステータスの一括更新（1 イベント分を 1 回の UPDATE で）
+    # form: status_<attendance_id>=attend|absent|pending
+    # JSON: {"changes": {"<attendance_id>": "attend", ...}}
+    # --------------------------------------------
+    @app.route("/manage_event/<int:event_id>/attendance", methods=["POST"])
+    def update_attendance_batch(event_id):
+        if request.is_json:
+            body = request.get_json(silent=True)
+            raw = body.get("changes") if isinstance(body, dict) else None
+            if not isinstance(raw, dict):
+                return {"error": "changes must be an object of attendance_id -> status"}, 400
+        else:
+            raw = {k[len("status_"):]: v for k, v in request.form.items() if k.startswith("status_")}
+
+        changes = {}
+        for att_id, raw_status in raw.items():
+            status = normalize_status(raw_status, default=None) if isinstance(raw_status, str) else None
+            if not str(att_id).isdigit() or status is None:
+                return {"error": f"invalid change: {att_id}={raw_status}"}, 400
+            changes[int(att_id)] = status
+        if not changes:
+            return {"error": "no changes"}, 400
+
+        before = member_stats.load_rows(Attendance.event_id == event_id, Attendance.id.in_(list(changes)))
+        # CASE 式で 1 文にまとめる。他イベントの id が混じっていたら件数が合わないので取り消す
+        result = db.session.execute(
+            update(Attendance)
+            .where(Attendance.event_id == event_id, Attendance.id.in_(list(changes)))
+            .values(status=case(changes, value=Attendance.id))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(changes):
+            db.session.rollback()
+            return {"error": "attendance not found for this event"}, 404
+        member_stats.record([
+            member_stats.Change(r.name, r.event_id, r.event_date, r.gym, r.status, changes[r.id]) for r in before
+        ])
+        db.session.commit()
+
+        summary = build_attendance_summary([event_id])[event_id]
+        if not request.is_json and not request.accept_mimetypes.accept_json:
+            return redirect(url_for("manage_event_attendance", event_id=event_id))
+        return {"event_id": event_id, "updated": len(changes), "statuses": changes, "summary": summary}, 200
+
     @app.route("/attendance/<int:id>/delete", methods=["POST"])
     def delete_attendance(id):
         att = Attendance.query.get_or_404(id)
         candidate_id = att.event.candidate_id
+        removed = member_stats.removed(member_stats.load_rows(Attendance.id == id))
         db.session.delete(att)
+        member_stats.record(removed)
         db.session.commit()
 
         return redirect(url_for("confirm"))
@@ -312,54 +462,101 @@ def create_app():
     @app.route("/register", methods=["GET"])
     def register():
         user_name = session.get("user_name")
-        candidates = (
-            db.session.query(Candidate)
+        today = datetime.now(tz=LOCAL_TZ).date()
+        include_past = request.args.get("past") == "1"
+        requested = month_view.requested_month(request.args)
+        if requested and not month_view.valid_month(*requested):
+            abort(404)
+        # ユーザー名ごとにキャッシュ（名前入りの表示を取り違えないように）
+        key = ("register", user_name, today.year, today.month, requested, include_past)
+        return render_cached(key, lambda: render_register_page(user_name, today, requested, include_past),
+                             private=True)
+
+    @app.route("/register/month/<int:year>/<int:month>", methods=["GET"])
+    def register_month(year, month):
+        """タブ切り替え用：その月の断片 HTML"""
+        if not month_view.valid_month(year, month):
+            abort(404)
+        return render_cached(("register_month", year, month),
+                             lambda: render_template("register_month.html", **register_month_context(year, month)),
+                             private=True)
+
+    def render_register_page(user_name, today, requested, include_past):
+        months = month_view.available_months(today, include_past=include_past, confirmed_only=True)
+        selected = month_view.select_month(months, today, requested)
+        return render_template(
+            "register_select.html",
+            user_name=user_name,
+            months=month_view.month_tabs(months, selected),
+            selected=selected,
+            include_past=include_past,
+            **register_month_context(*selected)
+        )
+
+    def register_month_context(year, month):
+        # その月の確定済み候補（confirmed_id 付き）を 1 クエリで取得
+        rows = (
+            db.session.query(Candidate, Confirmed.id)
             .join(Confirmed, Candidate.id == Confirmed.candidate_id)
-            .order_by(Candidate.year.asc(), Candidate.month.asc(), Candidate.day.asc(), Candidate.start.asc())
+            .filter(*month_view.in_month(year, month))
+            .order_by(Candidate.event_date.asc(), Candidate.starts_at.asc())
             .all()
         )
+        candidates = []
+        for c, confirmed_id in rows:
+            c.confirmed_id = confirmed_id
+            candidates.append(c)
+
+        return {
+            "year": year,
+            "month": month,
+            "candidates": candidates,
+            "attendance_summary": build_attendance_summary(c.confirmed_id for c in candidates),
+        }
 
-        # candidates に confirmed_id を付与する
-        for c in candidates:
-            cnf = Confirmed.query.filter_by(candidate_id=c.id).first()
-            c.confirmed_id = cnf.id if cnf else None
-
-        # --- 追加：Confirmed を取得して attendance_summary を作る ---
-        attendance_summary = {}
-        confirmed_events = Confirmed.query.all()
+    @app.route("/availability", methods=["GET", "POST"])
+    @db_routing.primary  # 保存直後に自分の入力が見えるようにプライマリで読む
+    def member_availability():
+        """未確定の候補日に「行ける / 行けない」を付ける（/confirm の順位付けに使う）"""
+        user_name = session.get("user_name")
+        if not user_name:
+            return redirect(url_for("set_name"))
 
-        for cnf in confirmed_events:
-            event_id = cnf.id
-            attendance_list = Attendance.query.filter_by(event_id=event_id).all()
+        today = datetime.now(tz=LOCAL_TZ).date()
+        # これからの未確定候補を 1 クエリで取得
+        candidates = (
+            Candidate.query
+            .outerjoin(Confirmed, Confirmed.candidate_id == Candidate.id)
+            .filter(Confirmed.id.is_(None), Candidate.event_date >= today)
+            .order_by(Candidate.event_date.asc(), Candidate.starts_at.asc())
+            .all()
+        )
 
-            attend_members = [a.name for a in attendance_list if (getattr(a, "status", None) or "") == "attend"]
-            absent_members = [a.name for a in attendance_list if (getattr(a, "status", None) or "") == "absent"]
+        if request.method == "POST":
+            listed = {c.id for c in candidates}
+            choices = {}
+            for raw in request.form.getlist("candidate_id"):
+                if raw.isdigit() and int(raw) in listed:
+                    choices[int(raw)] = request.form.get(f"available_{raw}") == "1"
+            # 表示していた全候補分をまとめて 1 文の upsert で保存
+            availability.save_availability(user_name, choices)
+            db.session.commit()
+            return redirect(url_for("member_availability"))
 
-            attendance_summary[event_id] = {
-                "attend_count": len(attend_members),
-                "absent_count": len(absent_members),
-                "attend_members": attend_members,
-                "absent_members": absent_members,
-            }
+        mine = {
+            cid for (cid,) in db.session.query(Availability.candidate_id).filter(
+                Availability.name == user_name,
+                Availability.available.is_(True),
+                Availability.candidate_id.in_([c.id for c in candidates]),
+            )
+        } if candidates else set()
+        return render_template("availability.html", user_name=user_name, candidates=candidates, mine=mine)
 
-        return render_template(
-            "register_select.html",
-            candidates=candidates,
-            user_name=user_name,
-            attendance_summary=attendance_summary   # ← 追加
-        )
-    
     @app.route("/register/event/<int:candidate_id>", methods=["GET", "POST"])
+    @db_routing.primary  # GET でも Confirmed を自動作成するのでプライマリで読む
     def register_event(candidate_id):
         candidate = Candidate.query.get_or_404(candidate_id)
     
-        # Confirmed が存在しない場合は自動作成
-        event = Confirmed.query.filter_by(candidate_id=candidate_id).first()
-        if not event:
-            event = Confirmed(candidate_id=candidate_id)
-            db.session.add(event)
-            db.session.commit()
-        
         members = ["松村", "山火", "山根", "奥迫", "川崎"]
 
         default_name = session.get("user_name")
@@ -367,60 +564,38 @@ def create_app():
         if request.method == "POST":
     
             # ---- ここが重要：HTML の値を DB 用に統一する ----
-            raw_status = request.form["status"]
-    
-            if raw_status in ["参加", "attend"]:
-                status = "attend"
-            elif raw_status in ["不参加", "absent"]:
-                status = "absent"
-            else:
-                status = "pending"     # 「未定」「未回答」などはこちらに
-    
-            # 既にその人の出欠があるかチェック
-            att = Attendance.query.filter_by(event_id=event.id, name=request.form["name"]).first()
-    
-            if att:
-                # 既存の出欠を更新
-                att.status = status
-            else:
-                # 新規出欠を保存
-                att = Attendance(
-                    event_id=event.id,
-                    name=request.form["name"],
-                    status=status
-                )
-                db.session.add(att)
-    
-            db.session.commit()
-
-            # 参加人数を計算
-            event_att = Attendance.query.filter_by(event_id=event.id).all()
-            attend_count = len([a for a in event_att if a.status == "attend"])
-            absent_count = len([a for a in event_att if a.status == "absent"])
-            
-            #send_line_message(
-                #f"📝 参加登録\n"
-                #f"{request.form['name']} : {status}\n"
-                #f"現在の状況 → 参加 {attend_count} / 不参加 {absent_count}\n"
-                #f"{candidate.month}/{candidate.day} @ {candidate.gym} {candidate.start}〜{candidate.end}"
-            #)
-
-
-             # ---- メール送信（参加の場合）----
+            status = normalize_status(request.form["status"])   # 「未定」などは pending
+            name = request.form["name"]
+
+            # 確定（未確定なら自動作成）と出欠をそれぞれ 1 文の upsert で行い、commit は 1 回
+            # 同時に送信されても一意制約で 1 行にまとまる
+            event_id = upsert_confirmed(candidate_id)
+            # 変更前の status は upsert が行をロックして読んだもの（統計の増減に使う）
+            old_status = upsert_attendance(event_id, name, status)
+            member_stats.record([member_stats.Change(
+                name, event_id, candidate.event_date, candidate.gym, old_status, status
+            )])
+
+             # ---- メール送信（参加の場合）：出欠と同じトランザクションで outbox へ ----
             if status == "attend":
-                name = request.form["name"]              # ★ 重要：名前を確定
                 recipient_email = MEMBER_EMAILS.get(name)
             
                 if recipient_email:
-                    try:
-                        send_ics_via_sendgrid(candidate, name, recipient_email)
-                    except Exception as e:
-                        app.logger.error("ICS send failed: %s", e)
-                        app.logger.error(traceback.format_exc())
+                    enqueue_ics_email(candidate, name, recipient_email)
 
-            return redirect(url_for("register") + f"?month={candidate.month}")
+            db.session.commit()
+
+            return redirect(url_for("register", year=candidate.year, month=candidate.month))
+
+        # Confirmed が存在しない場合は自動作成（既にあれば読むだけで書き込まない）
+        event = Confirmed.query.filter_by(candidate_id=candidate_id).first()
+        if event:
+            event_id = event.id
+        else:
+            event_id = upsert_confirmed(candidate_id)
+            db.session.commit()
     
-        attendance = Attendance.query.filter_by(event_id=event.id).all()
+        attendance = Attendance.query.filter_by(event_id=event_id).all()
     
         return render_template(
             "register_form.html",
@@ -441,27 +616,62 @@ def create_app():
             times.append(f"{h:02d}:30")
         times = times[:-1]
         if request.method == "POST":
-            cand.year = int(request.form["year"])
-            cand.month = int(request.form["month"])
-            cand.day = int(request.form["day"])
-            cand.gym = request.form["gym"]
-            cand.start = request.form["start"]
-            cand.end = request.form["end"]
+            # 重なりの確認は変更を cand に入れる前に行う（途中の autoflush で未確定の値を読まないため）
+            edited = Candidate(
+                year=int(request.form["year"]),
+                month=int(request.form["month"]),
+                day=int(request.form["day"]),
+                gym=request.form["gym"],
+                start=request.form["start"],
+                end=request.form["end"],
+            )
+            error = schedule_error(edited)
+            if error:
+                return render_template("edit_candidate.html", cand=edited, cand_id=cand.id, gyms=gyms,
+                                       times=times, error=error), 400
+            conflicts = schedule_conflicts(edited, exclude_id=cand.id)
+            if conflicts:
+                return render_template("edit_candidate.html", cand=edited, cand_id=cand.id, gyms=gyms,
+                                       times=times, conflicts=conflicts), 409
+            changed = any(getattr(cand, f) != getattr(edited, f) for f in SCHEDULE_FIELDS)
+            # 確定済みで日付・体育館が変わるなら、出欠の統計を移し替える
+            moved = []
+            new_date = schedule_columns(edited.year, edited.month, edited.day, edited.start, edited.end)[0]
+            if (new_date, edited.gym) != (cand.event_date, cand.gym):
+                moved = member_stats.load_rows(Confirmed.candidate_id == cand.id)
+            for field in SCHEDULE_FIELDS:
+                setattr(cand, field, getattr(edited, field))
+            member_stats.record(member_stats.removed(moved) + [
+                member_stats.Change(r.name, r.event_id, new_date, edited.gym, None, r.status) for r in moved
+            ])
+            # 何も変わっていなければ通知しない（SEQUENCE も進まない）
+            confirmed = Confirmed.query.filter_by(candidate_id=cand.id).first() if changed else None
+            if confirmed:
+                enqueue_line_digest("changed", {"text": f"{cand.month}/{cand.day} {cand.gym}\n{cand.start}〜{cand.end}"})
+                # 参加者には更新後の ICS を 1 回の SendGrid リクエストでまとめて送る（SEQUENCE で予定が置き換わる）
+                attendees = Attendance.query.filter_by(event_id=confirmed.id, status="attend").all()
+                enqueue_ics_emails(cand, [(a.name, MEMBER_EMAILS.get(a.name)) for a in attendees])
             db.session.commit()
-            if Confirmed.query.filter_by(candidate_id=cand.id).first():
-                send_line_message(f"✏️ 確定日程が変更されました\n{cand.month}/{cand.day} {cand.gym}\n{cand.start}〜{cand.end}")
             return redirect(url_for("confirm"))
-        return render_template("edit_candidate.html", cand=cand, gyms=gyms, times=times)
+        return render_template("edit_candidate.html", cand=cand, cand_id=cand.id, gyms=gyms, times=times)
 
     @app.route("/candidate/<int:id>/delete", methods=["POST"])
     def delete_candidate(id):
         cand = Candidate.query.get_or_404(id)
+        removed = member_stats.removed(member_stats.load_rows(Confirmed.candidate_id == id))
         Attendance.query.filter(
             Attendance.event_id.in_(
                 db.session.query(Confirmed.id).filter_by(candidate_id=id)
             )
         ).delete(synchronize_session=False)
+        member_stats.record(removed)
+        ReminderLog.query.filter(
+            ReminderLog.event_id.in_(
+                db.session.query(Confirmed.id).filter_by(candidate_id=id)
+            )
+        ).delete(synchronize_session=False)
         Confirmed.query.filter_by(candidate_id=id).delete()
+        Availability.query.filter_by(candidate_id=id).delete()
         db.session.delete(cand)
         db.session.commit()
         return redirect(url_for("confirm"))
@@ -476,19 +686,26 @@ def create_app():
             raw_name = request.form.get("name", "").strip()
             raw_status = request.form.get("status", "").strip()
     
+            old_name, old_status = att.name, att.status
+
             # 名前の更新（そのまま保存）
-            if raw_name:
+            if raw_name and raw_name != att.name:
+                # (event_id, name) はユニーク。同じイベントに同名の出欠があれば弾く
+                dup = Attendance.query.filter_by(event_id=att.event_id, name=raw_name).first()
+                if dup:
+                    return "この名前の出欠は既に登録されています", 400
                 att.name = raw_name
     
             # ステータスを統一して保存（DB中は "attend"/"absent"/"pending"）
-            if raw_status in ["参加", "attend", "attending"]:
-                att.status = "attend"
-            elif raw_status in ["不参加", "欠席", "absent"]:
-                att.status = "absent"
-            else:
-                # 未回答／未定などは "pending" とする（テンプレ側で未回答表示）
-                att.status = "pending"
-    
+            att.status = normalize_status(raw_status)
+
+            candidate = att.event.candidate
+            member_stats.record([
+                member_stats.Change(old_name, att.event_id, candidate.event_date, candidate.gym, old_status, None),
+                member_stats.Change(att.name, att.event_id, candidate.event_date, candidate.gym, None, att.status),
+            ] if att.name != old_name else [
+                member_stats.Change(att.name, att.event_id, candidate.event_date, candidate.gym, old_status, att.status),
+            ])
             db.session.commit()
     
             # 編集元ページへ戻す（ユーザー用画面を維持）
@@ -498,45 +715,6 @@ def create_app():
         return render_template("edit_attendance.html", att=att, members=members)
 
 
-    # --- ADDED: ICS creation and Gmail send function
-    def make_ics(summary, description, location, dtstart_local: datetime, dtend_local: datetime, uid=None):
-        """
-        Create ICS string. Input datetimes must be timezone-aware in local tz.
-        We convert to UTC and produce Z-suffixed timestamps (widely compatible).
-        """
-        if uid is None:
-            uid = f"{uuid.uuid4()}@yourapp.local"
-
-        dtstart_utc = dtstart_local.astimezone(timezone.utc)
-        dtend_utc = dtend_local.astimezone(timezone.utc)
-        dtstamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-        dtstart_str = dtstart_utc.strftime("%Y%m%dT%H%M%SZ")
-        dtend_str = dtend_utc.strftime("%Y%m%dT%H%M%SZ")
-
-        def esc(s: str):
-            return s.replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
-
-        s = esc(summary); d = esc(description); l = esc(location)
-
-        ics = (
-            "BEGIN:VCALENDAR\r\n"
-            "PRODID:-//YourApp//EN\r\n"
-            "VERSION:2.0\r\n"
-            "CALSCALE:GREGORIAN\r\n"
-            "METHOD:REQUEST\r\n"
-            "BEGIN:VEVENT\r\n"
-            f"UID:{uid}\r\n"
-            f"DTSTAMP:{dtstamp}\r\n"
-            f"DTSTART:{dtstart_str}\r\n"
-            f"DTEND:{dtend_str}\r\n"
-            f"SUMMARY:{s}\r\n"
-            f"DESCRIPTION:{d}\r\n"
-            f"LOCATION:{l}\r\n"
-            "END:VEVENT\r\n"
-            "END:VCALENDAR\r\n"
-        )
-        return ics
-
     def make_google_calendar_link(title, details, location, start_local: datetime, end_local: datetime):
         """
         Create a Google Calendar 'quick add' link (prefilled event).
@@ -555,227 +733,125 @@ def create_app():
         )
         return base + params
 
-    import base64
-    import pytz
-    from sendgrid import SendGridAPIClient
-    from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
-    
-    
-    def send_ics_via_sendgrid(candidate, recipient_name, recipient_email, local_tz="Asia/Tokyo"):
-        """
-        SendGrid を使って iPhone / Google / Outlook で必ず開ける ICS を送信する
-        """
-    
-        # ==========
-        # 1)  ローカル時刻 → aware datetime
-        # ==========
-        tz = pytz.timezone(local_tz)
-    
-        dt_start = tz.localize(datetime(
-            candidate.year,
-            candidate.month,
-            candidate.day,
-            int(candidate.start.split(":")[0]),
-            int(candidate.start.split(":")[1])
-        ))
-    
-        dt_end = tz.localize(datetime(
-            candidate.year,
-            candidate.month,
-            candidate.day,
-            int(candidate.end.split(":")[0]),
-            int(candidate.end.split(":")[1])
-        ))
-    
-        # ==========
-        # 2)  iPhone 互換の ICS を生成（完全版）
-        #    Apple は UTC(Z) と METHOD:REQUEST が必須
-        # ==========
-        dtstamp_utc = dt_start.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
-        start_utc = dt_start.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
-        end_utc = dt_end.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
-    
-        uid = f"{candidate.id}-{start_utc}@event-app.local"
-
-        start_str = dt_start.strftime("%H:%M")
-        end_str = dt_end.strftime("%H:%M")
-
-        ics_content = (
-            "BEGIN:VCALENDAR\r\n"
-            "VERSION:2.0\r\n"
-            "CALSCALE:GREGORIAN\r\n"
-            "METHOD:REQUEST\r\n"
-            "PRODID:-//EventApp//JP\r\n"
-            "BEGIN:VEVENT\r\n"
-            "UID:{uid}\r\n"
-            "DTSTAMP:{dtstamp_utc}\r\n"
-            "DTSTART:{start_utc}\r\n"
-            "DTEND:{end_utc}\r\n"
-            "SUMMARY:{location} ({start_str}〜{end_str})\r\n"
-            "DESCRIPTION:{recipient_name} さんの参加登録です\r\n"
-            "LOCATION:{location}\r\n"
-            "STATUS:CONFIRMED\r\n"
-            "SEQUENCE:0\r\n"
-            "END:VEVENT\r\n"
-            "END:VCALENDAR\r\n"
-        ).format(
-            uid=uid,
-            dtstamp_utc=dtstamp_utc,
-            start_utc=start_utc,
-            end_utc=end_utc,
-            recipient_name=recipient_name,
-            location=candidate.gym,
-            start_str=start_str,
-            end_str=end_str
-        )
-    
-        # ==========
-        # 3) Base64 エンコード（SendGrid 必須）
-        # ==========
-        encoded = base64.b64encode(ics_content.encode("utf-8")).decode()
-    
-        # ==========
-        # 4) SendGrid メール作成
-        # ==========
-        message = Mail(
-            from_email=(os.environ["FROM_EMAIL"], os.environ.get("FROM_NAME", "Event App")),
-            to_emails=recipient_email,
-            subject=f"【参加登録】カレンダーに追加できます",
-            html_content=f"""
-                <p>{recipient_name} さん、参加登録ありがとうございます。</p>
-                <p>カレンダーに追加できる .ics ファイルを添付しています。</p>
-                <p>iPhone・Google・Outlook 全てに対応しています。</p>
-            """
-        )
-    
-        # 添付ファイル
-        attachment = Attachment()
-        attachment.file_content = FileContent(encoded)
-        attachment.file_type = FileType("text/calendar")
-        attachment.file_name = FileName("event.ics")
-        attachment.disposition = Disposition("attachment")
-    
-        message.attachment = attachment
-    
-        # ==========
-        # 5) SendGrid 送信
-        # ==========
-        try:
-            sg = SendGridAPIClient(os.environ["SENDGRID_API_KEY"])
-            response = sg.send(message)
-            print("SendGrid Response:", response.status_code)
-            return True
-        except Exception as e:
-            print("SendGrid Error:", e)
-            return False
-    # === LINE Messaging API 送信用共通関数 ===
-    def send_line_message(text):
-        try:
-            line_bot_api = LineBotApi(os.environ.get("LINE_CHANNEL_ACCESS_TOKEN"))
-            to_id = os.environ.get("LINE_GROUP_ID")   # グループ or 個人
-            line_bot_api.push_message(to_id, TextSendMessage(text=text))
-        except Exception as e:
-            print("LINE Error:", e)
-                
-    # 体育館ごとの集合時間（開始時間からのマイナス分）
-    MEETING_OFFSET_MINUTES = {
-        "中平井": 15,
-        "平井": 30,
-        "西小岩": 40,
-        "北小岩": 45,
-        "南小岩": 45,
-    }
-    
-    def send_reminder_for_tomorrow():
-        tomorrow = datetime.now(LOCAL_TZ).date() + timedelta(days=1)
-        events = (
-            db.session.query(Confirmed, Candidate)
-            .join(Candidate, Confirmed.candidate_id == Candidate.id)
-            .filter(
-                Candidate.year == tomorrow.year,
-                Candidate.month == tomorrow.month,
-                Candidate.day == tomorrow.day
-            )
-            .all()
-        )
-    
-        for cnf, c in events:
-            att = Attendance.query.filter_by(event_id=cnf.id).all()
-            attend_members = [a.name for a in att if a.status == "attend"]
-    
-            # ---- 集合時間計算 ----
-            start_h, start_m = map(int, c.start.split(":"))
-            start_dt = datetime(
-                c.year, c.month, c.day,
-                start_h, start_m,
-                tzinfo=LOCAL_TZ
-            )
-    
-            offset = MEETING_OFFSET_MINUTES.get(c.gym, 30)  # デフォルト30分
-            meeting_dt = start_dt - timedelta(minutes=offset)
-            meeting_time_str = meeting_dt.strftime("%H:%M")
-    
-            send_line_message(
-                f"⏰ 明日はイベントです！\n"
-                f"{c.month}/{c.day} @ {c.gym} {c.start}〜{c.end}\n\n"
-                f"📣 {meeting_time_str}にメール室前集合です！\n\n"
-                f"参加予定: {len(attend_members)}名\n"
-                f"{', '.join(attend_members) if attend_members else 'まだ未登録'}"
-            )
-            
-    def send_reminder_for_one_week_before():
-        target_date = datetime.now(LOCAL_TZ).date() + timedelta(days=7)
-    
-        events = (
-            db.session.query(Confirmed, Candidate)
-            .join(Candidate, Confirmed.candidate_id == Candidate.id)
-            .filter(
-                Candidate.year == target_date.year,
-                Candidate.month == target_date.month,
-                Candidate.day == target_date.day
-            )
-            .all()
-        )
-
-        for cnf, c in events:
-            attendance = Attendance.query.filter_by(event_id=cnf.id).all()
-    
-            attend = [a.name for a in attendance if a.status == "attend"]
-            absent = [a.name for a in attendance if a.status == "absent"]
-            pending = [a.name for a in attendance if a.status == "pending"]
-    
-            send_line_message(
-                f"📣 参加登録リマインド（1週間前）\n"
-                f"{c.month}/{c.day} @ {c.gym} {c.start}〜{c.end}\n\n"
-                f"✅ 参加: {len(attend)}名\n"
-                f"❌ 不参加: {len(absent)}名\n"
-                f"❓ 未回答: {len(pending)}名\n\n"
-                f"まだの方は参加登録をお願いします👇\n"
-                f"{url_for('set_name', _external=True)}"
-            )
-            
     @app.route("/cron_reminder", methods=["POST"])
     def cron_reminder():
-        try:
-            send_reminder_for_one_week_before()   # ★ 追加
-            send_reminder_for_tomorrow()          # 既存
-            return {"status": "ok"}, 200
-        except Exception as e:
-            return {"status": "error", "message": str(e)}, 500
+        # 受け付けだけして即 202。実処理はバックグラウンドで行う
+        job = submit_reminder_job(app, url_for("set_name", _external=True))
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": url_for("cron_reminder_status", job_id=job.id, _external=True),
+        }, 202
+
+    @app.route("/cron_reminder/<job_id>", methods=["GET"])
+    @db_routing.primary
+    def cron_reminder_status(job_id):
+        job = db.session.get(ReminderJob, job_id)
+        if job is None:
+            return {"status": "error", "message": "job not found"}, 404
+        return job.to_dict(), 200
         
-    from flask import request
+    # ------------------------------
+    # 古いイベントのアーカイブ（cron から 1 日 1 回）と履歴表示
+    # ------------------------------
+    @app.route("/cron_archive", methods=["POST"])
+    def cron_archive():
+        # 1 回のリクエストで移す量は ARCHIVE_HTTP_MAX_BATCHES バッチまで（残りは次回）
+        max_batches = int(os.environ.get("ARCHIVE_HTTP_MAX_BATCHES", 10))
+        return archive_engine.archive_events(max_batches=max_batches), 200
+
+    @app.route("/history", methods=["GET"])
+    def history():
+        page = request.args.get("page", 1, type=int)
+        if page < 1:
+            abort(404)
+        events, has_next = archive_engine.read_history(page)
+        return render_template("history.html", events=events, page=page, has_next=has_next)
+
+    @app.route("/stats", methods=["GET"])
+    def stats():
+        # 集計済みの member_stats / member_streaks だけを読む（出欠の履歴は読まない）
+        members, months = member_stats.read_stats()
+        gyms = sorted({gym for m in members for gym in m["gyms"]})
+        return render_template("stats.html", members=members, months=months, gyms=gyms)
+
+    # ------------------------------
+    # 履歴のエクスポート（?from=YYYY-MM-DD&to=YYYY-MM-DD&member=名前 で絞り込み）
+    # ------------------------------
+    def export_response(iter_rows, mimetype, filename):
+        try:
+            date_from, date_to, members = export.parse_filters(request.args)
+        except ValueError:
+            return "from / to は YYYY-MM-DD で指定してください", 400
+
+        chunks = iter_rows(date_from, date_to, members)
+        gzipped = request.accept_encodings["gzip"] > 0
+        body = export.gzip_stream(chunks) if gzipped else (c.encode("utf-8") for c in chunks)
+        # 行を読みながら返す（リクエストのコンテキストとセッションを最後まで保つ）
+        resp = Response(stream_with_context(body), mimetype=mimetype)
+        resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        resp.vary.add("Accept-Encoding")
+        if gzipped:
+            resp.headers["Content-Encoding"] = "gzip"
+        return resp
+
+    @app.route("/export/attendance.csv", methods=["GET"])
+    def export_attendance_csv():
+        return export_response(export.iter_attendance_csv, "text/csv; charset=utf-8", "attendance.csv")
+
+    @app.route("/export/events.jsonl", methods=["GET"])
+    def export_events_jsonl():
+        return export_response(export.iter_events_jsonl, "application/x-ndjson; charset=utf-8", "events.jsonl")
+
+    # ------------------------------
+    # 購読用カレンダー（ETag / If-Modified-Since で 304 を返す）
+    # ------------------------------
+    @app.route("/calendar/<member>.ics", methods=["GET"])
+    def calendar_ics(member):
+        if member != "all" and member not in MEMBER_EMAILS:
+            abort(404)
+        feed = get_feed(None if member == "all" else member, LOCAL_TZ)
+
+        resp = Response(feed.body, mimetype="text/calendar")
+        resp.set_etag(feed.etag)
+        resp.last_modified = feed.last_modified
+        resp.cache_control.no_cache = True   # 毎回再検証させる（304 なら本文なし）
+        return resp.make_conditional(request)
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
     @app.route("/line_webhook", methods=["POST"])
     def line_webhook():
-        body = request.get_data(as_text=True)
-        print("LINE Webhook received:", body)
+        # 署名を検証して保存するだけですぐ 200 を返す（出欠の登録はワーカーが行う）
+        if not os.environ.get("LINE_CHANNEL_SECRET"):
+            app.logger.error("LINE_CHANNEL_SECRET is not set")
+            return "webhook is not configured", 500
+        body = request.get_data()
+        if not line_webhook_queue.verify_signature(body, request.headers.get("X-Line-Signature")):
+            return "invalid signature", 400
+        try:
+            line_webhook_queue.store_events(body)
+        except ValueError:
+            return "invalid body", 400
+        db.session.commit()
         return "OK", 200
 
 
-    # DB create
-    with app.app_context():
-        db.create_all()
+    timings["routes_ms"] = (time.perf_counter() - started) * 1000 - timings["config_ms"]
 
-    return app
+    # 通知の送信ワーカー（別プロセスで dispatcher.py を動かす場合は OUTBOX_DISPATCHER=off）
+    if start_workers and os.environ.get("OUTBOX_DISPATCHER", "thread") == "thread":
+        start_dispatcher_thread(app)
+        line_webhook_queue.start_worker_thread(app)
 
-app = create_app()
+    # 起動時間レポート（Render のログでコールドスタートを比較する）
+    timings["create_app_ms"] = (time.perf_counter() - started) * 1000
+    app.config["STARTUP_TIMINGS"] = timings
+    app.logger.info(
+        "startup pid=%s import=%.1fms config=%.1fms routes=%.1fms create_app=%.1fms",
+        os.getpid(), timings["import_ms"], timings["config_ms"], timings["routes_ms"], timings["create_app_ms"],
+    )
+
+    return app
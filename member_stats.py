@@ -0,0 +1,238 @@
+# member_stats.py
+# メンバーごとの出欠統計（member_stats / member_streaks）を出欠の変更に合わせて更新する
+#
+# - 件数はメンバー × 月 × 体育館 ごとの増減（+1 / -1）を 1 文の upsert で足し込む
+# - 連続参加は「日付順で最後に数えた回答より後のイベントへの新しい回答」なら読み直さずに更新し、
+#   それ以外（過去の回答の変更・削除）のときだけ、そのメンバーの履歴を数え直す
+#   member_streaks の行は FOR UPDATE でロックしてから読み書きする
+# - 出欠を変える処理は、変更前の行を load_rows で読み、変更後に record(changes) を呼ぶ
+#   （commit は呼び出し側。出欠と統計は同じトランザクションで確定する）
+# - 値がずれた・過去分を入れたいときは rebuild()（python rebuild_stats.py）で作り直す
+# アーカイブ済みの出欠も履歴に含める（アーカイブで統計は変わらない）
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import delete, select, union_all
+
+from models import (
+    db, Candidate, Confirmed, Attendance, ArchivedCandidate, ArchivedAttendance,
+    MemberStat, MemberStreak,
+)
+from attendance_service import dialect_insert
+
+STATUSES = ("attend", "absent", "pending")
+COUNT_COLUMNS = {s: f"{s}_count" for s in STATUSES}
+
+# old / new は変更前後の status（新規なら old=None、削除なら new=None）
+Change = namedtuple("Change", "name event_id event_date gym old new")
+Row = namedtuple("Row", "id name event_id event_date gym status")
+
+
+def load_rows(*criteria):
+    """変更前の出欠を、イベントの日付・体育館つきで 1 クエリで読む"""
+    q = (
+        db.session.query(Attendance.id, Attendance.name, Attendance.event_id,
+                         Candidate.event_date, Candidate.gym, Attendance.status)
+        .join(Confirmed, Attendance.event_id == Confirmed.id)
+        .join(Candidate, Confirmed.candidate_id == Candidate.id)
+        .filter(*criteria)
+    )
+    return [Row(*r) for r in q]
+
+
+def removed(rows):
+    return [Change(r.name, r.event_id, r.event_date, r.gym, r.status, None) for r in rows]
+
+
+def record(changes):
+    """出欠の変更を統計に反映する（commit は呼び出し側）"""
+    changes = [c for c in changes if c.old != c.new and c.event_date is not None]
+    if not changes:
+        return
+    _apply_counts(changes)
+    _apply_streaks(changes)
+
+
+def _apply_counts(changes):
+    deltas = {}
+    for c in changes:
+        key = (c.name, c.event_date.year, c.event_date.month, c.gym or "")
+        d = deltas.setdefault(key, dict.fromkeys(STATUSES, 0))
+        if c.old in d:
+            d[c.old] -= 1
+        if c.new in d:
+            d[c.new] += 1
+
+    now = datetime.utcnow()
+    stmt = dialect_insert(MemberStat).values([
+        {"name": name, "year": year, "month": month, "gym": gym, "updated_at": now,
+         **{COUNT_COLUMNS[s]: n for s, n in d.items()}}
+        for (name, year, month, gym), d in deltas.items()
+    ])
+    table = MemberStat.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MemberStat.name, MemberStat.year, MemberStat.month, MemberStat.gym],
+        set_={
+            **{col: table.c[col] + stmt.excluded[col] for col in COUNT_COLUMNS.values()},
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def _apply_streaks(changes):
+    # 連続参加に関係するのは「参加」「不参加」だけ
+    changes = [c for c in changes if {c.old, c.new} & {"attend", "absent"}]
+    if not changes:
+        return
+    names = sorted({c.name for c in changes})
+    # 行がなければ作ってから FOR UPDATE で読む（同じメンバーの同時の回答で増分を失わない）
+    # まだ行がなかった（rebuild 前の）メンバーは履歴から数える
+    now = datetime.utcnow()
+    recount = set(db.session.execute(
+        dialect_insert(MemberStreak).values([
+            {"name": name, "current_streak": 0, "longest_streak": 0, "updated_at": now} for name in names
+        ])
+        .on_conflict_do_nothing(index_elements=[MemberStreak.name])
+        .returning(MemberStreak.name)
+    ).scalars())
+    streaks = {
+        s.name: s for s in MemberStreak.query.filter(MemberStreak.name.in_(names))
+        .with_for_update().populate_existing()
+    }
+
+    for c in sorted(changes, key=lambda c: (c.event_date, c.event_id)):
+        s = streaks[c.name]
+        is_new_last = c.old not in ("attend", "absent") and (
+            s.last_event_date is None or (c.event_date, c.event_id) > (s.last_event_date, s.last_event_id)
+        )
+        if c.name in recount or not is_new_last:
+            recount.add(c.name)
+            continue
+        # 最後の回答より後のイベントへの新しい回答：末尾に 1 つ足すだけ
+        s.current_streak = s.current_streak + 1 if c.new == "attend" else 0
+        s.longest_streak = max(s.longest_streak, s.current_streak)
+        s.last_event_date, s.last_event_id = c.event_date, c.event_id
+        s.updated_at = datetime.utcnow()
+
+    for name in recount:
+        _set_streak(streaks[name], _history(name))
+
+
+def _history_query(name=None):
+    """(name, event_date, event_id, status) を名前・日付順に返す（稼働中 + アーカイブ、参加/不参加のみ）"""
+    live = (
+        select(Attendance.name, Candidate.event_date, Attendance.event_id, Attendance.status)
+        .join(Confirmed, Attendance.event_id == Confirmed.id)
+        .join(Candidate, Confirmed.candidate_id == Candidate.id)
+        .where(Attendance.status.in_(("attend", "absent")))
+    )
+    archived = (
+        select(ArchivedAttendance.name, ArchivedCandidate.event_date, ArchivedAttendance.event_id,
+               ArchivedAttendance.status)
+        .join(ArchivedCandidate, ArchivedAttendance.event_id == ArchivedCandidate.confirmed_id)
+        .where(ArchivedAttendance.status.in_(("attend", "absent")))
+    )
+    if name is not None:
+        live = live.where(Attendance.name == name)
+        archived = archived.where(ArchivedAttendance.name == name)
+    u = union_all(live, archived).subquery()
+    return select(u).order_by(u.c.name, u.c.event_date, u.c.event_id)
+
+
+def _history(name):
+    return db.session.execute(_history_query(name)).all()
+
+
+def _set_streak(streak, history):
+    current = longest = 0
+    last = None
+    for row in history:
+        current = current + 1 if row.status == "attend" else 0
+        longest = max(longest, current)
+        last = row
+    streak.current_streak, streak.longest_streak = current, longest
+    streak.last_event_date = last.event_date if last else None
+    streak.last_event_id = last.event_id if last else None
+    streak.updated_at = datetime.utcnow()
+
+
+def rebuild(batch_size=1000):
+    """
+    統計を履歴から作り直す（commit まで行う）。履歴は yield_per で流しながら数える
+    returns: {"members": 人数, "stat_rows": 件数の行数}
+    """
+    db.session.execute(delete(MemberStat))
+    db.session.execute(delete(MemberStreak))
+
+    # 件数：メンバー × 月 × 体育館 ごとに数える（メモリに持つのは集計後の行だけ）
+    live = (
+        select(Attendance.name, Candidate.event_date, Candidate.gym, Attendance.status)
+        .join(Confirmed, Attendance.event_id == Confirmed.id)
+        .join(Candidate, Confirmed.candidate_id == Candidate.id)
+    )
+    archived = (
+        select(ArchivedAttendance.name, ArchivedCandidate.event_date, ArchivedCandidate.gym,
+               ArchivedAttendance.status)
+        .join(ArchivedCandidate, ArchivedAttendance.event_id == ArchivedCandidate.confirmed_id)
+    )
+    u = union_all(live, archived).subquery()
+    counts = {}
+    for name, event_date, gym, status in db.session.execute(
+        select(u.c.name, u.c.event_date, u.c.gym, u.c.status).execution_options(yield_per=batch_size)
+    ):
+        if event_date is None or status not in COUNT_COLUMNS:
+            continue
+        key = (name, event_date.year, event_date.month, gym or "")
+        counts.setdefault(key, dict.fromkeys(COUNT_COLUMNS.values(), 0))[COUNT_COLUMNS[status]] += 1
+
+    now = datetime.utcnow()
+    rows = [
+        {"name": name, "year": year, "month": month, "gym": gym, "updated_at": now, **c}
+        for (name, year, month, gym), c in counts.items()
+    ]
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(MemberStat.__table__.insert(), rows[i:i + batch_size])
+
+    # 連続参加：名前・日付順に 1 回流すだけ
+    members = 0
+    history = db.session.execute(_history_query().execution_options(yield_per=batch_size))
+    for name, member_rows in groupby(history, key=lambda r: r.name):
+        streak = MemberStreak(name=name)
+        _set_streak(streak, member_rows)
+        db.session.add(streak)
+        members += 1
+
+    db.session.commit()
+    return {"members": members, "stat_rows": len(rows)}
+
+
+def read_stats():
+    """
+    /stats 用：集計済みの行だけから、メンバーごとの合計・体育館別・月別を組み立てる
+    returns: (members, months)
+      members = [{name, attend, absent, pending, rate, current_streak, longest_streak, gyms: {gym: 参加数}}, ...]
+      months  = [((year, month), {name: 参加数}), ...]（新しい月から）
+    """
+    members = {}
+    months = {}
+    for s in MemberStat.query.order_by(MemberStat.name, MemberStat.year, MemberStat.month):
+        m = members.setdefault(s.name, {"name": s.name, "attend": 0, "absent": 0, "pending": 0, "gyms": {}})
+        m["attend"] += s.attend_count
+        m["absent"] += s.absent_count
+        m["pending"] += s.pending_count
+        m["gyms"][s.gym] = m["gyms"].get(s.gym, 0) + s.attend_count
+        per_month = months.setdefault((s.year, s.month), {})
+        per_month[s.name] = per_month.get(s.name, 0) + s.attend_count
+
+    streaks = {s.name: s for s in MemberStreak.query}
+    for m in members.values():
+        answered = m["attend"] + m["absent"]
+        m["rate"] = round(m["attend"] * 100 / answered) if answered else None
+        s = streaks.get(m["name"])
+        m["current_streak"] = s.current_streak if s else 0
+        m["longest_streak"] = s.longest_streak if s else 0
+
+    return (sorted(members.values(), key=lambda m: m["name"]),
+            sorted(months.items(), reverse=True))
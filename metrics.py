@@ -0,0 +1,209 @@
+# metrics.py
+# リクエスト・SQL・外部 API 呼び出しの計測と /metrics（Prometheus テキスト形式）
+#
+# - リクエストごとのレイテンシ（ヒストグラム）と SQL 発行数・所要時間をエンドポイント別に集計
+# - LINE / SendGrid 呼び出しのレイテンシとエラー数（clients.timed から記録）
+# - 各ワーカーは METRICS_DIR/<pid>.json に定期的に書き出し、/metrics は全ファイルを合算する
+# - SLOW_REQUEST_MS を超えたリクエストは、時間のかかった SQL 上位とともにログに出す
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(tempfile.gettempdir(), "event-app-metrics"))
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 2))
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "http_requests_total": ("counter", "Requests by endpoint and status"),
+    "db_statements_total": ("counter", "SQL statements executed, by endpoint"),
+    "db_statement_seconds_total": ("counter", "Time spent in SQL, by endpoint"),
+    "outbound_request_duration_seconds": ("histogram", "LINE / SendGrid call latency"),
+    "outbound_errors_total": ("counter", "Failed LINE / SendGrid calls"),
+    "line_webhook_events_total": ("counter", "Processed LINE webhook events, by result"),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf, sum]
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, labels, amount=1):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + amount
+
+
+def observe(name, labels, seconds):
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[len(BUCKETS)] += 1          # +Inf（= count）
+        h[len(BUCKETS) + 1] += seconds
+
+
+# ------------------------------
+# SQL 計測（リクエスト中の文だけ集める）
+# ------------------------------
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context() and hasattr(g, "metrics_sql"):
+        g.metrics_sql.append((elapsed, statement))
+
+
+# ------------------------------
+# リクエスト計測
+# ------------------------------
+def init_app(app):
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = []
+
+    @app.after_request
+    def _record(response):
+        started = getattr(g, "metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "unknown"
+        sql = g.metrics_sql
+        sql_seconds = sum(t for t, _ in sql)
+
+        observe("http_request_duration_seconds", {"endpoint": endpoint}, elapsed)
+        inc("http_requests_total", {"endpoint": endpoint, "method": request.method,
+                                    "status": str(response.status_code)})
+        inc("db_statements_total", {"endpoint": endpoint}, len(sql))
+        inc("db_statement_seconds_total", {"endpoint": endpoint}, sql_seconds)
+
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            top = sorted(sql, key=lambda x: x[0], reverse=True)[:3]
+            logger.warning(
+                "slow request endpoint=%s %.1fms sql=%d (%.1fms) top: %s",
+                endpoint, elapsed * 1000, len(sql), sql_seconds * 1000,
+                " | ".join(f"{t * 1000:.1f}ms {' '.join(s.split())[:120]}" for t, s in top),
+            )
+        flush()
+        return response
+
+
+# ------------------------------
+# ワーカー間の集約
+# ------------------------------
+def _snapshot():
+    with _lock:
+        return {
+            "counters": [[n, dict(l), v] for (n, l), v in _counters.items()],
+            "histograms": [[n, dict(l), list(h)] for (n, l), h in _histograms.items()],
+        }
+
+
+def flush(force=False):
+    """このプロセスの値を METRICS_DIR/<pid>.json に書き出す（METRICS_FLUSH_SECONDS ごと）"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_FLUSH_SECONDS:
+        return
+    _last_flush = now
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("metrics flush failed: %s", e)
+
+
+def _collect():
+    """全ワーカーのスナップショットを合算する"""
+    flush(force=True)
+    snapshots = []
+    try:
+        names = [n for n in os.listdir(METRICS_DIR) if n.endswith(".json")]
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    if not snapshots:
+        snapshots = [_snapshot()]
+
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for n, labels, v in snap["counters"]:
+            k = _key(n, labels)
+            counters[k] = counters.get(k, 0) + v
+        for n, labels, h in snap["histograms"]:
+            k = _key(n, labels)
+            acc = histograms.setdefault(k, [0] * len(h))
+            for i, v in enumerate(h):
+                acc[i] += v
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    counters, histograms = _collect()
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_fmt_labels(labels)} {v}")
+        else:
+            for (n, labels), h in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for i, bound in enumerate(BUCKETS):
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {h[i]}")
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h[len(BUCKETS)]}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {h[len(BUCKETS) + 1]}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {h[len(BUCKETS)]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,118 @@
+# migrate_db.py
+# 既存DBを最新スキーマに合わせる（何度実行しても安全）
+#  - candidates に event_date / starts_at / ends_at 列を追加して既存行を埋める
+#  - candidates に sequence / updated_at 列、cron_logs に duration_ms 列、
+#    line_webhook_events に attempts / last_error 列を追加
+#  - confirmed.candidate_id / attendance(event_id, name) の重複を整理してユニーク化
+#  - models.py で定義したインデックスを作成（attendance / archived_attendance の name を含む）
+#  - member_stats が空なら出欠の履歴から統計を作る（導入前の出欠を変えたときに件数が負にならないように）
+from sqlalchemy import func, inspect, text
+
+from main import create_app
+from models import db, Candidate, Confirmed, Attendance, ArchivedAttendance, MemberStat
+import member_stats
+
+NEW_COLUMNS = [
+    ("candidates", "event_date", "DATE"),
+    ("candidates", "starts_at", "TIMESTAMP"),
+    ("candidates", "ends_at", "TIMESTAMP"),
+    ("candidates", "sequence", "INTEGER NOT NULL DEFAULT 0"),
+    ("candidates", "updated_at", "TIMESTAMP"),
+    ("cron_logs", "duration_ms", "INTEGER"),
+    ("line_webhook_events", "attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("line_webhook_events", "last_error", "TEXT"),
+]
+
+
+def add_missing_columns():
+    insp = inspect(db.engine)
+    existing = {}
+    with db.engine.begin() as conn:
+        for table, name, ddl in NEW_COLUMNS:
+            if table not in existing:
+                existing[table] = {c["name"] for c in insp.get_columns(table)}
+            if name not in existing[table]:
+                print(f"  ADD COLUMN {table}.{name}")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def backfill_schedule():
+    rows = Candidate.query.filter(Candidate.event_date.is_(None)).all()
+    for c in rows:
+        c.sync_schedule()
+    db.session.commit()
+    print(f"  backfilled {len(rows)} candidates")
+
+
+def dedupe_confirmed():
+    # 同じ候補に複数の確定がある場合は最古の 1 件に寄せる
+    dups = (
+        db.session.query(Confirmed.candidate_id, func.min(Confirmed.id))
+        .group_by(Confirmed.candidate_id)
+        .having(func.count(Confirmed.id) > 1)
+        .all()
+    )
+    for candidate_id, keep_id in dups:
+        drop_ids = [
+            cid for (cid,) in db.session.query(Confirmed.id)
+            .filter(Confirmed.candidate_id == candidate_id, Confirmed.id != keep_id)
+        ]
+        Attendance.query.filter(Attendance.event_id.in_(drop_ids)).update(
+            {Attendance.event_id: keep_id}, synchronize_session=False
+        )
+        Confirmed.query.filter(Confirmed.id.in_(drop_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    print(f"  merged {len(dups)} duplicated confirmed rows")
+
+
+def dedupe_attendance():
+    # 同じイベント・同じ名前の出欠は最新（id が最大）の 1 件だけ残す
+    dups = (
+        db.session.query(Attendance.event_id, Attendance.name, func.max(Attendance.id))
+        .group_by(Attendance.event_id, Attendance.name)
+        .having(func.count(Attendance.id) > 1)
+        .all()
+    )
+    for event_id, name, keep_id in dups:
+        Attendance.query.filter(
+            Attendance.event_id == event_id,
+            Attendance.name == name,
+            Attendance.id != keep_id,
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    print(f"  removed duplicates for {len(dups)} (event, name) pairs")
+
+
+def create_indexes():
+    insp = inspect(db.engine)
+    for model in (Candidate, Confirmed, Attendance, ArchivedAttendance):
+        # まだ無いテーブル（init_db.py で作る）はインデックスごと作られるので飛ばす
+        if not insp.has_table(model.__tablename__):
+            continue
+        for index in model.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def backfill_member_stats():
+    # 統計は出欠の変更ごとの増減なので、導入時に既存の出欠から作っておく
+    if db.session.query(MemberStat.id).first() is not None:
+        print("  member_stats already populated")
+        return
+    print(f"  rebuilt member stats: {member_stats.rebuild()}")
+
+
+def migrate():
+    print("Migrating schema...")
+    add_missing_columns()
+    backfill_schedule()
+    dedupe_confirmed()
+    dedupe_attendance()
+    create_indexes()
+    backfill_member_stats()
+    print("Done.")
+
+
+if __name__ == "__main__":
+    app = create_app(start_workers=False)
+    with app.app_context():
+        migrate()
@@ -1,8 +1,11 @@
 # models.py
+import json
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from db_routing import RoutingSession
+from datetime import datetime, date, time
 
-db = SQLAlchemy()
+# 読み取りをレプリカに振り分けられるセッション（db_routing.py）
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class Candidate(db.Model):
     __tablename__ = "candidates"
@@ -13,7 +16,61 @@ class Candidate(db.Model):
     gym = db.Column(db.String(255))
     start = db.Column(db.String(50))
     end = db.Column(db.String(50))
+    # year/month/day/start/end から自動計算（ローカル時刻・tz なし）
+    # 並び替え・日付検索はこちらのインデックスを使う
+    event_date = db.Column(db.Date)
+    starts_at = db.Column(db.DateTime)
+    ends_at = db.Column(db.DateTime)
+    # 日時・場所が変わるたびに +1（カレンダーの SEQUENCE に使う）
+    sequence = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_candidates_event_date_starts_at", "event_date", "starts_at"),
+    )
+
+    def sync_schedule(self):
+        """year/month/day/start/end から event_date/starts_at/ends_at を埋める"""
+        self.event_date, self.starts_at, self.ends_at = schedule_columns(
+            self.year, self.month, self.day, self.start, self.end
+        )
+
+
+def parse_hhmm(value):
+    """'18:30' -> time(18, 30)。空なら None"""
+    if not value:
+        return None
+    h, m = map(int, value.split(":")[:2])
+    return time(h, m)
+
+
+def schedule_columns(year, month, day, start, end):
+    """(event_date, starts_at, ends_at) を返す。不正な日付は ValueError"""
+    d = date(int(year), int(month), int(day))
+    start_t = parse_hhmm(start)
+    end_t = parse_hhmm(end)
+    starts_at = datetime.combine(d, start_t) if start_t else None
+    ends_at = datetime.combine(d, end_t) if end_t else None
+    return d, starts_at, ends_at
+
+
+SCHEDULE_FIELDS = ("year", "month", "day", "gym", "start", "end")
+
+
+@db.event.listens_for(Candidate, "before_insert")
+def _sync_candidate_schedule(mapper, connection, target):
+    target.sync_schedule()
+
+
+@db.event.listens_for(Candidate, "before_update")
+def _sync_candidate_schedule_on_update(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if any(attrs[f].history.has_changes() for f in SCHEDULE_FIELDS):
+        target.sync_schedule()
+        target.sequence = (target.sequence or 0) + 1
+        target.updated_at = datetime.utcnow()
+
 
 class Confirmed(db.Model):
     __tablename__ = "confirmed"
@@ -23,6 +80,11 @@ class Confirmed(db.Model):
 
     candidate = db.relationship("Candidate")
 
+    __table_args__ = (
+        # 1 候補につき確定は 1 件だけ
+        db.Index("uq_confirmed_candidate_id", "candidate_id", unique=True),
+    )
+
 class Attendance(db.Model):
     __tablename__ = "attendance"
     id = db.Column(db.Integer, primary_key=True)
@@ -33,9 +95,209 @@ class Attendance(db.Model):
 
     event = db.relationship("Confirmed")
 
+    __table_args__ = (
+        # 1 イベントにつき 1 人 1 件。event_id 単体の検索もこのインデックスで賄う
+        db.Index("uq_attendance_event_name", "event_id", "name", unique=True),
+        # 連続参加を 1 人分だけ数え直すとき用（member_stats.py）
+        db.Index("ix_attendance_name", "name"),
+    )
+
+class Availability(db.Model):
+    """未確定の候補日にメンバーが付けた「行ける / 行けない」（availability.py で候補の順位付けに使う）"""
+    __tablename__ = "availabilities"
+    id = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey("candidates.id", ondelete="CASCADE"), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    available = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 1 候補につき 1 人 1 件。candidate_id 単体の検索もこのインデックスで賄う
+        db.Index("uq_availabilities_candidate_name", "candidate_id", "name", unique=True),
+    )
+
+class MemberStat(db.Model):
+    """
+    メンバー × 月 × 体育館 の出欠件数（member_stats.py が出欠の変更ごとに増減させる）
+    /stats はこの表と member_streaks だけを読む
+    """
+    __tablename__ = "member_stats"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    gym = db.Column(db.String(255), nullable=False)
+    attend_count = db.Column(db.Integer, nullable=False, default=0)
+    absent_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("uq_member_stats_name_month_gym", "name", "year", "month", "gym", unique=True),
+    )
+
+class MemberStreak(db.Model):
+    """
+    メンバーごとの連続参加（日付順に並べた「参加」「不参加」の回答のうち末尾から続く「参加」の数）
+    last_event_* は最後に数えた回答。これより後のイベントへの新しい回答なら読み直さずに更新できる
+    """
+    __tablename__ = "member_streaks"
+    name = db.Column(db.String(255), primary_key=True)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_event_date = db.Column(db.Date)
+    last_event_id = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 class CronLog(db.Model):
     __tablename__ = "cron_logs"
     id = db.Column(db.Integer, primary_key=True)
     executed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    status = db.Column(db.String(20), nullable=False)  # success / failed
+    status = db.Column(db.String(20), nullable=False)  # success / partial / failed / skipped
     message = db.Column(db.Text)
+    duration_ms = db.Column(db.Integer)
+
+class ReminderLog(db.Model):
+    """送信済みリマインド（イベント × 何日前）。再実行時の二重送信防止用"""
+    __tablename__ = "reminder_logs"
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey("confirmed.id", ondelete="CASCADE"), nullable=False)
+    offset_days = db.Column(db.Integer, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("uq_reminder_logs_event_offset", "event_id", "offset_days", unique=True),
+    )
+
+class NotificationOutbox(db.Model):
+    """LINE / SendGrid 送信待ちキュー。状態変更と同じトランザクションで書き込む"""
+    __tablename__ = "notification_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # line / line_digest / ics_email
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending / sent / dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_notification_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+class EmailDelivery(db.Model):
+    """ICS メールの宛先ごとの送信結果（1 つの outbox 行 = 1 回の SendGrid リクエストに複数宛先）"""
+    __tablename__ = "email_deliveries"
+    id = db.Column(db.Integer, primary_key=True)
+    outbox_id = db.Column(db.Integer, db.ForeignKey("notification_outbox.id", ondelete="CASCADE"), nullable=False)
+    candidate_id = db.Column(db.Integer, nullable=False)
+    recipient_name = db.Column(db.String(255))
+    recipient_email = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending / sent / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    message_id = db.Column(db.String(255))  # SendGrid の X-Message-Id
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    outbox = db.relationship("NotificationOutbox")
+
+    __table_args__ = (
+        db.Index("ix_email_deliveries_outbox_id", "outbox_id"),
+        db.Index("ix_email_deliveries_candidate_id", "candidate_id"),
+    )
+
+class ReminderJob(db.Model):
+    """/cron_reminder で受け付けたバックグラウンド実行の状態"""
+    __tablename__ = "reminder_jobs"
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / success / failed
+    result = db.Column(db.Text)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": json.loads(self.result) if self.result else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class DataVersion(db.Model):
+    """
+    予定・出欠データの世代番号。Candidate / Confirmed / Attendance / Availability が変わると +1 される
+    （data_version.py）。全ワーカー共通のキャッシュ無効化に使う
+    """
+    __tablename__ = "data_versions"
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ArchivedCandidate(db.Model):
+    """
+    アーカイブ済みの候補日（archive_engine.py が candidates から移す）
+    id は元の candidates.id、確定済みだったものは confirmed_id に元の confirmed.id を残す
+    """
+    __tablename__ = "archived_candidates"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Integer, nullable=False)
+    gym = db.Column(db.String(255))
+    start = db.Column(db.String(50))
+    end = db.Column(db.String(50))
+    event_date = db.Column(db.Date)
+    starts_at = db.Column(db.DateTime)
+    ends_at = db.Column(db.DateTime)
+    sequence = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    confirmed_id = db.Column(db.Integer)
+    confirmed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 履歴画面は新しい順に確定済みだけをページ送りする
+        db.Index("ix_archived_candidates_event_date", "event_date", "starts_at"),
+        db.Index("uq_archived_candidates_confirmed_id", "confirmed_id", unique=True),
+    )
+
+class ArchivedAttendance(db.Model):
+    """アーカイブ済みの出欠。event_id は元の confirmed.id（= ArchivedCandidate.confirmed_id）"""
+    __tablename__ = "archived_attendance"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    event_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_archived_attendance_event_id", "event_id"),
+        db.Index("ix_archived_attendance_name", "name"),
+    )
+
+
+class LineWebhookEvent(db.Model):
+    """LINE から届いた webhook イベント。受信時は保存だけして、line_webhook.py のワーカーが処理する"""
+    __tablename__ = "line_webhook_events"
+    id = db.Column(db.Integer, primary_key=True)
+    webhook_event_id = db.Column(db.String(64), nullable=False)  # 再送されても同じ値（重複排除に使う）
+    event_type = db.Column(db.String(50))
+    payload = db.Column(db.Text, nullable=False)  # JSON（イベント 1 件分）
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending / done / ignored / failed
+    result = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 1 件だけで処理して失敗した回数
+    last_error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("uq_line_webhook_events_webhook_event_id", "webhook_event_id", unique=True),
+        db.Index("ix_line_webhook_events_status_id", "status", "id"),
+    )
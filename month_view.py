@@ -0,0 +1,84 @@
+# month_view.py
+# /confirm, /register の月別表示
+#
+# - 1 画面に出すのは選択中の (年, 月) だけ。event_date の範囲検索でその月の候補を引く
+# - 他の月はタブを押したときに断片 HTML を取りに行く（/confirm/month/<y>/<m> など）
+# - 既定では今月より前の月はタブに出さない（?past=1 で表示）
+# - MIN_YEAR〜MAX_YEAR 以外の年は 404（date() が作れない年や、キャッシュを増やすだけの URL を弾く）
+from datetime import date
+
+from models import db, Candidate, Confirmed
+
+MIN_YEAR, MAX_YEAR = 2000, 2100
+
+
+def valid_month(year, month):
+    """表示できる (年, 月) か。年が None（年の指定なし）なら月だけを見る"""
+    return (year is None or MIN_YEAR <= year <= MAX_YEAR) and 1 <= month <= 12
+
+
+def month_range(year, month):
+    """その月の [初日, 翌月初日)"""
+    first = date(year, month, 1)
+    nxt = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return first, nxt
+
+
+def in_month(year, month):
+    """Candidate.event_date をその月に絞る条件（ix_candidates_event_date_starts_at の範囲検索）"""
+    first, nxt = month_range(year, month)
+    return (Candidate.event_date >= first, Candidate.event_date < nxt)
+
+
+def available_months(today, include_past=False, confirmed_only=False):
+    """候補がある (年, 月) を昇順で返す（1 クエリ）"""
+    q = db.session.query(Candidate.year, Candidate.month).distinct()
+    if confirmed_only:
+        q = q.join(Confirmed, Confirmed.candidate_id == Candidate.id)
+    if not include_past:
+        q = q.filter(Candidate.event_date >= today.replace(day=1))
+    return sorted((y, m) for y, m in q)
+
+
+def requested_month(args):
+    """
+    クエリ文字列の year / month を (年, 月) にする。なければ None
+    month だけのとき（古いリンク）は年を None にして select_month に任せる
+    """
+    try:
+        month = int(args.get("month", ""))
+    except ValueError:
+        return None
+    if not 1 <= month <= 12:
+        return None
+    try:
+        year = int(args.get("year", ""))
+    except ValueError:
+        year = None
+    return year, month
+
+
+def select_month(months, today, requested=None):
+    """
+    表示する (年, 月) を決める
+    指定があればそれ（年なしなら今月以降で最初のその月）、なければ今月以降で最初の月
+    """
+    this_month = (today.year, today.month)
+    if requested:
+        year, month = requested
+        if year is not None:
+            return year, month
+        upcoming = [ym for ym in months if ym[1] == month and ym >= this_month]
+        same = upcoming or [ym for ym in months if ym[1] == month]
+        return same[0] if same else (today.year, month)
+    upcoming = [ym for ym in months if ym >= this_month]
+    if upcoming:
+        return upcoming[0]
+    return months[-1] if months else this_month
+
+
+def month_tabs(months, selected):
+    """タブに出す (年, 月) のリスト。選択中の月が一覧になければ加える"""
+    if selected not in months:
+        months = sorted([*months, selected])
+    return months
@@ -0,0 +1,303 @@
+# notifications.py
+# LINE / SendGrid 通知の送信処理と、送信待ちキュー（outbox）のディスパッチャ
+#
+# リクエスト処理中は enqueue_* で notification_outbox に行を追加するだけにして、
+# 実際の API 呼び出しはバックグラウンドのディスパッチャが行う。
+# 失敗したものは指数バックオフで再送し、上限回数を超えたら dead にする。
+# 確定・変更の LINE 通知は line_digest の窓の間だけ待たせ、まとめて 1 通にする。
+# LINE / SendGrid の SDK は起動を軽くするため、実際に送信するときに import する。
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from models import db, Candidate, EmailDelivery, NotificationOutbox
+from clients import line_bot_api, send_sendgrid_mail, timed
+from calendar_feed import invite_ics_base64
+import line_digest
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 再送設定
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BACKOFF_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_SECONDS", 30))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_MAX_SECONDS", 3600))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 20))
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", 10))
+
+LOCAL_TZ = ZoneInfo(os.environ.get("LOCAL_TZ", "Asia/Tokyo"))
+
+
+# ------------------------------
+# 実際の送信（失敗時は例外を投げる）
+# ------------------------------
+def send_line_message(text):
+    """LINE Messaging API でグループ（または個人）に push する"""
+    from linebot.models import TextSendMessage
+
+    to_id = os.environ.get("LINE_GROUP_ID")   # グループ or 個人
+    with timed("line", "push_message"):
+        line_bot_api().push_message(to_id, TextSendMessage(text=text))
+
+
+def send_ics_via_sendgrid(candidate, recipients):
+    """
+    ICS 付きの参加登録メールを 1 回の SendGrid リクエストで複数人に送る
+    recipients: [(name, email), ...]。宛先ごとに personalization を分け、本文の -name- を差し替える
+    添付の ICS はイベントごとにキャッシュ済みのものを使う（calendar_feed.invite_ics_base64）
+    """
+    from sendgrid.helpers.mail import (
+        Mail, Attachment, FileContent, FileName, FileType, Disposition, Personalization, To, Substitution,
+    )
+
+    message = Mail(
+        from_email=(os.environ["FROM_EMAIL"], os.environ.get("FROM_NAME", "Event App")),
+        subject="【参加登録】カレンダーに追加できます",
+        html_content="""
+            <p>-name- さん、参加登録ありがとうございます。</p>
+            <p>カレンダーに追加できる .ics ファイルを添付しています。</p>
+            <p>iPhone・Google・Outlook 全てに対応しています。</p>
+        """
+    )
+    for name, email in recipients:
+        p = Personalization()
+        p.add_to(To(email, name))
+        p.add_substitution(Substitution("-name-", name or ""))
+        message.add_personalization(p)
+
+    attachment = Attachment()
+    attachment.file_content = FileContent(invite_ics_base64(candidate, LOCAL_TZ))
+    attachment.file_type = FileType("text/calendar")
+    attachment.file_name = FileName("event.ics")
+    attachment.disposition = Disposition("attachment")
+    message.attachment = attachment
+
+    # 4xx/5xx は例外になる
+    with timed("sendgrid", "mail_send"):
+        response = send_sendgrid_mail(message)
+    logger.info("SendGrid Response: %s (%d recipients)", response.status_code, len(recipients))
+    return response
+
+
+# ------------------------------
+# outbox への積み込み（commit は呼び出し側）
+# ------------------------------
+def enqueue(kind, payload, next_attempt_at=None):
+    row = NotificationOutbox(kind=kind, payload=json.dumps(payload, ensure_ascii=False),
+                             next_attempt_at=next_attempt_at or datetime.utcnow())
+    db.session.add(row)
+    # commit されたらディスパッチャを起こす
+    db.session.info["outbox_pending"] = True
+    return row
+
+
+def enqueue_many(kind, payloads):
+    """複数件をまとめて 1 回の INSERT で積む（リマインドなど）"""
+    payloads = list(payloads)
+    if not payloads:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(NotificationOutbox), [
+        {"kind": kind, "payload": json.dumps(p, ensure_ascii=False), "status": "pending",
+         "attempts": 0, "next_attempt_at": now, "created_at": now}
+        for p in payloads
+    ])
+    db.session.info["outbox_pending"] = True
+
+
+def enqueue_line_message(text):
+    return enqueue("line", {"text": text})
+
+
+def enqueue_line_digest(topic, item, now=None):
+    """
+    まとめて送る LINE 通知を積む（topic は line_digest.FORMATTERS のキー）
+    同じ topic の送信待ちがあればその送信予定に相乗りし、なければ窓を開く
+    """
+    now = now or datetime.utcnow()
+    open_windows = {}
+    for payload, at in (
+        db.session.query(NotificationOutbox.payload, NotificationOutbox.next_attempt_at)
+        .filter(NotificationOutbox.kind == "line_digest", NotificationOutbox.status == "pending")
+    ):
+        t = json.loads(payload)["topic"]
+        open_windows[t] = min(at, open_windows.get(t, at))
+    return enqueue("line_digest", {"topic": topic, "item": item},
+                   next_attempt_at=line_digest.window_end(now, open_windows, topic))
+
+
+def enqueue_ics_emails(candidate, recipients):
+    """
+    recipients: [(name, email), ...] に ICS メールを送る。送信は 1 リクエストにまとめる
+    宛先ごとの結果は email_deliveries に残る
+    """
+    recipients = [(name, email) for name, email in recipients if email]
+    if not recipients:
+        return None
+    row = enqueue("ics_email", {"candidate_id": candidate.id})
+    db.session.add_all([
+        EmailDelivery(outbox=row, candidate_id=candidate.id, recipient_name=name, recipient_email=email)
+        for name, email in recipients
+    ])
+    return row
+
+
+def enqueue_ics_email(candidate, recipient_name, recipient_email):
+    return enqueue_ics_emails(candidate, [(recipient_name, recipient_email)])
+
+
+def _deliver(row):
+    payload = json.loads(row.payload)
+    if row.kind == "line":
+        send_line_message(payload["text"])
+    elif row.kind == "ics_email":
+        candidate = db.session.get(Candidate, payload["candidate_id"])
+        if candidate is None:
+            raise LookupError(f"candidate {payload['candidate_id']} not found")
+        _deliver_ics(row, candidate, payload)
+    else:
+        raise ValueError(f"unknown notification kind: {row.kind}")
+
+
+def _deliver_ics(row, candidate, payload):
+    """まだ届いていない宛先だけに送り、宛先ごとの結果を email_deliveries に記録する"""
+    deliveries = (
+        EmailDelivery.query
+        .filter(EmailDelivery.outbox_id == row.id, EmailDelivery.status != "sent")
+        .order_by(EmailDelivery.id.asc())
+        .all()
+    )
+    if not deliveries:
+        if "recipient_email" not in payload:
+            return
+        # 宛先ごとの記録を持たない旧形式の行
+        send_ics_via_sendgrid(candidate, [(payload["recipient_name"], payload["recipient_email"])])
+        return
+
+    now = datetime.utcnow()
+    try:
+        response = send_ics_via_sendgrid(candidate, [(d.recipient_name, d.recipient_email) for d in deliveries])
+    except Exception as e:
+        for d in deliveries:
+            d.attempts += 1
+            d.status = "failed"
+            d.last_error = f"{type(e).__name__}: {e}"
+        raise
+    message_id = response.headers.get("X-Message-Id")
+    for d in deliveries:
+        d.attempts += 1
+        d.status = "sent"
+        d.message_id = message_id
+        d.last_error = None
+        d.sent_at = now
+
+
+def backoff_delay(attempts):
+    """attempts 回失敗した後の待ち時間（秒）"""
+    return min(OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+def dispatch_pending(now=None, batch_size=None):
+    """
+    送信時刻を過ぎた pending を 1 バッチ処理して、処理件数を返す
+    Postgres では SKIP LOCKED で複数ワーカーが同じ行を掴まないようにする
+    """
+    now = now or datetime.utcnow()
+    rows = (
+        NotificationOutbox.query
+        .filter(NotificationOutbox.status == "pending", NotificationOutbox.next_attempt_at <= now)
+        .order_by(NotificationOutbox.id.asc())
+        .limit(batch_size or OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    singles = [row for row in rows if row.kind != "line_digest"]
+    digests = [row for row in rows if row.kind == "line_digest"]
+    if digests:
+        # 同じ窓の通知がバッチの外にあっても取りこぼさないよう、期限の来たものは全部集める
+        digests += (
+            NotificationOutbox.query
+            .filter(NotificationOutbox.kind == "line_digest", NotificationOutbox.status == "pending",
+                    NotificationOutbox.next_attempt_at <= now,
+                    NotificationOutbox.id.notin_([row.id for row in digests]))
+            .order_by(NotificationOutbox.id.asc())
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+    for row in singles:
+        _settle([row], lambda: _deliver(row), now)
+
+    groups = {}
+    for row in sorted(digests, key=lambda r: r.id):
+        payload = json.loads(row.payload)
+        groups.setdefault(payload["topic"], []).append((row, payload["item"]))
+    for topic, members in groups.items():
+        text = line_digest.format_digest(topic, [item for _, item in members])
+        _settle([row for row, _ in members], lambda: send_line_message(text), now)
+
+    db.session.commit()
+    return len(singles) + len(digests)
+
+
+def _settle(rows, send, now):
+    """send() を 1 回呼び、結果を rows 全部に記録する（ダイジェストはまとめて成功・失敗する）"""
+    try:
+        send()
+    except Exception as e:
+        # 再送予定はグループ内でそろえる（次回も同じ 1 通にまとまるように）
+        attempts = max(row.attempts for row in rows) + 1
+        retry_at = now + timedelta(seconds=backoff_delay(attempts))
+        for row in rows:
+            row.attempts += 1
+            row.last_error = f"{type(e).__name__}: {e}"
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                row.status = "dead"
+                logger.error("notification %s dead-lettered: %s", row.id, row.last_error)
+            else:
+                row.next_attempt_at = retry_at
+                logger.warning("notification %s failed (attempt %s): %s", row.id, row.attempts, row.last_error)
+    else:
+        for row in rows:
+            row.attempts += 1
+            row.status = "sent"
+            row.sent_at = datetime.utcnow()
+
+
+# ------------------------------
+# ディスパッチャ（スレッド / 別プロセス共通のループ）
+# ------------------------------
+_wakeup = threading.Event()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session):
+    if session.info.pop("outbox_pending", False):
+        _wakeup.set()
+
+
+def run_dispatcher(app, poll_seconds=None, stop_event=None):
+    poll_seconds = OUTBOX_POLL_SECONDS if poll_seconds is None else poll_seconds
+    while not (stop_event and stop_event.is_set()):
+        processed = 0
+        try:
+            with app.app_context():
+                processed = dispatch_pending()
+        except Exception:
+            logger.exception("outbox dispatch failed")
+        metrics.flush()
+        if processed < OUTBOX_BATCH_SIZE:
+            _wakeup.wait(poll_seconds)
+            _wakeup.clear()
+
+
+def start_dispatcher_thread(app):
+    thread = threading.Thread(target=run_dispatcher, args=(app,), name="outbox-dispatcher", daemon=True)
+    thread.start()
+    return thread
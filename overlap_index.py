@@ -0,0 +1,137 @@
+# overlap_index.py
+# 体育館 × 日付ごとの時間帯インデックス（同じ体育館・同じ日に時間が重なる候補の検出）
+#
+# - (gym, event_date) ごとに候補を開始時刻順に並べ、終了時刻の累積最大も持つ
+#   重なりの検索は bisect で開始時刻 < 新しい終了 の範囲を決め、累積最大が新しい開始を超える間だけ後ろから見る
+#   （重なっていない候補が並ぶ通常時は O(log n)）
+# - 必要な (gym, date) だけを event_date のインデックス（ix_candidates_event_date_starts_at）で 1 クエリで読む
+#   candidates 全体は読まない
+# - 読み込んだインデックスは候補の世代番号（data_version.CANDIDATES）ごとにプロセス内で使い回す
+#   出欠・参加可否の変更では番号が変わらないので捨てない。どのワーカーで候補が書き換わっても
+#   番号が変わるので、次の検索で読み直される
+# 候補の作成・編集・一括作成の前に重なりを確認し、/confirm では重なっている候補と
+# 同じメンバーが重なる 2 つの確定イベントに参加しているケースを表示する
+import threading
+from bisect import bisect_left, insort
+from collections import namedtuple
+from itertools import accumulate
+
+from models import db, Candidate
+import data_version
+
+# id は候補なら candidate_id、確定イベント同士を比べるときは confirmed_id
+Interval = namedtuple("Interval", "starts_at ends_at id")
+
+_lock = threading.Lock()
+_state = {"version": None, "days": {}}  # days: (gym, event_date) -> DayIndex
+
+
+class DayIndex:
+    """1 つの体育館・1 日分の候補の時間帯"""
+
+    def __init__(self, intervals=()):
+        self.items = sorted(intervals)
+        self._reindex()
+
+    def _reindex(self):
+        self.starts = [i.starts_at for i in self.items]
+        self.max_end = list(accumulate((i.ends_at for i in self.items), max))
+
+    def add(self, interval):
+        insort(self.items, interval)
+        self._reindex()
+
+    def conflicts(self, starts_at, ends_at, exclude_id=None):
+        """[starts_at, ends_at) と重なる候補を開始順で返す（端が接するだけなら重ならない）"""
+        found = []
+        i = bisect_left(self.starts, ends_at) - 1
+        while i >= 0 and self.max_end[i] > starts_at:
+            item = self.items[i]
+            if item.ends_at > starts_at and (exclude_id is None or item.id != exclude_id):
+                found.append(item)
+            i -= 1
+        return found[::-1]
+
+
+def _current_days():
+    version, _ = data_version.current(data_version.CANDIDATES)
+    with _lock:
+        if _state["version"] != version:
+            _state["version"] = version
+            _state["days"] = {}
+        return _state["days"]
+
+
+def day_indexes(keys):
+    """
+    keys: (gym, event_date) の集まり -> {key: DayIndex}
+    キャッシュにない日付だけを 1 クエリで読む
+    """
+    keys = set(keys)
+    days = _current_days()
+    missing = keys - days.keys()
+    if missing:
+        loaded = {key: [] for key in missing}
+        for cid, gym, event_date, starts_at, ends_at in (
+            db.session.query(Candidate.id, Candidate.gym, Candidate.event_date,
+                             Candidate.starts_at, Candidate.ends_at)
+            .filter(Candidate.event_date.in_(sorted({d for _, d in missing})),
+                    Candidate.gym.in_(sorted({g for g, _ in missing})))
+        ):
+            if (gym, event_date) in loaded and starts_at and ends_at:
+                loaded[(gym, event_date)].append(Interval(starts_at, ends_at, cid))
+        with _lock:
+            for key, intervals in loaded.items():
+                days.setdefault(key, DayIndex(intervals))
+    return {key: days[key] for key in keys}
+
+
+def find_conflicts(gym, starts_at, ends_at, exclude_id=None):
+    """同じ体育館・同じ日で [starts_at, ends_at) と重なる候補の Interval を返す"""
+    if not (starts_at and ends_at):
+        return []
+    index = day_indexes([(gym, starts_at.date())])[(gym, starts_at.date())]
+    return index.conflicts(starts_at, ends_at, exclude_id)
+
+
+def month_conflicts(candidates):
+    """
+    /confirm 用：読み込み済みの候補（1 か月分など）の中で、同じ体育館・同じ日に時間が重なるもの
+    returns: {candidate_id: [重なる candidate_id, ...]}（DB は読まない）
+    """
+    days = {}
+    for c in candidates:
+        if c.starts_at and c.ends_at:
+            days.setdefault((c.gym, c.event_date), []).append(Interval(c.starts_at, c.ends_at, c.id))
+    result = {}
+    for intervals in days.values():
+        index = DayIndex(intervals)
+        for item in index.items:
+            others = index.conflicts(item.starts_at, item.ends_at, exclude_id=item.id)
+            if others:
+                result[item.id] = [o.id for o in others]
+    return result
+
+
+def member_double_bookings(events, attendees):
+    """
+    同じメンバーが時間の重なる 2 つの確定イベントに参加しているケースを返す（体育館は問わない）
+    events: [(confirmed_id, Candidate), ...]  attendees: {confirmed_id: [参加の名前, ...]}
+    returns: [(名前, Candidate, Candidate), ...]
+    """
+    by_date = {}
+    for event_id, c in events:
+        if c.starts_at and c.ends_at:
+            by_date.setdefault(c.event_date, []).append(Interval(c.starts_at, c.ends_at, event_id))
+    candidates = dict(events)
+    found = []
+    for intervals in by_date.values():
+        index = DayIndex(intervals)
+        for item in index.items:
+            for other in index.conflicts(item.starts_at, item.ends_at, exclude_id=item.id):
+                if other <= item:
+                    continue  # 同じ組を 2 回数えない
+                both = set(attendees.get(item.id, ())) & set(attendees.get(other.id, ()))
+                for name in sorted(both):
+                    found.append((name, candidates[item.id], candidates[other.id]))
+    return found
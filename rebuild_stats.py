@@ -0,0 +1,17 @@
+# rebuild_stats.py
+# メンバー統計（member_stats / member_streaks）を出欠の履歴から作り直す
+#
+#   python rebuild_stats.py          # 導入時のバックフィルや、値がずれたときに実行
+import argparse
+
+from main import create_app
+from member_stats import rebuild
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="メンバー統計の再構築")
+    p.add_argument("--batch-size", type=int, default=1000, help="履歴を読む・書くときの 1 回の行数")
+    args = p.parse_args()
+
+    app = create_app(start_workers=False)
+    with app.app_context():
+        print(rebuild(batch_size=args.batch_size))
@@ -1,5 +1,14 @@
-from main import app, send_reminder_for_tomorrow
+import os
+
+from flask import url_for
+
+from main import create_app
+from reminder_engine import run_reminders
+
+# cron から直接実行する場合の参加登録ページのホスト
+APP_BASE_URL = os.environ.get("APP_BASE_URL", "https://event-app10.onrender.com")
 
 if __name__ == "__main__":
-    with app.app_context():
-        send_reminder_for_tomorrow()
+    app = create_app(start_workers=False)
+    with app.test_request_context(base_url=APP_BASE_URL):
+        print(run_reminders(url_for("set_name", _external=True)))
@@ -0,0 +1,186 @@
+# reminder_engine.py
+# 前日・1週間前（＋任意の日数前）のリマインドを 1 回の実行でまとめて作る
+#
+# - 対象日のイベントと出欠を 1 クエリで読み込む
+# - 送信済みは reminder_logs に (event_id, offset_days) で記録し、再実行しても二重送信しない
+# - Postgres では advisory lock で同時実行を 1 つに制限する
+# - 実行結果と所要時間を cron_logs に残す
+# - /cron_reminder からはバックグラウンドのジョブとして実行し、状態を reminder_jobs に残す
+import os
+import json
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import insert
+
+from models import db, Candidate, Confirmed, Attendance, ReminderLog, ReminderJob
+from notifications import enqueue_many
+from cron_run import try_lock, write_cron_log
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TZ = ZoneInfo(os.environ.get("LOCAL_TZ", "Asia/Tokyo"))
+
+# 既定は 7 日前と前日。REMINDER_EXTRA_OFFSETS="3,14" のように追加できる
+DEFAULT_OFFSETS = (7, 1)
+REMINDER_LOCK_KEY = 820_001
+
+# 体育館ごとの集合時間（開始時間からのマイナス分）
+MEETING_OFFSET_MINUTES = {
+    "中平井": 15,
+    "平井": 30,
+    "西小岩": 40,
+    "北小岩": 45,
+    "南小岩": 45,
+}
+
+
+def reminder_offsets():
+    extra = os.environ.get("REMINDER_EXTRA_OFFSETS", "")
+    offsets = set(DEFAULT_OFFSETS)
+    offsets.update(int(x) for x in extra.split(",") if x.strip())
+    return sorted(offsets, reverse=True)
+
+
+def load_events(target_dates):
+    """
+    対象日のイベントを出欠付きで 1 クエリで読み込む
+    returns: [(Confirmed, Candidate, {"attend": [...], "absent": [...], "pending": [...]})]
+    """
+    rows = (
+        db.session.query(Confirmed, Candidate, Attendance.name, Attendance.status)
+        .join(Candidate, Confirmed.candidate_id == Candidate.id)
+        .outerjoin(Attendance, Attendance.event_id == Confirmed.id)
+        .filter(Candidate.event_date.in_(target_dates))
+        .order_by(Candidate.event_date.asc(), Candidate.starts_at.asc(), Attendance.id.asc())
+        .all()
+    )
+    events = {}
+    for cnf, c, name, status in rows:
+        _, _, members = events.setdefault(cnf.id, (cnf, c, {"attend": [], "absent": [], "pending": []}))
+        if name is not None:
+            members.setdefault(status, []).append(name)
+    return list(events.values())
+
+
+def format_tomorrow_message(c, members):
+    # ---- 集合時間計算 ----
+    start_dt = c.starts_at.replace(tzinfo=LOCAL_TZ)
+    offset = MEETING_OFFSET_MINUTES.get(c.gym, 30)  # デフォルト30分
+    meeting_time_str = (start_dt - timedelta(minutes=offset)).strftime("%H:%M")
+    attend_members = members["attend"]
+
+    return (
+        f"⏰ 明日はイベントです！\n"
+        f"{c.month}/{c.day} @ {c.gym} {c.start}〜{c.end}\n\n"
+        f"📣 {meeting_time_str}にメール室前集合です！\n\n"
+        f"参加予定: {len(attend_members)}名\n"
+        f"{', '.join(attend_members) if attend_members else 'まだ未登録'}"
+    )
+
+
+def format_registration_message(c, members, offset_days, register_url):
+    label = "1週間前" if offset_days == 7 else f"{offset_days}日前"
+    return (
+        f"📣 参加登録リマインド（{label}）\n"
+        f"{c.month}/{c.day} @ {c.gym} {c.start}〜{c.end}\n\n"
+        f"✅ 参加: {len(members['attend'])}名\n"
+        f"❌ 不参加: {len(members['absent'])}名\n"
+        f"❓ 未回答: {len(members['pending'])}名\n\n"
+        f"まだの方は参加登録をお願いします👇\n"
+        f"{register_url}"
+    )
+
+
+def run_reminders(register_url, today=None, offsets=None):
+    """
+    リマインドを outbox に積んで commit する。結果の dict を返す
+    register_url: 参加登録ページの URL（リクエスト外からも呼べるよう引数で受け取る）
+    """
+    started = time.perf_counter()
+    today = today or datetime.now(LOCAL_TZ).date()
+    offsets = offsets or reminder_offsets()
+    result = {"status": "success", "sent": 0, "already_sent": 0}
+
+    try:
+        if not try_lock(REMINDER_LOCK_KEY):
+            result["status"] = "skipped"
+            result["message"] = "another reminder run is in progress"
+        else:
+            by_date = {today + timedelta(days=o): o for o in offsets}
+            events = load_events(list(by_date))
+            sent = {
+                (event_id, offset_days)
+                for event_id, offset_days in db.session.query(ReminderLog.event_id, ReminderLog.offset_days)
+                .filter(ReminderLog.event_id.in_([cnf.id for cnf, _, _ in events]))
+            } if events else set()
+
+            messages, logs = [], []
+            for cnf, c, members in events:
+                offset_days = by_date[c.event_date]
+                if (cnf.id, offset_days) in sent:
+                    result["already_sent"] += 1
+                    continue
+                if offset_days == 1:
+                    message = format_tomorrow_message(c, members)
+                else:
+                    message = format_registration_message(c, members, offset_days, register_url)
+                messages.append({"text": message})
+                logs.append({"event_id": cnf.id, "offset_days": offset_days, "sent_at": datetime.utcnow()})
+
+            # 件数に関係なく INSERT はそれぞれ 1 回
+            enqueue_many("line", messages)
+            if logs:
+                db.session.execute(insert(ReminderLog), logs)
+            result["sent"] = len(logs)
+
+            result["message"] = f"sent={result['sent']} already_sent={result['already_sent']}"
+        write_cron_log(result, started)
+        # 通知・送信記録・実行ログを同じトランザクションで確定（ロックもここで解放）
+        db.session.commit()
+        return result
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("reminder run failed")
+        result = {"status": "failed", "message": str(e)}
+        write_cron_log(result, started)
+        db.session.commit()
+        raise
+
+
+# ------------------------------
+# バックグラウンド実行（/cron_reminder は受け付けだけして 202 を返す）
+# ------------------------------
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reminder-job")
+
+
+def submit_reminder_job(app, register_url):
+    """ジョブを登録してバックグラウンドで実行する。ReminderJob を返す"""
+    job = ReminderJob(id=str(uuid.uuid4()), status="queued")
+    db.session.add(job)
+    db.session.commit()
+    _executor.submit(_run_job, app, job.id, register_url)
+    return job
+
+
+def _run_job(app, job_id, register_url):
+    with app.app_context():
+        job = db.session.get(ReminderJob, job_id)
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+        try:
+            result = run_reminders(register_url)
+            job = db.session.get(ReminderJob, job_id)
+            job.status = "success"
+        except Exception as e:
+            result = {"status": "failed", "message": str(e)}
+            job = db.session.get(ReminderJob, job_id)
+            job.status = "failed"
+        job.result = json.dumps(result, ensure_ascii=False)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
@@ -0,0 +1,48 @@
+# render_cache.py
+# /confirm, /register の HTML をデータの世代番号（data_version）ごとにキャッシュする
+#
+# 世代番号は DB にあるので、どのワーカーで書き込みがあっても全ワーカーで同時に無効になる。
+# ユーザーごとに内容が変わるページはキーにユーザー名を含めること。
+# 月・ユーザー名ごとにキーが増えるので、RENDER_CACHE_MAX_ENTRIES 件を超えたら古い順に捨てる（LRU）。
+import os
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from flask import Response, request
+
+import data_version
+
+RENDER_CACHE_MAX_ENTRIES = int(os.environ.get("RENDER_CACHE_MAX_ENTRIES", 256))
+
+Entry = namedtuple("Entry", "version body etag")
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # key -> Entry（最近使ったものが末尾）
+
+
+def render_cached(key, render, private=False):
+    """
+    render() で作った HTML を世代番号が変わるまで使い回し、ETag / 304 に対応したレスポンスを返す
+    """
+    version, _ = data_version.current()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+    if entry is None or entry.version != version:
+        body = render().encode("utf-8")
+        entry = Entry(version, body, hashlib.sha256(body).hexdigest())
+        with _lock:
+            _cache[key] = entry
+            _cache.move_to_end(key)
+            while len(_cache) > RENDER_CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+
+    resp = Response(entry.body, mimetype="text/html")
+    resp.set_etag(entry.etag)
+    resp.cache_control.no_cache = True   # ブラウザには毎回再検証させる
+    if private:
+        resp.cache_control.private = True
+        resp.vary.add("Cookie")
+    return resp.make_conditional(request)
@@ -0,0 +1,34 @@
+// templates/candidate_bulk.html
+function switchMode(mode) {
+    document.getElementById('pattern-fields').style.display = mode === 'pattern' ? 'block' : 'none';
+    document.getElementById('csv-fields').style.display = mode === 'csv' ? 'block' : 'none';
+}
+
+function listHtml(items) {
+    return '<ul>' + items.map(i => '<li>' + i.replace(/</g, '&lt;') + '</li>').join('') + '</ul>';
+}
+
+async function submitBulk(ev) {
+    ev.preventDefault();
+    const form = ev.target;
+    const button = form.querySelector('button[type="submit"]');
+    const result = document.getElementById('result');
+    button.disabled = true;
+    try {
+        const res = await fetch(form.action, { method: 'POST', body: new FormData(form) });
+        const data = await res.json();
+        if (!res.ok) {
+            result.innerHTML = '<p class="error">登録できませんでした（何も追加していません）</p>' + listHtml(data.errors || []);
+            return;
+        }
+        let html = `<p>${data.created} 件追加しました（重複でスキップ ${data.skipped_duplicates} 件・時間の重なりでスキップ ${data.skipped_conflicts} 件）</p>`;
+        if (data.created_items.length) html += '<h3>追加</h3>' + listHtml(data.created_items);
+        if (data.skipped_items.length) html += '<h3>既存のためスキップ</h3>' + listHtml(data.skipped_items);
+        if (data.conflict_items.length) html += '<h3>同じ体育館の候補と時間が重なるためスキップ</h3>' + listHtml(data.conflict_items);
+        result.innerHTML = html;
+    } catch (e) {
+        result.innerHTML = '<p class="error">送信に失敗しました</p>';
+    } finally {
+        button.disabled = false;
+    }
+}
@@ -0,0 +1,34 @@
+// templates/confirm.html
+// 開いたことのない月は断片 HTML を取得してから表示
+async function showTab(key) {
+    let tab = document.getElementById(`tab-${key}`);
+    if (!tab) {
+        const btn = document.getElementById(`btn-${key}`);
+        const res = await fetch(btn.dataset.url);
+        if (!res.ok) return;
+        tab = document.createElement("div");
+        tab.id = `tab-${key}`;
+        tab.className = "tab-content";
+        tab.innerHTML = await res.text();
+        document.querySelector(".tab-buttons").after(tab);
+    }
+
+    document.querySelectorAll('.tab-content').forEach(e => e.classList.remove('active'));
+    tab.classList.add('active');
+
+    document.querySelectorAll('.tab-buttons button').forEach(e => e.classList.remove('active'));
+    document.getElementById(`btn-${key}`).classList.add('active');
+
+    // ★ タブ変更を保存
+    localStorage.setItem("confirmPageLastTab", key);
+}
+
+// ★ 読み込み時に保存したタブを復元（URL で月を指定したときはそちらを優先）
+document.addEventListener("DOMContentLoaded", () => {
+    const params = new URLSearchParams(window.location.search);
+    const saved = localStorage.getItem("confirmPageLastTab");
+    if (!params.has("month") && saved && document.getElementById(`btn-${saved}`)
+            && !document.getElementById(`tab-${saved}`)) {
+        showTab(saved);
+    }
+});
@@ -0,0 +1,28 @@
+// templates/manage_event_attendance.html
+// 変更した行だけを JSON で送り、返ってきた集計で上の表示を更新する
+async function submitBatch(ev) {
+    ev.preventDefault();
+    const form = ev.target;
+    const changes = {};
+    document.querySelectorAll('select[form="batch-form"]').forEach(sel => {
+        if (sel.value !== sel.dataset.initial) changes[sel.name.replace("status_", "")] = sel.value;
+    });
+    const result = document.getElementById("batch-result");
+    if (!Object.keys(changes).length) { result.textContent = "変更はありません"; return; }
+
+    const res = await fetch(form.action, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "Accept": "application/json" },
+        body: JSON.stringify({ changes }),
+    });
+    const data = await res.json();
+    if (!res.ok) { result.textContent = `保存できませんでした（${data.error}）`; return; }
+
+    const s = data.summary;
+    document.getElementById("attend-count").textContent = s.attend_count;
+    document.getElementById("absent-count").textContent = s.absent_count;
+    document.getElementById("attend-members").textContent = s.attend_members.join("、") || "-";
+    document.getElementById("absent-members").textContent = s.absent_members.join("、") || "-";
+    document.querySelectorAll('select[form="batch-form"]').forEach(sel => sel.dataset.initial = sel.value);
+    result.textContent = `${data.updated}件を保存しました`;
+}
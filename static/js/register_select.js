@@ -0,0 +1,21 @@
+// templates/register_select.html
+const tabsContainer = document.getElementById("monthTabs");
+
+// 開いたことのない月は断片 HTML を取得してから表示
+async function activate(btn) {
+    const month = btn.dataset.month;
+    let block = document.querySelector(`.month-block[data-month="${month}"]`);
+    if (!block) {
+        const res = await fetch(btn.dataset.url);
+        if (!res.ok) return;
+        block = document.createElement("div");
+        block.className = "month-block";
+        block.dataset.month = month;
+        block.innerHTML = await res.text();
+        tabsContainer.after(block);
+    }
+    document.querySelectorAll(".tab-btn").forEach(b => b.classList.toggle("active", b === btn));
+    document.querySelectorAll(".month-block").forEach(b => b.classList.toggle("active", b === block));
+}
+
+document.querySelectorAll(".tab-btn").forEach(b => b.addEventListener("click", () => activate(b)));
@@ -0,0 +1,6 @@
+// templates/set_name.html
+function selectName(name) {
+    const form = document.getElementById("nameForm");
+    document.getElementById("user_name").value = name;
+    form.submit();
+}
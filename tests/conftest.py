@@ -0,0 +1,136 @@
+# tests/conftest.py
+# テスト共通：一時 SQLite ファイルの DB でアプリを作る（LINE / SendGrid には送らない）
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("OUTBOX_DISPATCHER", "off")
+    monkeypatch.setenv("MAIL_MATSUMURA", "matsumura@example.com")
+
+    import main
+    import metrics
+    import overlap_index
+    import render_cache
+    import data_version
+    from models import db
+
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path / "metrics"))
+    app = main.create_app(start_workers=False)
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.create_all()
+        data_version.ensure()
+    # プロセス内キャッシュは DB ごとに作り直す（世代番号が別の DB と重なるため）
+    render_cache._cache.clear()
+    overlap_index._state.update(version=None, days={})
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    c = app.test_client()
+    with c.session_transaction() as s:
+        s["user_name"] = "松村"
+    return c
+
+
+@pytest.fixture
+def statements(app):
+    """SQL の発行数を数える。counter["n"] を 0 に戻してから測る"""
+    from models import db
+
+    counter = {"n": 0}
+    with app.app_context():
+        engine = db.engine
+
+    def _count(*_):
+        counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", _count)
+    yield counter
+    event.remove(engine, "before_cursor_execute", _count)
+
+
+@pytest.fixture
+def parallel_post(app):
+    """
+    forms をそれぞれ別スレッド・別クライアントから同時に POST し、ステータスコードのリストを返す
+    path はすべて同じ URL か、forms と同じ長さの URL のリスト
+    """
+    def fire(path, forms):
+        paths = [path] * len(forms) if isinstance(path, str) else path
+        barrier = threading.Barrier(len(forms))
+        results = [None] * len(forms)
+
+        def run(i, form):
+            client = app.test_client()
+            barrier.wait()
+            results[i] = client.post(paths[i], data=form).status_code
+
+        threads = [threading.Thread(target=run, args=(i, f)) for i, f in enumerate(forms)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+    return fire
+
+
+@pytest.fixture
+def seed(app):
+    return lambda n, first_day, **kwargs: seed_events(app, n, first_day, **kwargs)
+
+
+def seed_events(app, n, first_day, members=("松村", "山火", "山根"), confirm=True):
+    """
+    first_day から 1 日 1 件ずつ n 件の候補（と確定・出欠）を一括 INSERT で作る
+    returns: [(candidate_id, confirmed_id or None), ...]
+    """
+    from models import db, Candidate, Confirmed, Attendance, schedule_columns
+
+    with app.app_context():
+        rows = []
+        for i in range(n):
+            d = first_day + timedelta(days=i % 28)
+            h = 18 + i // 28 % 4
+            start, end = f"{h:02d}:00", f"{h:02d}:30"
+            event_date, starts_at, ends_at = schedule_columns(d.year, d.month, d.day, start, end)
+            rows.append({
+                "year": d.year, "month": d.month, "day": d.day, "gym": "平井",
+                "start": start, "end": end, "event_date": event_date,
+                "starts_at": starts_at, "ends_at": ends_at, "sequence": 0,
+                "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+            })
+        ids = list(db.session.execute(
+            insert(Candidate).returning(Candidate.id, sort_by_parameter_order=True), rows,
+        ).scalars())
+        if not confirm:
+            db.session.commit()
+            return [(cid, None) for cid in ids]
+
+        event_ids = list(db.session.execute(
+            insert(Confirmed).returning(Confirmed.id, sort_by_parameter_order=True),
+            [{"candidate_id": cid, "created_at": datetime.utcnow()} for cid in ids],
+        ).scalars())
+        attendance = [
+            {"event_id": eid, "name": name, "status": "attend" if j % 2 == 0 else "absent",
+             "created_at": datetime.utcnow()}
+            for eid in event_ids for j, name in enumerate(members)
+        ]
+        if attendance:
+            db.session.execute(insert(Attendance), attendance)
+        db.session.commit()
+        return list(zip(ids, event_ids))
@@ -0,0 +1,28 @@
+# 参加ステータスの一括更新（/manage_event/<id>/attendance）
+from datetime import date
+
+import pytest
+
+from models import Attendance
+
+
+@pytest.mark.parametrize("body", [
+    [1], {"changes": ["x"]}, {"changes": None}, {}, "changes",
+    {"changes": {"1": 5}}, {"changes": {"1": ["attend"]}}, {"changes": {"1": {"status": "attend"}}},
+])
+def test_malformed_json_is_400(client, seed, body):
+    [(_, event_id)] = seed(1, date(2031, 3, 1))
+    r = client.post(f"/manage_event/{event_id}/attendance", json=body)
+    assert r.status_code == 400
+
+
+def test_updates_all_changes(app, client, seed):
+    [(_, event_id)] = seed(1, date(2031, 3, 1))
+    with app.app_context():
+        ids = [a.id for a in Attendance.query.filter_by(event_id=event_id)]
+    r = client.post(f"/manage_event/{event_id}/attendance",
+                    json={"changes": {str(i): "pending" for i in ids}})
+    assert r.status_code == 200
+    assert r.get_json()["updated"] == len(ids)
+    with app.app_context():
+        assert {a.status for a in Attendance.query.filter_by(event_id=event_id)} == {"pending"}
@@ -0,0 +1,39 @@
+# 出欠の集計はイベント数に関係なく一定回数のクエリで行う（attendance_service.py）
+from datetime import datetime, timedelta
+
+import render_cache
+from reminder_engine import LOCAL_TZ
+
+N = 10
+
+
+def next_month_first():
+    today = datetime.now(LOCAL_TZ).date()
+    return (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def count_get(client, statements, path):
+    render_cache._cache.clear()  # キャッシュなしで描画したときを数える
+    statements["n"] = 0
+    r = client.get(path)
+    assert r.status_code == 200, (path, r.status_code)
+    return statements["n"]
+
+
+def test_query_count_does_not_grow_with_events(client, seed, statements):
+    first = next_month_first()
+    small = seed(N, first)
+    paths = ["/confirm", "/register", f"/manage_event/{small[0][1]}"]
+    before = [count_get(client, statements, p) for p in paths]
+
+    seed(N * 9, first)  # 同じ月に足して合計 10 倍
+    after = [count_get(client, statements, p) for p in paths]
+
+    assert all(before)
+    assert before == after
+
+
+def test_summary_lists_attend_and_absent(client, seed):
+    events = seed(3, next_month_first())
+    body = client.get(f"/manage_event/{events[1][1]}").get_data(as_text=True)
+    assert "松村" in body and "山火" in body
@@ -0,0 +1,18 @@
+# 参加可否の入力（/availability）と /confirm の順位付け
+from datetime import datetime, timedelta
+
+from reminder_engine import LOCAL_TZ
+
+
+def test_saving_availability_refreshes_confirm(client, seed):
+    first = (datetime.now(LOCAL_TZ).date().replace(day=1) + timedelta(days=32)).replace(day=1)
+    [(cid, _)] = seed(1, first, confirm=False)
+    before = client.get("/confirm")
+    assert before.status_code == 200
+
+    r = client.post("/availability", data={"candidate_id": str(cid), f"available_{cid}": "1"})
+    assert r.status_code == 302
+
+    after = client.get("/confirm")
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert "松村" in after.get_data(as_text=True)
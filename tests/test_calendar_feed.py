@@ -0,0 +1,16 @@
+# 購読カレンダーと参加登録メールの ICS（calendar_feed.py）
+import re
+from datetime import date
+
+import calendar_feed
+from models import db, Candidate
+from reminder_engine import LOCAL_TZ
+
+
+def test_feed_and_invite_share_uid(app, client, seed):
+    [(cid, _)] = seed(1, date(2031, 7, 1))
+    feed = client.get("/calendar/松村.ics").get_data(as_text=True)
+    with app.app_context():
+        invite = calendar_feed.invite_ics(db.session.get(Candidate, cid), LOCAL_TZ)
+    assert re.findall(r"^UID:(.*)\r$", feed, re.M) == [calendar_feed.event_uid(cid)]
+    assert re.findall(r"^UID:(.*)\r$", invite, re.M) == [calendar_feed.event_uid(cid)]
@@ -0,0 +1,46 @@
+# 候補日の作成・編集フォーム
+from datetime import date
+
+from models import db, Candidate, NotificationOutbox
+
+FORM = {"year": "2031", "month": "2", "day": "30", "gym": "平井", "start": "19:00", "end": "21:00"}
+
+
+def test_create_rejects_nonexistent_date(app, client):
+    r = client.post("/candidate", data=FORM)
+    assert r.status_code == 400
+    assert "存在しない日時" in r.get_data(as_text=True)
+    with app.app_context():
+        assert Candidate.query.count() == 0
+
+
+def test_edit_rejects_nonexistent_date(app, client, seed):
+    [(cid, _)] = seed(1, date(2031, 2, 1), confirm=False)
+    r = client.post(f"/candidate/{cid}/edit", data=FORM)
+    assert r.status_code == 400
+    with app.app_context():
+        assert db.session.get(Candidate, cid).day == 1
+
+
+def edit_form(cand, **changes):
+    return {**{f: str(getattr(cand, f)) for f in ("year", "month", "day", "gym", "start", "end")}, **changes}
+
+
+def test_edit_without_changes_sends_nothing(app, client, seed):
+    [(cid, _)] = seed(1, date(2031, 2, 1))
+    with app.app_context():
+        form = edit_form(db.session.get(Candidate, cid))
+    assert client.post(f"/candidate/{cid}/edit", data=form).status_code == 302
+    with app.app_context():
+        assert NotificationOutbox.query.count() == 0
+        assert db.session.get(Candidate, cid).sequence == 0
+
+
+def test_edit_with_changes_notifies_once(app, client, seed):
+    [(cid, _)] = seed(1, date(2031, 2, 1))
+    with app.app_context():
+        form = edit_form(db.session.get(Candidate, cid), start="20:00", end="21:30")
+    assert client.post(f"/candidate/{cid}/edit", data=form).status_code == 302
+    with app.app_context():
+        assert sorted(r.kind for r in NotificationOutbox.query) == ["ics_email", "line_digest"]
+        assert db.session.get(Candidate, cid).sequence == 1
@@ -0,0 +1,38 @@
+# cron から呼ぶ一括処理の実行ログ（cron_run.py）
+from datetime import date
+
+import archive_engine
+import reminder_engine
+from models import CronLog
+
+
+def test_archive_and_reminder_share_cron_log(app, seed):
+    seed(2, date(2020, 1, 1))
+    with app.app_context():
+        archive_engine.archive_events(cutoff=date(2021, 1, 1))
+        reminder_engine.run_reminders("http://localhost/set_name", today=date(2030, 1, 1), offsets=[1])
+        logs = CronLog.query.order_by(CronLog.id).all()
+    assert [log.status for log in logs] == ["success", "success"]
+    assert logs[0].message.startswith("archive: archived candidates=2 ")
+    assert logs[1].message == "sent=0 already_sent=0"
+
+
+def test_archive_reports_partial_when_lock_is_lost(app, seed, monkeypatch):
+    seed(3, date(2020, 1, 1))
+    locks = iter([True, False])
+    monkeypatch.setattr(archive_engine, "try_lock", lambda key: next(locks))
+    with app.app_context():
+        result = archive_engine.archive_events(cutoff=date(2021, 1, 1), batch_size=1)
+        log = CronLog.query.one()
+    assert result["status"] == "partial"
+    assert (result["candidates"], result["batches"], result["remaining"]) == (1, 1, True)
+    assert log.status == "partial"
+    assert "archived candidates=1 " in log.message
+
+
+def test_archive_skips_when_locked_before_any_batch(app, seed, monkeypatch):
+    seed(1, date(2020, 1, 1))
+    monkeypatch.setattr(archive_engine, "try_lock", lambda key: False)
+    with app.app_context():
+        result = archive_engine.archive_events(cutoff=date(2021, 1, 1))
+    assert (result["status"], result["candidates"]) == ("skipped", 0)
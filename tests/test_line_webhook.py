@@ -0,0 +1,71 @@
+# LINE の返信から出欠を登録する（line_webhook.py）
+import base64
+import json
+import hashlib
+import hmac
+from datetime import date
+
+import pytest
+
+import line_webhook
+import metrics
+
+
+def test_resolve_date_skips_to_next_leap_day():
+    assert line_webhook.resolve_date(2, 29, date(2027, 1, 10)) == date(2028, 2, 29)
+    assert line_webhook.resolve_date(12, 5, date(2027, 12, 6)) == date(2028, 12, 5)
+    assert line_webhook.resolve_date(2, 30, date(2027, 1, 10)) is None
+
+
+def test_webhook_counter_is_exported(app, monkeypatch):
+    monkeypatch.setattr(metrics, "_counters", {})
+    monkeypatch.setattr(metrics, "_histograms", {})
+    metrics.inc("line_webhook_events_total", {"result": "done"}, 3)
+    text = metrics.render_prometheus()
+    assert "# TYPE line_webhook_events_total counter" in text
+    assert 'line_webhook_events_total{result="done"} 3' in text
+
+
+@pytest.mark.parametrize("body", [b"[1]", b'"x"', b'{"events": {}}', b'{"events": [1]}', b"not json"])
+def test_malformed_body_is_400(client, monkeypatch, body):
+    monkeypatch.setenv("LINE_CHANNEL_SECRET", "secret")
+    signature = base64.b64encode(hmac.new(b"secret", body, hashlib.sha256).digest()).decode()
+    r = client.post("/line_webhook", data=body, headers={"X-Line-Signature": signature})
+    assert r.status_code == 400
+
+
+def store(app, texts, user="U1"):
+    from models import db, LineWebhookEvent
+    with app.app_context():
+        for i, text in enumerate(texts):
+            db.session.add(LineWebhookEvent(webhook_event_id=f"{user}-{i}", event_type="message", payload=json.dumps({
+                "type": "message", "source": {"userId": user}, "message": {"type": "text", "text": text},
+            })))
+        db.session.commit()
+
+
+def test_failing_event_is_dead_lettered_without_blocking_others(app, seed, monkeypatch):
+    from models import Attendance, LineWebhookEvent
+
+    seed(1, date(2031, 6, 5), members=())
+    monkeypatch.setitem(line_webhook.MEMBER_LINE_IDS, "U1", "川崎")
+    parse_event = line_webhook.parse_event
+
+    def flaky(ev, today):
+        if ev["message"]["text"] == "boom":
+            raise RuntimeError("cannot parse")
+        return parse_event(ev, today)
+
+    monkeypatch.setattr(line_webhook, "parse_event", flaky)
+    store(app, ["参加 6/5", "boom", "hello"])
+
+    with app.app_context():
+        for attempt in range(1, line_webhook.LINE_WEBHOOK_MAX_ATTEMPTS + 1):
+            line_webhook.process_pending(today=date(2031, 6, 1))
+            rows = {r.webhook_event_id: r for r in LineWebhookEvent.query}
+            assert (rows["U1-0"].status, rows["U1-2"].status) == ("done", "ignored")
+            assert rows["U1-1"].attempts == attempt
+        assert rows["U1-1"].status == "failed"
+        assert rows["U1-1"].last_error == "RuntimeError: cannot parse"
+        assert line_webhook.process_pending(today=date(2031, 6, 1)) == 0
+        assert Attendance.query.one().status == "attend"
@@ -0,0 +1,68 @@
+# 出欠の変更に合わせた統計の増減（member_stats.py）
+import json
+from datetime import date
+
+import pytest
+
+import line_webhook
+import migrate_db
+from models import db, Attendance, LineWebhookEvent, MemberStat, MemberStreak
+
+THREADS = 8
+
+
+def totals(app):
+    with app.app_context():
+        return {
+            s.name: (s.attend_count, s.absent_count, s.pending_count)
+            for s in MemberStat.query
+        }
+
+
+def test_parallel_first_registrations_count_once(app, seed, parallel_post):
+    [(cid, _)] = seed(1, date(2031, 6, 1), confirm=False)
+    forms = [{"name": "川崎", "status": "参加" if i % 2 else "不参加"} for i in range(THREADS)]
+    assert parallel_post(f"/register/event/{cid}", forms) == [302] * THREADS
+
+    with app.app_context():
+        status = Attendance.query.filter_by(name="川崎").one().status
+    attend, absent, pending = totals(app)["川崎"]
+    assert (attend, absent, pending) == ((1, 0, 0) if status == "attend" else (0, 1, 0))
+
+
+def test_line_webhook_reports_previous_status(app, seed, monkeypatch):
+    [(_, event_id)] = seed(1, date(2031, 6, 5), members=("川崎",))  # 川崎 = attend
+    with app.app_context():
+        migrate_db.backfill_member_stats()  # デプロイ時と同じく既存の出欠から統計を作っておく
+    assert totals(app) == {"川崎": (1, 0, 0)}
+    monkeypatch.setitem(line_webhook.MEMBER_LINE_IDS, "U1", "川崎")
+    monkeypatch.setitem(line_webhook.MEMBER_LINE_IDS, "U2", "奥迫")
+    with app.app_context():
+        for i, (user, text) in enumerate([("U1", "不参加 6/5"), ("U2", "参加 6/5")]):
+            db.session.add(LineWebhookEvent(webhook_event_id=str(i), event_type="message", payload=json.dumps({
+                "type": "message", "source": {"userId": user}, "message": {"type": "text", "text": text},
+            })))
+        db.session.commit()
+        assert line_webhook.process_pending(today=date(2031, 6, 1)) == 2
+        statuses = {a.name: a.status for a in Attendance.query.filter_by(event_id=event_id)}
+    assert statuses == {"川崎": "absent", "奥迫": "attend"}
+    assert totals(app) == {"川崎": (0, 1, 0), "奥迫": (1, 0, 0)}
+
+
+def test_backfill_only_when_empty(app, seed, monkeypatch):
+    seed(2, date(2031, 6, 1), members=("川崎",))
+    with app.app_context():
+        migrate_db.backfill_member_stats()
+        monkeypatch.setattr(migrate_db.member_stats, "rebuild", lambda: pytest.fail("rebuilt twice"))
+        migrate_db.backfill_member_stats()
+    assert totals(app) == {"川崎": (2, 0, 0)}
+
+
+def test_parallel_answers_by_one_member_keep_the_streak(app, seed, parallel_post):
+    events = seed(THREADS, date(2031, 7, 1), members=())
+    paths = [f"/register/event/{cid}" for cid, _ in events]
+    # まだ member_streaks に行のないメンバーが、別々のイベントに同時に回答する
+    assert parallel_post(paths, [{"name": "川崎", "status": "参加"}] * THREADS) == [302] * THREADS
+    with app.app_context():
+        streak = MemberStreak.query.one()
+    assert (streak.name, streak.current_streak, streak.longest_streak) == ("川崎", THREADS, THREADS)
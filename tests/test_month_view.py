@@ -0,0 +1,23 @@
+# /confirm, /register の月別表示と描画キャッシュ
+import pytest
+
+import render_cache
+
+
+@pytest.mark.parametrize("path", [
+    "/confirm?year=99999&month=1",
+    "/register?year=0&month=3",
+    "/confirm/month/0/1",
+    "/confirm/month/2030/13",
+    "/register/month/10000/3",
+])
+def test_out_of_range_month_is_404(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_render_cache_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(render_cache, "RENDER_CACHE_MAX_ENTRIES", 5)
+    for year in range(2030, 2050):
+        assert client.get(f"/confirm/month/{year}/1").status_code == 200
+    assert len(render_cache._cache) == 5
+    assert ("confirm_month", 2049, 1) in render_cache._cache
@@ -0,0 +1,26 @@
+# 体育館 × 日付ごとの時間帯インデックス（overlap_index.py）
+from datetime import date, datetime
+
+import overlap_index
+
+FORM = {"year": "2031", "month": "5", "day": "1", "gym": "平井", "start": "18:30", "end": "19:30"}
+
+
+def test_index_survives_attendance_writes(app, client, seed):
+    [(cid, _)] = seed(1, date(2031, 5, 1))
+    with app.app_context():
+        overlap_index.find_conflicts("平井", datetime(2031, 5, 1, 18), datetime(2031, 5, 1, 19))
+    days = overlap_index._state["days"]
+
+    assert client.post(f"/register/event/{cid}", data={"name": "川崎", "status": "参加"}).status_code == 302
+    with app.app_context():
+        hits = overlap_index.find_conflicts("平井", datetime(2031, 5, 1, 18), datetime(2031, 5, 1, 19))
+    assert overlap_index._state["days"] is days
+    assert [h.id for h in hits] == [cid]
+
+
+def test_candidate_writes_refresh_index(app, client, seed):
+    seed(1, date(2031, 5, 1))  # 18:00〜18:30
+    assert client.post("/candidate", data=FORM).status_code == 200
+    r = client.post("/candidate", data={**FORM, "start": "19:00", "end": "20:00"})
+    assert r.status_code == 409
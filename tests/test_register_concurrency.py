@@ -0,0 +1,50 @@
+# 確定・出欠の登録は INSERT ... ON CONFLICT（同時に送信されても重複しない）
+from collections import Counter
+from datetime import date
+
+from benchmark import QUERY_BUDGETS
+from attendance_service import upsert_attendance
+from models import db, Attendance, Confirmed, NotificationOutbox
+
+THREADS = 8
+
+
+def test_parallel_registrations_do_not_duplicate(app, seed, statements, parallel_post):
+    [(cid, _)] = seed(1, date(2031, 4, 1), confirm=False)
+    names = ["松村", "山火"]
+    forms = [{"name": names[i % 2], "status": "参加" if i < THREADS // 2 else "不参加"} for i in range(THREADS)]
+
+    statements["n"] = 0
+    assert parallel_post(f"/register/event/{cid}", forms) == [302] * THREADS
+    assert statements["n"] <= QUERY_BUDGETS["POST /register/event/<id>"] * THREADS
+
+    with app.app_context():
+        assert Confirmed.query.filter_by(candidate_id=cid).count() == 1
+        rows = Attendance.query.all()
+    assert Counter(a.name for a in rows) == Counter(names)
+
+
+def test_parallel_confirm_creates_one_event_and_one_notification(app, seed, parallel_post):
+    [(cid, _)] = seed(1, date(2031, 4, 1), confirm=False)
+    assert parallel_post("/confirm", [{"candidate_id": str(cid)}] * THREADS) == [302] * THREADS
+    with app.app_context():
+        assert Confirmed.query.filter_by(candidate_id=cid).count() == 1
+        assert db.session.query(NotificationOutbox).count() == 1
+
+
+def test_double_submit_confirm_is_not_an_error(app, client, seed):
+    [(cid, event_id)] = seed(1, date(2031, 4, 1))
+    assert client.post("/confirm", data={"candidate_id": str(cid)}).status_code == 302
+    with app.app_context():
+        assert [c.id for c in Confirmed.query] == [event_id]
+
+
+def test_upsert_attendance_statements(app, seed, statements):
+    [(_, event_id)] = seed(1, date(2031, 4, 1), members=())
+    counts = []
+    with app.app_context():
+        for status in ("attend", "attend", "absent"):  # 新規・同じ値・変更
+            statements["n"] = 0
+            counts.append((upsert_attendance(event_id, "川崎", status), statements["n"]))
+        db.session.commit()
+    assert counts == [(None, 1), ("attend", 2), ("attend", 3)]